@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+
+class ActivityTracker:
+    """Thread-safe record of recent conversation traffic (web chat + Telegram).
+
+    Background jobs use it to decide whether the app is idle enough to do
+    maintenance work without competing with a live reply for the DB pool.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._last_activity = 0.0
+        self._last_by_source: dict[str, float] = {}
+
+    def touch(self, source: str) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._last_activity = now
+            self._last_by_source[source] = now
+
+    @contextmanager
+    def track(self, source: str) -> Iterator[None]:
+        """Mark a request as in flight for the duration of the block."""
+        self.touch(source)
+        with self._lock:
+            self._in_flight += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+            self.touch(source)
+
+    def idle_seconds(self) -> float:
+        with self._lock:
+            if self._in_flight:
+                return 0.0
+            if not self._last_activity:
+                return float("inf")
+            return time.monotonic() - self._last_activity
+
+    def is_idle(self, min_idle_seconds: float) -> bool:
+        return self.idle_seconds() >= min_idle_seconds
+
+    def snapshot(self) -> dict[str, float | int | None]:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "in_flight": self._in_flight,
+                "idle_seconds": None if not self._last_activity else round(now - self._last_activity, 1),
+                **{
+                    f"{source}_idle_seconds": round(now - ts, 1)
+                    for source, ts in self._last_by_source.items()
+                },
+            }
+
+
+activity_tracker = ActivityTracker()
@@ -5,6 +5,7 @@ load_dotenv(Path(__file__).resolve().parent.parent / ".env")
 import asyncio
 import logging
 import os
+from contextlib import contextmanager
 
 logging.basicConfig(level=logging.INFO)
 
@@ -37,6 +38,7 @@ from app.telegram.router import router as telegram_router
 from app.telegram.bot_instance import bots
 from app.telegram.config import BOTS_CONFIG, WEBHOOK_BASE_URL
 from app.cot_broadcaster import cot_broadcaster
+from app.static_files import ContentAddressedStaticFiles
 from app.database import engine
 from app.models.models import Base
 
@@ -45,10 +47,66 @@ logger = logging.getLogger(__name__)
 app = FastAPI(title="Chuli Home Backend")
 
 
+@contextmanager
+def _migration_step(name: str):
+    """Run one migration step; a failure is logged and does not skip the later steps."""
+    try:
+        yield
+    except Exception as exc:
+        logger.error("Migration step %s failed: %s", name, exc)
+
+
+def _backfill_image_blobs(eng) -> None:
+    """Move inline data URLs into the blob store, a batch per transaction.
+
+    Rows whose blob cannot be written (disk full, permissions) keep their
+    image_data and are retried on the next start.
+    """
+    from sqlalchemy import text
+    from app.services.blob_store import blob_store, parse_data_url
+    moved = failed = 0
+    after = 0
+    while True:
+        with eng.begin() as conn:
+            rows = conn.execute(text(
+                "SELECT id, image_data FROM messages WHERE image_data IS NOT NULL AND id > :after "
+                "ORDER BY id LIMIT 50"
+            ), {"after": after}).all()
+            for row in rows:
+                after = row.id
+                try:
+                    media_type, data = parse_data_url(row.image_data)
+                    digest = blob_store.put(data)
+                except ValueError:
+                    logger.warning("Dropping unparseable image_data of message %d", row.id)
+                    media_type = digest = None
+                except OSError as exc:
+                    logger.warning("Keeping image_data of message %d, blob write failed: %s", row.id, exc)
+                    failed += 1
+                    continue
+                conn.execute(text(
+                    "UPDATE messages SET image_hash = :digest, image_media_type = :media_type, "
+                    "image_data = NULL WHERE id = :id"
+                ), {"digest": digest, "media_type": media_type, "id": row.id})
+                moved += 1
+        if len(rows) < 50:
+            break
+    if moved:
+        logger.info("Moved %d inline images to the blob store", moved)
+    if failed:
+        logger.warning("%d inline images left in messages.image_data, retried on next start", failed)
+
+
 def _run_migrations(eng) -> None:
     """Add columns that create_all won't add to existing tables."""
     from sqlalchemy import text, inspect
     insp = inspect(eng)
+    # memory_decayed_score() SQL function: fast_recall and /memories depend on it,
+    # so it is created first and on its own, whatever happens to the steps below
+    from app.services.memory_scoring import DECAYED_SCORE_FUNCTION_SQL
+    with _migration_step("memory_decayed_score()"):
+        with eng.begin() as conn:
+            conn.execute(text(DECAYED_SCORE_FUNCTION_SQL))
     # session_summaries.deleted_at
     if "session_summaries" in insp.get_table_names():
         cols = [c["name"] for c in insp.get_columns("session_summaries")]
@@ -103,6 +161,17 @@ def _run_migrations(eng) -> None:
             with eng.begin() as conn:
                 conn.execute(text("ALTER TABLE messages ADD COLUMN image_data TEXT"))
             logger.info("Added image_data column to messages")
+        if "image_hash" not in cols:
+            with _migration_step("messages.image_hash"):
+                with eng.begin() as conn:
+                    conn.execute(text("ALTER TABLE messages ADD COLUMN image_hash VARCHAR(64)"))
+                    conn.execute(text("ALTER TABLE messages ADD COLUMN image_media_type VARCHAR(32)"))
+                    conn.execute(text(
+                        "CREATE INDEX IF NOT EXISTS ix_messages_image_hash ON messages (image_hash)"
+                    ))
+                logger.info("Added image_hash/image_media_type columns to messages")
+        with _migration_step("image_data -> blob store backfill"):
+            _backfill_image_blobs(eng)
     # diary new columns
     if "diary" in insp.get_table_names():
         cols = [c["name"] for c in insp.get_columns("diary")]
@@ -125,6 +194,15 @@ def _run_migrations(eng) -> None:
                 conn.execute(text("ALTER TABLE world_books ADD COLUMN message_mode VARCHAR(16)"))
             logger.info("Added message_mode column to world_books")
 
+    # proactive_states: seed once from message history, kept current afterwards
+    if "proactive_states" in insp.get_table_names():
+        from app.services.proactive_state import SEED_STATES_SQL
+        with _migration_step("proactive_states seed"), eng.begin() as conn:
+            empty = conn.execute(text("SELECT NOT EXISTS (SELECT 1 FROM proactive_states)")).scalar()
+            if empty:
+                result = conn.execute(text(SEED_STATES_SQL))
+                logger.info("Seeded %d proactive_states rows", result.rowcount)
+
     # model_presets.thinking_budget
     if "model_presets" in insp.get_table_names():
         cols = [c["name"] for c in insp.get_columns("model_presets")]
@@ -167,6 +245,37 @@ def _run_migrations(eng) -> None:
                 conn.execute(text("ALTER TABLE memories ADD COLUMN is_pending BOOLEAN NOT NULL DEFAULT FALSE"))
             logger.info("Added is_pending column to memories")
 
+    # memories.embedding ANN index (KNN probes for incremental dedup).
+    # HNSW needs pgvector >= 0.5; without it queries still work, just unindexed.
+    if "memories" in insp.get_table_names():
+        indexed = any(
+            "embedding" in (idx.get("column_names") or [])
+            for idx in insp.get_indexes("memories")
+        )
+        if not indexed:
+            with _migration_step("ix_memories_embedding_hnsw"):
+                with eng.begin() as conn:
+                    conn.execute(text(
+                        "CREATE INDEX IF NOT EXISTS ix_memories_embedding_hnsw "
+                        "ON memories USING hnsw (embedding vector_cosine_ops)"
+                    ))
+                logger.info("Created HNSW index on memories.embedding")
+
+    # session_summaries.embedding ANN index (hybrid summary search)
+    if "session_summaries" in insp.get_table_names():
+        indexed = any(
+            "embedding" in (idx.get("column_names") or [])
+            for idx in insp.get_indexes("session_summaries")
+        )
+        if not indexed:
+            with _migration_step("ix_session_summaries_embedding_hnsw"):
+                with eng.begin() as conn:
+                    conn.execute(text(
+                        "CREATE INDEX IF NOT EXISTS ix_session_summaries_embedding_hnsw "
+                        "ON session_summaries USING hnsw (embedding vector_cosine_ops)"
+                    ))
+                logger.info("Created HNSW index on session_summaries.embedding")
+
     # pending_memories.memory_id
     if "pending_memories" in insp.get_table_names():
         cols = [c["name"] for c in insp.get_columns("pending_memories")]
@@ -187,6 +296,9 @@ async def on_startup() -> None:
     except Exception as exc:
         logger.warning("migration failed: %s", exc)
     cot_broadcaster.set_loop(asyncio.get_running_loop())
+    # Start the webhook intake workers before Telegram can deliver updates
+    from app.telegram.intake import intake
+    intake.start()
     print(f"[startup] bots to register: {list(bots.keys())}")
     from aiogram.types import MenuButtonWebApp, WebAppInfo
     from app.telegram.config import MINI_APP_URL
@@ -220,15 +332,32 @@ async def on_startup() -> None:
     from app.services.summary_service import daily_merge_cron
     asyncio.create_task(daily_merge_cron())
     logger.info("Daily summary merge cron started")
+    # Start idle-time memory maintenance
+    from app.services.maintenance_service import maintenance_loop
+    asyncio.create_task(maintenance_loop())
+    logger.info("Maintenance loop started")
+    # Rebuild the pending image/file queue (also registers its persist hooks)
+    from app.services.pending_media import pending_media
+    try:
+        await asyncio.to_thread(pending_media.seed)
+    except Exception as exc:
+        logger.warning("pending media seed failed: %s", exc)
+    # Start idle-time pre-summarization
+    from app.services.presummary_service import presummary_loop
+    asyncio.create_task(presummary_loop())
+    logger.info("Pre-summary loop started")
 
 
 @app.on_event("shutdown")
 async def on_shutdown() -> None:
+    from app.telegram.intake import intake
     for key, bot in bots.items():
         try:
             await bot.delete_webhook()
         except Exception:
             pass
+    await intake.stop()
+    for key, bot in bots.items():
         try:
             await bot.session.close()
         except Exception:
@@ -304,7 +433,7 @@ async def ws_cot(ws: WebSocket):
 # Serve uploaded static files
 _static_dir = Path(__file__).parent.parent / "static"
 _static_dir.mkdir(exist_ok=True)
-app.mount("/static", StaticFiles(directory=str(_static_dir)), name="static")
+app.mount("/static", ContentAddressedStaticFiles(directory=str(_static_dir)), name="static")
 
 # Serve miniapp frontend
 _miniapp_dir = Path(__file__).parent.parent / "miniapp" / "dist"
@@ -3,7 +3,7 @@ from __future__ import annotations
 from datetime import datetime
 from typing import Any
 
-from sqlalchemy import Boolean, DateTime, Float, ForeignKey, Integer, String, Text, UniqueConstraint
+from sqlalchemy import BigInteger, Boolean, DateTime, Float, ForeignKey, Integer, String, Text, UniqueConstraint
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import Mapped, declarative_base, mapped_column
 from pgvector.sqlalchemy import Vector
@@ -22,7 +22,11 @@ class Message(Base):
     summary_group_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
     request_id: Mapped[str | None] = mapped_column(String(36), nullable=True, index=True)
     telegram_message_id: Mapped[list[int] | None] = mapped_column(JSONB, nullable=True)
-    image_data: Mapped[str | None] = mapped_column(Text, nullable=True)
+    # Legacy inline data URL; moved to the blob store on startup. Deferred so
+    # message reads never pull it, until the column is dropped
+    image_data: Mapped[str | None] = mapped_column(Text, nullable=True, deferred=True)
+    image_hash: Mapped[str | None] = mapped_column(String(64), nullable=True, index=True)
+    image_media_type: Mapped[str | None] = mapped_column(String(32), nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow)
 
 
@@ -294,3 +298,41 @@ class CotRecord(Base):
     content: Mapped[str] = mapped_column(Text, nullable=False)
     tool_name: Mapped[str | None] = mapped_column(String(255), nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow)
+
+
+class TelegramProcessedUpdate(Base):
+    __tablename__ = "telegram_processed_updates"
+    __table_args__ = (
+        UniqueConstraint("bot_key", "update_id", name="uq_telegram_processed_updates_bot_update"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    bot_key: Mapped[str] = mapped_column(String(32), nullable=False)
+    update_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), default=datetime.utcnow, index=True,
+    )
+
+
+class ProactiveState(Base):
+    __tablename__ = "proactive_states"
+    __table_args__ = (
+        UniqueConstraint("assistant_id", "session_id", name="uq_proactive_states_assistant_session"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    assistant_id: Mapped[int] = mapped_column(Integer, ForeignKey("assistants.id"), nullable=False, index=True)
+    session_id: Mapped[int] = mapped_column(
+        Integer, ForeignKey("sessions.id", ondelete="CASCADE"), nullable=False,
+    )
+    last_user_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    last_user_msg_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    last_proactive_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    last_proactive_msg_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    # Proactive messages sent since the user last wrote
+    unreplied_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    last_check_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    # "HH:MM" in UTC+8; NULL falls back to the proactive_quiet_* settings
+    quiet_start: Mapped[str | None] = mapped_column(String(5), nullable=True)
+    quiet_end: Mapped[str | None] = mapped_column(String(5), nullable=True)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow)
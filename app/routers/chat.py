@@ -10,6 +10,7 @@ from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 
+from app.activity_tracker import activity_tracker
 from app.database import get_db
 from app.models.models import Assistant, ChatSession, Message as MessageModel
 from app.services.chat_service import ChatService
@@ -121,6 +122,11 @@ def _compress_tool_result(tool_name: str, content: str) -> str:
         return f"[已搜索小剧场] 关键词={query}, 返回{len(results)}条"
 
     if tool_name == "web_search":
+        if "searches" in data:
+            searches = data["searches"]
+            queries = " / ".join(s.get("query", "") for s in searches)
+            n = sum(len(s.get("results", [])) for s in searches)
+            return f"[已搜索] query={queries}, 返回{n}条结果"
         results = data.get("results", [])
         query = data.get("query", "")
         return f"[已搜索] query={query}, 返回{len(results)}条结果"
@@ -237,8 +243,10 @@ def _load_session_messages(db: Session, session_id: int) -> list[dict[str, Any]]
                 "id": m.id,
                 "created_at": m.created_at,
             }
-            if m.image_data:
-                msg_dict["image_data"] = m.image_data
+            if m.image_hash:
+                # Bytes are loaded from the blob store only when the request is built
+                msg_dict["image_hash"] = m.image_hash
+                msg_dict["image_media_type"] = m.image_media_type
             messages.append(msg_dict)
 
     # Validate: every tool_calls message must have complete tool_results after it.
@@ -287,6 +295,7 @@ async def chat_completions(
     background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
 ):
+    activity_tracker.touch("chat")
     # Resolve assistant
     session = db.get(ChatSession, payload.session_id)
     if session and session.assistant_id:
@@ -317,11 +326,12 @@ async def chat_completions(
 
     if payload.stream:
         def generate():
-            yield from chat_service.stream_chat_completion(
-                payload.session_id, messages, background_tasks=background_tasks,
-                short_mode=payload.short_mode, source=payload.source,
-                tool_results=tool_results_dicts,
-            )
+            with activity_tracker.track("chat"):
+                yield from chat_service.stream_chat_completion(
+                    payload.session_id, messages, background_tasks=background_tasks,
+                    short_mode=payload.short_mode, source=payload.source,
+                    tool_results=tool_results_dicts,
+                )
         return StreamingResponse(generate(), media_type="text/event-stream")
 
     # Non-streaming path — run in threadpool so event loop stays free for
@@ -335,13 +345,14 @@ async def chat_completions(
     max_id_before = max_msg[0] if max_msg else 0
 
     def _consume():
-        for _ in chat_service.stream_chat_completion(
-            payload.session_id, messages,
-            background_tasks=background_tasks,
-            short_mode=payload.short_mode, source=payload.source,
-            tool_results=tool_results_dicts,
-        ):
-            pass
+        with activity_tracker.track("chat"):
+            for _ in chat_service.iter_chat_events(
+                payload.session_id, messages,
+                background_tasks=background_tasks,
+                short_mode=payload.short_mode, source=payload.source,
+                tool_results=tool_results_dicts,
+            ):
+                pass
 
     await asyncio.to_thread(_consume)
 
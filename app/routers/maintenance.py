@@ -1,13 +1,16 @@
 from __future__ import annotations
 
 import logging
+from typing import Any
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Query
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 
+from app.activity_tracker import activity_tracker
 from app.database import get_db
-from app.services.maintenance_service import MaintenanceService
+from app.services.maintenance_service import PURGE_TARGETS, MaintenanceService
+from app.services.recall_cache import recall_cache
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -23,3 +26,35 @@ class MaintenanceRunResponse(BaseModel):
 def run_maintenance(db: Session = Depends(get_db)) -> MaintenanceRunResponse:
     payload = MaintenanceService(db).run_all()
     return MaintenanceRunResponse(**payload)
+
+
+class PurgeTrashResponse(BaseModel):
+    target: str
+    purged: int
+
+
+@router.post("/maintenance/purge/{target}", response_model=PurgeTrashResponse)
+def purge_trash(
+    target: str,
+    retention_days: int = Query(30, ge=0),
+    db: Session = Depends(get_db),
+) -> PurgeTrashResponse:
+    if target not in PURGE_TARGETS:
+        raise HTTPException(status_code=404, detail="Unknown purge target")
+    purged = MaintenanceService(db).purge_trash(target, retention_days=retention_days)
+    return PurgeTrashResponse(target=target, purged=purged)
+
+
+class MaintenanceStatusResponse(BaseModel):
+    activity: dict[str, Any]
+    stages: dict[str, dict[str, Any]]
+    recall_cache: dict[str, Any]
+
+
+@router.get("/maintenance/status", response_model=MaintenanceStatusResponse)
+def maintenance_status(db: Session = Depends(get_db)) -> MaintenanceStatusResponse:
+    return MaintenanceStatusResponse(
+        activity=activity_tracker.snapshot(),
+        stages=MaintenanceService(db).get_stage_states(),
+        recall_cache=recall_cache.snapshot(),
+    )
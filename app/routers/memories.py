@@ -1,7 +1,6 @@
 from __future__ import annotations
 
 import logging
-import math
 from datetime import datetime, timezone
 from typing import Any
 
@@ -11,6 +10,7 @@ from sqlalchemy.orm import Session
 
 from app.database import get_db
 from app.models.models import Memory
+from app.services.memory_scoring import decayed_score_column, memory_decayed_score
 from app.utils import format_datetime
 
 logger = logging.getLogger(__name__)
@@ -63,53 +63,38 @@ class TrashMemoriesResponse(BaseModel):
     total: int
 
 
-def _to_utc(value: datetime | None) -> datetime | None:
-    if value is None:
-        return None
-    if value.tzinfo is None:
-        return value.replace(tzinfo=timezone.utc)
-    return value.astimezone(timezone.utc)
-
-
-def _compute_decayed_score(memory: Memory) -> float:
-    now_utc = datetime.now(timezone.utc)
-    created_at = _to_utc(memory.created_at)
-    last_access_ts = _to_utc(memory.last_access_ts)
-    if created_at is None:
-        age_days = 0.0
-    else:
-        age_base = last_access_ts or created_at
-        age_days = max(0.0, (now_utc - age_base).total_seconds() / 86400.0)
-    base = min(max((memory.importance or 0.5) + (memory.manual_boost or 0.0), 0.0), 1.0)
-    halflife = memory.halflife_days or 60.0
-    boost = 1 + 0.35 * math.log(1 + (memory.hits or 0))
-    return base * math.exp(-math.log(2) / halflife * age_days) * boost
-
-
 @router.get("/memories", response_model=MemoriesResponse)
 def list_memories(
     klass: str | None = Query(None),
     source: str | None = Query(None),
     search: str | None = Query(None, min_length=1),
+    sort: str = Query("created_at"),
+    min_score: float | None = Query(None, ge=0),
     limit: int = Query(20, ge=1, le=100),
     offset: int = Query(0, ge=0),
     db: Session = Depends(get_db),
 ) -> MemoriesResponse:
-    query = db.query(Memory).filter(Memory.deleted_at.is_(None), Memory.is_pending.is_(False))
+    if sort not in ("created_at", "decayed_score"):
+        raise HTTPException(status_code=400, detail="sort must be created_at or decayed_score")
+    score = decayed_score_column()
+    query = db.query(Memory, score.label("decayed_score")).filter(
+        Memory.deleted_at.is_(None), Memory.is_pending.is_(False)
+    )
     if klass:
         query = query.filter(Memory.klass == klass)
     if source:
         query = query.filter(Memory.source == source)
     if search:
         query = query.filter(Memory.content.ilike(f"%{search}%"))
+    if min_score is not None:
+        query = query.filter(score >= min_score)
 
     total = query.count()
-    rows = (
-        query.order_by(Memory.created_at.desc(), Memory.id.desc())
-        .offset(offset)
-        .limit(limit)
-        .all()
-    )
+    if sort == "decayed_score":
+        order_by = (score.desc(), Memory.id.desc())
+    else:
+        order_by = (Memory.created_at.desc(), Memory.id.desc())
+    rows = query.order_by(*order_by).offset(offset).limit(limit).all()
     items = [
         MemoryItem(
             id=row.id,
@@ -123,9 +108,9 @@ def list_memories(
             last_access_ts=format_datetime(row.last_access_ts),
             updated_at=format_datetime(row.updated_at),
             created_at=format_datetime(row.created_at),
-            decayed_score=_compute_decayed_score(row),
+            decayed_score=float(decayed_score or 0.0),
         )
-        for row in rows
+        for row, decayed_score in rows
     ]
     return MemoriesResponse(memories=items, total=total)
 
@@ -171,7 +156,7 @@ def update_memory(
         hits=memory.hits,
         last_access_ts=format_datetime(memory.last_access_ts),
         created_at=format_datetime(memory.created_at),
-        decayed_score=_compute_decayed_score(memory),
+        decayed_score=memory_decayed_score(memory),
     )
 
 
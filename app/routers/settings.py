@@ -5,6 +5,7 @@ from datetime import datetime, timedelta, timezone
 
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel, Field
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 
 from app.database import get_db
@@ -255,6 +256,32 @@ def update_buffer_seconds(
     return BufferSecondsResponse(seconds=seconds)
 
 
+# ── Telegram streaming replies ────────────────────────────────────────────────
+
+class TelegramStreamingResponse(BaseModel):
+    enabled: bool
+
+
+class TelegramStreamingUpdateRequest(BaseModel):
+    enabled: bool
+
+
+@router.get("/settings/telegram-streaming", response_model=TelegramStreamingResponse)
+def get_telegram_streaming(db: Session = Depends(get_db)) -> TelegramStreamingResponse:
+    row = db.query(Settings).filter(Settings.key == "telegram_stream_replies").first()
+    return TelegramStreamingResponse(enabled=not row or row.value != "false")
+
+
+@router.put("/settings/telegram-streaming", response_model=TelegramStreamingResponse)
+def update_telegram_streaming(
+    payload: TelegramStreamingUpdateRequest,
+    db: Session = Depends(get_db),
+) -> TelegramStreamingResponse:
+    _upsert_setting(db, "telegram_stream_replies", "true" if payload.enabled else "false")
+    db.commit()
+    return TelegramStreamingResponse(enabled=payload.enabled)
+
+
 # ── Short message max count ───────────────────────────────────────────────────
 
 class ShortMsgMaxResponse(BaseModel):
@@ -366,8 +393,13 @@ _PROACTIVE_DEFAULTS = {
     "proactive_max_retries": "8",
     "proactive_voice_enabled": "false",
     "proactive_voice_chance": "30",
+    "proactive_quiet_start": "",
+    "proactive_quiet_end": "",
 }
 
+# "HH:MM" (UTC+8); empty disables quiet hours
+_HHMM_PATTERN = r"^(?:(?:[01]\d|2[0-3]):[0-5]\d)?$"
+
 
 class ProactiveSettingsResponse(BaseModel):
     enabled: bool
@@ -379,6 +411,8 @@ class ProactiveSettingsResponse(BaseModel):
     max_retries: int
     voice_enabled: bool
     voice_chance: int
+    quiet_start: str
+    quiet_end: str
 
 
 class ProactiveSettingsUpdateRequest(BaseModel):
@@ -391,6 +425,8 @@ class ProactiveSettingsUpdateRequest(BaseModel):
     max_retries: int | None = Field(None, ge=1, le=15)
     voice_enabled: bool | None = None
     voice_chance: int | None = Field(None, ge=0, le=100)
+    quiet_start: str | None = Field(None, pattern=_HHMM_PATTERN)
+    quiet_end: str | None = Field(None, pattern=_HHMM_PATTERN)
 
 
 def _read_proactive_settings(db: Session) -> dict[str, str]:
@@ -414,6 +450,8 @@ def _proactive_response(raw: dict[str, str]) -> ProactiveSettingsResponse:
         max_retries=_safe_int(raw["proactive_max_retries"], 8),
         voice_enabled=raw["proactive_voice_enabled"] == "true",
         voice_chance=_safe_int(raw["proactive_voice_chance"], 30),
+        quiet_start=raw["proactive_quiet_start"],
+        quiet_end=raw["proactive_quiet_end"],
     )
 
 
@@ -440,12 +478,19 @@ def update_proactive_settings(
         "max_retries": ("proactive_max_retries", lambda v: str(int(v))),
         "voice_enabled": ("proactive_voice_enabled", lambda v: "true" if v else "false"),
         "voice_chance": ("proactive_voice_chance", lambda v: str(int(v))),
+        "quiet_start": ("proactive_quiet_start", str),
+        "quiet_end": ("proactive_quiet_end", str),
     }
     for field_name, (key, converter) in field_map.items():
         value = getattr(payload, field_name)
         if value is not None:
             _upsert_setting(db, key, converter(value))
     db.commit()
+
+    # Due times depend on these settings: recompute them now
+    from app.services.proactive_service import proactive_scheduler
+    proactive_scheduler.request_rebuild()
+
     raw = _read_proactive_settings(db)
     return _proactive_response(raw)
 
@@ -778,15 +823,24 @@ def flush_status(db: Session = Depends(get_db)):
             elif has_content:
                 already_merged.append(lt)
 
-    return {"pending_flush": pending_flush, "pending_merge": pending_merge, "already_merged": already_merged}
+    from app.services.backlog_summarizer import backlog_status
+
+    return {
+        "pending_flush": pending_flush, "pending_merge": pending_merge, "already_merged": already_merged,
+        "backlog": backlog_status(),
+    }
 
 
 @router.post("/settings/summary-layers/flush")
 def flush_summaries_to_layers(force: bool = False, db: Session = Depends(get_db)):
-    """Flush overflow summaries into layers + merge pending. force=true re-merges all."""
-    import threading
+    """Flush overflow summaries into layers + merge pending. force=true re-merges all.
+
+    Sessions with a large unsummarized backlog are queued for map-reduce
+    summarization; follow progress via flush-status.
+    """
     from app.database import SessionLocal
     from app.models.models import Assistant
+    from app.services.backlog_summarizer import BACKLOG_CHUNK_TOKENS, queue_backlog, select_backlog_range
     from app.services.summary_service import SummaryService
 
     assistants = db.query(Assistant).filter(Assistant.deleted_at.is_(None)).all()
@@ -880,11 +934,36 @@ def flush_summaries_to_layers(force: bool = False, db: Session = Depends(get_db)
     if merged_layers:
         merge_types = tuple(merged_layers)
         for aid in merge_assistant_ids:
-            threading.Thread(
-                target=svc.merge_layers_async, args=(aid, merge_types), daemon=True,
-            ).start()
+            svc.merge_layers_async(aid, merge_types)
+
+    # Step 3: queue unsummarized backlogs (beyond the retain budget)
+    retain_row = db.query(Settings).filter(Settings.key == "dialogue_retain_budget").first()
+    retain_budget = _safe_int(retain_row.value if retain_row else None, DEFAULT_DIALOGUE_RETAIN_BUDGET)
+    backlog_queued = 0
+    # One aggregate pass picks the candidate sessions: chars × 1.5 bounds the
+    # token estimate from above (CJK is 1.5 tokens/char), so sessions with a
+    # small backlog never get a per-message range query
+    candidates = (
+        db.query(ChatSession.id, ChatSession.assistant_id)
+        .join(Message, Message.session_id == ChatSession.id)
+        .filter(
+            ChatSession.assistant_id.in_([a.id for a in assistants]),
+            ChatSession.type == "chat",
+            Message.summary_group_id.is_(None),
+            Message.role.in_(("user", "assistant")),
+        )
+        .group_by(ChatSession.id, ChatSession.assistant_id)
+        .having(func.sum(func.char_length(Message.content)) * 1.5 > retain_budget + BACKLOG_CHUNK_TOKENS)
+        .all()
+    )
+    for session_id, assistant_id in candidates:
+        message_ids, total = select_backlog_range(db, session_id, retain_budget)
+        if message_ids and total - retain_budget > BACKLOG_CHUNK_TOKENS:
+            if queue_backlog(session_id, assistant_id, message_ids):
+                backlog_queued += 1
 
     return {
         "flushed": flushed, "to_daily": to_daily, "to_longterm": to_longterm,
         "merge_triggered": merged_layers,
+        "backlog_queued": backlog_queued,
     }
@@ -1,32 +1,89 @@
 from __future__ import annotations
 
+import asyncio
+import hashlib
+import json
 import uuid
 from pathlib import Path
+from typing import BinaryIO
 
 from fastapi import APIRouter, HTTPException, UploadFile
 
+from app.services.blob_store import blob_store
+from app.services.image_pipeline import process_image
+
 router = APIRouter()
 
 UPLOAD_DIR = Path(__file__).parent.parent.parent / "static" / "uploads"
 ALLOWED_CONTENT_TYPES = {"image/jpeg", "image/png", "image/gif", "image/webp"}
 MAX_SIZE = 10 * 1024 * 1024  # 10 MB
+CHUNK_SIZE = 64 * 1024
+_EXTENSIONS = {"image/jpeg": "jpg", "image/png": "png", "image/gif": "gif", "image/webp": "webp"}
+# Derived-data name of an upload's response, keyed by the source digest
+_UPLOAD_RESULT = "upload.json"
 
 
 @router.post("/upload-image")
 async def upload_image(file: UploadFile) -> dict:
     if file.content_type not in ALLOWED_CONTENT_TYPES:
         raise HTTPException(status_code=400, detail="只支持图片格式 (jpeg/png/gif/webp)")
+    if file.size is not None and file.size > MAX_SIZE:
+        raise HTTPException(status_code=400, detail="图片不能超过 10MB")
 
-    data = await file.read()
-    if len(data) > MAX_SIZE:
+    # Hash the spooled upload in chunks, size checked as it goes. Only the
+    # processed image and thumbnail go to the blob store, not the source.
+    digest = await asyncio.to_thread(_hash_upload, file.file)
+    if digest is None:
         raise HTTPException(status_code=400, detail="图片不能超过 10MB")
 
-    ext = (file.filename or "image").rsplit(".", 1)[-1].lower()
-    if ext not in {"jpg", "jpeg", "png", "gif", "webp"}:
-        ext = "jpg"
+    # Same bytes uploaded before: return the published URLs without reprocessing
+    known = blob_store.get_derived(digest, _UPLOAD_RESULT)
+    if known is not None:
+        return json.loads(known)
+
+    # Decoded straight from the spooled file, never read into memory whole
+    image = await process_image(file.file, file.content_type, source_digest=digest)
+    result = {
+        "url": await asyncio.to_thread(_publish, image.digest, image.media_type),
+        "width": image.width,
+        "height": image.height,
+    }
+    if image.thumb_digest:
+        result["thumbnail_url"] = await asyncio.to_thread(
+            _publish, image.thumb_digest, image.thumb_media_type,
+        )
+    blob_store.put_derived(digest, _UPLOAD_RESULT, json.dumps(result).encode())
+    return result
 
-    filename = f"{uuid.uuid4().hex}.{ext}"
-    UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
-    (UPLOAD_DIR / filename).write_bytes(data)
 
-    return {"url": f"/static/uploads/{filename}"}
+def _hash_upload(fileobj: BinaryIO) -> str | None:
+    """SHA-256 of the upload, or None as soon as it exceeds MAX_SIZE."""
+    hasher = hashlib.sha256()
+    size = 0
+    fileobj.seek(0)
+    while chunk := fileobj.read(CHUNK_SIZE):
+        size += len(chunk)
+        if size > MAX_SIZE:
+            return None
+        hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def _publish(digest: str, media_type: str) -> str:
+    """Link or copy a blob into the static uploads dir under its hash; identical images share one file."""
+    filename = f"{digest}.{_EXTENSIONS.get(media_type, 'jpg')}"
+    target = UPLOAD_DIR / filename
+    if target.exists():
+        return f"/static/uploads/{filename}"
+    UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = UPLOAD_DIR / f".{uuid.uuid4().hex}.tmp"
+    source = blob_store.path(digest)
+    try:
+        # Blobs are immutable, so a hard link is safe and costs no extra disk
+        tmp.hardlink_to(source)
+    except OSError:
+        with source.open("rb") as src, tmp.open("wb") as dst:
+            while chunk := src.read(CHUNK_SIZE):
+                dst.write(chunk)
+    tmp.replace(target)
+    return f"/static/uploads/{filename}"
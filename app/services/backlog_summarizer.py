@@ -0,0 +1,293 @@
+"""Map-reduce summarization of large unsummarized backlogs.
+
+A single ``generate_summary`` call formats every pending message into one
+prompt, which times out once a session has hundreds of unsummarized
+messages (after an import, or after the summary model was down). Here the
+range is split into token-bounded chunks that end on an assistant reply;
+chunks are summarized in parallel on a bounded pool (map) and their
+SessionSummary rows are written strictly in message order, each with its
+own ``msg_id_start``/``msg_id_end`` and ``summary_group_id`` marks
+(reduce). If a chunk fails, nothing after it is written, so the covered
+ranges stay contiguous and the rest is picked up by the next run.
+
+Progress per session is kept in memory and exposed through
+``backlog_status()`` (see ``/settings/summary-layers/flush-status``).
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from typing import Any
+
+from sqlalchemy import case, func
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.models.models import Message
+from app.services.image_description_service import _estimate_tokens
+from app.services.summary_service import SummaryService
+
+logger = logging.getLogger(__name__)
+
+# Estimated tokens of formatted dialogue per summary call
+BACKLOG_CHUNK_TOKENS = 6000
+# Parallel summary calls per backlog run
+BACKLOG_CONCURRENCY = 4
+# Finished runs are reported for this long
+BACKLOG_STATUS_TTL_SECONDS = 3600
+
+_map_executor = ThreadPoolExecutor(max_workers=BACKLOG_CONCURRENCY, thread_name_prefix="backlog-map")
+# Whole runs (queued from the flush endpoint) go one at a time
+_run_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="backlog-run")
+
+
+@dataclass
+class BacklogProgress:
+    session_id: int
+    assistant_id: int
+    status: str = "queued"  # queued / running / done / failed
+    messages: int = 0
+    chunks_total: int = 0
+    chunks_summarized: int = 0
+    chunks_written: int = 0
+    chunks_failed: int = 0
+    started_at: str | None = None
+    finished_at: str | None = None
+    _finished_mono: float | None = field(default=None, repr=False)
+
+
+_progress: dict[int, BacklogProgress] = {}
+_progress_lock = threading.Lock()
+
+
+def backlog_status() -> list[dict[str, Any]]:
+    """Progress of queued, running and recently finished backlog runs."""
+    now = time.monotonic()
+    with _progress_lock:
+        for session_id, item in list(_progress.items()):
+            if item._finished_mono is not None and now - item._finished_mono > BACKLOG_STATUS_TTL_SECONDS:
+                del _progress[session_id]
+        return [
+            {k: v for k, v in asdict(item).items() if not k.startswith("_")}
+            for item in _progress.values()
+        ]
+
+
+def _update(session_id: int, **changes: Any) -> None:
+    with _progress_lock:
+        item = _progress.get(session_id)
+        if item is None:
+            return
+        for key, value in changes.items():
+            setattr(item, key, value)
+        if changes.get("status") in ("done", "failed"):
+            item.finished_at = datetime.now(timezone.utc).isoformat()
+            item._finished_mono = time.monotonic()
+
+
+def _bump(session_id: int, counter: str) -> None:
+    with _progress_lock:
+        item = _progress.get(session_id)
+        if item is not None:
+            setattr(item, counter, getattr(item, counter) + 1)
+
+
+# ``_estimate_tokens`` of dialogue messages, computed in Postgres so the
+# range is selected without loading message content:
+# (chars + 5 × CJK chars + 3) // 4, i.e. a CJK char is 1.5 tokens, others 0.25
+_chars = func.char_length(Message.content)
+_cjk_chars = _chars - func.char_length(func.regexp_replace(Message.content, "[\u4e00-\u9fff]", "", "g"))
+_dialogue_tokens = func.coalesce(
+    case((Message.role.in_(("user", "assistant")), (_chars + _cjk_chars * 5 + 3) // 4), else_=0),
+    0,
+)
+
+
+def select_backlog_range(
+    db: Session, session_id: int, retain_budget: int,
+) -> tuple[list[int], int]:
+    """Ids of the oldest unsummarized messages beyond the retain budget, and the dialogue total."""
+    rows = (
+        db.query(Message.id, Message.role, _dialogue_tokens.label("tokens"))
+        .filter(
+            Message.session_id == session_id,
+            Message.summary_group_id.is_(None),
+        )
+        .order_by(Message.id.asc())
+        .all()
+    )
+    tokens = [row.tokens for row in rows]
+    total = sum(tokens)
+    remaining = total
+    cut = 0
+    while cut < len(rows) and remaining > retain_budget:
+        remaining -= tokens[cut]
+        cut += 1
+    # End on an assistant message so no summary splits a user turn from its reply
+    while cut > 0 and rows[cut - 1].role != "assistant":
+        cut -= 1
+    return [row.id for row in rows[:cut]], total
+
+
+def estimate_message_tokens(messages: list[Message]) -> int:
+    return sum(_estimate_tokens(m.content or "") for m in messages)
+
+
+def chunk_messages(messages: list[Message], max_tokens: int = BACKLOG_CHUNK_TOKENS) -> list[list[Message]]:
+    """Split ordered messages into chunks of about ``max_tokens``.
+
+    A chunk is closed at the last assistant message once it is full, so a
+    user turn and its reply land in the same summary; a turn that alone
+    exceeds the budget becomes its own chunk.
+    """
+    chunks: list[list[Message]] = []
+    current: list[Message] = []
+    tokens = 0
+    last_break = 0  # index after the last assistant message in ``current``
+    for message in messages:
+        current.append(message)
+        tokens += _estimate_tokens(message.content or "")
+        if message.role == "assistant":
+            last_break = len(current)
+        if tokens >= max_tokens and last_break:
+            chunks.append(current[:last_break])
+            current = current[last_break:]
+            tokens = estimate_message_tokens(current)
+            last_break = 0
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def summarize_backlog(
+    session_factory: sessionmaker,
+    session_id: int,
+    assistant_id: int,
+    messages: list[Message],
+) -> int:
+    """Summarize ``messages`` chunk by chunk; returns the number of summaries written.
+
+    The caller holds the session's summary lock.
+    """
+    chunks = chunk_messages(messages)
+    with _progress_lock:
+        item = _progress.get(session_id)
+        if item is None or item._finished_mono is not None:
+            item = _progress[session_id] = BacklogProgress(session_id, assistant_id)
+    _update(
+        session_id,
+        status="running",
+        messages=len(messages),
+        chunks_total=len(chunks),
+        started_at=datetime.now(timezone.utc).isoformat(),
+    )
+    logger.info(
+        "[backlog] session=%s: %d messages → %d chunks",
+        session_id, len(messages), len(chunks),
+    )
+
+    service = SummaryService(session_factory)
+    db: Session = session_factory()
+    written = 0
+    try:
+        context = service.build_summary_context(db, session_id, assistant_id)
+        if context is None:
+            _update(session_id, status="failed")
+            return 0
+        # Format in this thread: the Message rows belong to the caller's session
+        texts = [service.format_for_summary(context, chunk) for chunk in chunks]
+
+        def _map(index: int) -> dict[str, Any] | None:
+            if not texts[index].strip():
+                return None
+            worker_db: Session = session_factory()
+            try:
+                payload = service.summarize_text(worker_db, context, session_id, texts[index])
+            finally:
+                worker_db.close()
+            _bump(session_id, "chunks_summarized" if payload else "chunks_failed")
+            return payload
+
+        futures = [_map_executor.submit(_map, i) for i in range(len(chunks))]
+        # Reduce: write in order; stop at the first gap. Chunks with nothing
+        # summarizable (e.g. only tool records) are marked with a neighbouring
+        # summary so they do not stay unsummarized forever.
+        last_summary_id: int | None = None
+        folded: list[int] = []
+        for index, future in enumerate(futures):
+            if not texts[index].strip():
+                folded.extend(m.id for m in chunks[index])
+                if last_summary_id is not None:
+                    _fold_into(db, folded, last_summary_id)
+                    folded = []
+                continue
+            try:
+                payload = future.result()
+            except Exception:
+                logger.exception("[backlog] Chunk %d failed (session=%s)", index, session_id)
+                payload = None
+            if not payload:
+                for rest in futures[index + 1:]:
+                    rest.cancel()
+                logger.warning(
+                    "[backlog] session=%s stopped at chunk %d/%d; later chunks left for the next run",
+                    session_id, index + 1, len(chunks),
+                )
+                break
+            last_summary_id = service.store_summary(db, context, session_id, chunks[index], payload)
+            if last_summary_id is None:
+                break
+            if folded:
+                _fold_into(db, folded, last_summary_id)
+                folded = []
+            written += 1
+            _bump(session_id, "chunks_written")
+        expected = sum(1 for text in texts if text.strip())
+        _update(session_id, status="done" if written == expected else "failed")
+        return written
+    except Exception:
+        logger.exception("[backlog] Failed (session=%s)", session_id)
+        _update(session_id, status="failed")
+        return written
+    finally:
+        db.close()
+
+
+def _fold_into(db: Session, message_ids: list[int], summary_id: int) -> None:
+    """Mark messages that had nothing to summarize as covered by ``summary_id``."""
+    db.query(Message).filter(
+        Message.id.in_(message_ids), Message.summary_group_id.is_(None),
+    ).update({Message.summary_group_id: summary_id}, synchronize_session=False)
+    db.commit()
+    logger.info("[backlog] Folded %d empty messages into summary_id=%s", len(message_ids), summary_id)
+
+
+def queue_backlog(session_id: int, assistant_id: int, message_ids: list[int]) -> bool:
+    """Queue a background backlog run; False if one is already queued or running."""
+    from app.database import SessionLocal
+    from app.services.chat_service import summarize_message_ids
+
+    with _progress_lock:
+        item = _progress.get(session_id)
+        if item is not None and item.status in ("queued", "running"):
+            return False
+        _progress[session_id] = BacklogProgress(session_id, assistant_id, messages=len(message_ids))
+
+    def _run() -> None:
+        try:
+            # Takes the session's summary lock, describes images, then routes
+            # large ranges back into summarize_backlog
+            summarize_message_ids(SessionLocal, session_id, message_ids, assistant_id)
+        finally:
+            with _progress_lock:
+                item = _progress.get(session_id)
+            if item is not None and item.status == "queued":
+                # Nothing left to summarize, or another summary held the lock
+                _update(session_id, status="done")
+
+    _run_executor.submit(_run)
+    return True
@@ -0,0 +1,173 @@
+"""Content-addressed blob storage for message images and uploaded files.
+
+Images used to be stored inline in ``messages.image_data`` as base64 data
+URLs, so every history load pulled megabytes of text through Postgres.
+Now the bytes live in a blob store keyed by their SHA-256 hex digest and a
+message only keeps ``image_hash`` / ``image_media_type``. The bytes are read
+back (and base64-encoded) only when a request to a model actually needs
+them. Identical images are stored once.
+
+The default backend is the local filesystem under ``BLOB_STORE_DIR``
+(``<root>/ab/cd/abcd…``). Writes go to a temp file in the same directory
+and are renamed into place, so a reader never sees a partial blob.
+"""
+
+from __future__ import annotations
+
+import base64
+import hashlib
+import logging
+import os
+import re
+import tempfile
+from collections.abc import Iterable
+from pathlib import Path
+from typing import BinaryIO, Protocol
+
+logger = logging.getLogger(__name__)
+
+BLOB_STORE_DIR = os.getenv(
+    "BLOB_STORE_DIR",
+    str(Path(__file__).parent.parent.parent / "data" / "blobs"),
+)
+
+_DIGEST_RE = re.compile(r"^[0-9a-f]{64}$")
+_DERIVED_NAME_RE = re.compile(r"^[a-z0-9][a-z0-9_.-]{0,63}$")
+
+
+class BlobTooLarge(ValueError):
+    pass
+
+
+class BlobStore(Protocol):
+    def path(self, digest: str) -> Path: ...
+
+    def put(self, data: bytes) -> str: ...
+
+    def put_stream(self, chunks: Iterable[bytes], max_bytes: int | None = None) -> str: ...
+
+    def get(self, digest: str) -> bytes: ...
+
+    def open(self, digest: str) -> BinaryIO: ...
+
+    def exists(self, digest: str) -> bool: ...
+
+    def put_derived(self, digest: str, name: str, data: bytes) -> None: ...
+
+    def get_derived(self, digest: str, name: str) -> bytes | None: ...
+
+
+class LocalBlobStore:
+    """Filesystem blob store; ``get``/``open`` raise FileNotFoundError for unknown digests."""
+
+    def __init__(self, root: str | Path) -> None:
+        self.root = Path(root)
+
+    def path(self, digest: str) -> Path:
+        if not _DIGEST_RE.match(digest):
+            raise ValueError(f"Invalid blob digest: {digest!r}")
+        return self.root / digest[:2] / digest[2:4] / digest
+
+    def put(self, data: bytes) -> str:
+        return self.put_stream((data,))
+
+    def put_stream(self, chunks: Iterable[bytes], max_bytes: int | None = None) -> str:
+        """Write ``chunks`` and return their SHA-256 digest; existing blobs are kept as is.
+
+        Raises BlobTooLarge as soon as more than ``max_bytes`` have been read.
+        """
+        self.root.mkdir(parents=True, exist_ok=True)
+        hasher = hashlib.sha256()
+        size = 0
+        fd, tmp_name = tempfile.mkstemp(dir=self.root, prefix=".incoming-")
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                for chunk in chunks:
+                    size += len(chunk)
+                    if max_bytes is not None and size > max_bytes:
+                        raise BlobTooLarge(f"Blob exceeds {max_bytes} bytes")
+                    hasher.update(chunk)
+                    tmp.write(chunk)
+            digest = hasher.hexdigest()
+            target = self.path(digest)
+            if target.exists():
+                os.unlink(tmp_name)
+                return digest
+            target.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(tmp_name, target)
+            return digest
+        except BaseException:
+            try:
+                os.unlink(tmp_name)
+            except FileNotFoundError:
+                pass
+            raise
+
+    def get(self, digest: str) -> bytes:
+        return self.path(digest).read_bytes()
+
+    def open(self, digest: str) -> BinaryIO:
+        return self.path(digest).open("rb")
+
+    def exists(self, digest: str) -> bool:
+        return self.path(digest).exists()
+
+    # Derived data (e.g. extracted text) is keyed by the source blob's digest
+    # plus a name that encodes how it was derived.
+
+    def derived_path(self, digest: str, name: str) -> Path:
+        if not _DIGEST_RE.match(digest) or not _DERIVED_NAME_RE.match(name):
+            raise ValueError(f"Invalid derived key: {digest!r}/{name!r}")
+        return self.root / "derived" / digest[:2] / f"{digest}.{name}"
+
+    def put_derived(self, digest: str, name: str, data: bytes) -> None:
+        target = self.derived_path(digest, name)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=target.parent, prefix=".incoming-")
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                tmp.write(data)
+            os.replace(tmp_name, target)
+        except BaseException:
+            try:
+                os.unlink(tmp_name)
+            except FileNotFoundError:
+                pass
+            raise
+
+    def get_derived(self, digest: str, name: str) -> bytes | None:
+        try:
+            return self.derived_path(digest, name).read_bytes()
+        except FileNotFoundError:
+            return None
+
+
+def is_digest(value: str) -> bool:
+    return bool(_DIGEST_RE.match(value))
+
+
+def parse_data_url(data_url: str) -> tuple[str, bytes]:
+    """``data:<type>;base64,<payload>`` → (media type, raw bytes); ValueError otherwise."""
+    if not data_url.startswith("data:") or "," not in data_url:
+        raise ValueError("Not a data URL")
+    meta, payload = data_url.split(",", 1)
+    media_type = meta[5:].split(";")[0] or "application/octet-stream"
+    if ";base64" not in meta:
+        raise ValueError("Only base64 data URLs are supported")
+    return media_type, base64.b64decode(payload)
+
+
+def load_base64(digest: str) -> str:
+    return base64.b64encode(blob_store.get(digest)).decode("ascii")
+
+
+def load_data_url(digest: str, media_type: str | None) -> str | None:
+    """Data URL for a stored image, or None (logged) if the blob is missing."""
+    try:
+        return f"data:{media_type or 'image/jpeg'};base64,{load_base64(digest)}"
+    except (FileNotFoundError, ValueError):
+        logger.warning("[blob_store] Missing blob %s", digest)
+        return None
+
+
+blob_store: BlobStore = LocalBlobStore(BLOB_STORE_DIR)
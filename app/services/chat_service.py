@@ -3,11 +3,10 @@
 import json
 import re
 import logging
-import math
 import time
 import threading
 import uuid
-from collections.abc import Callable, Iterable
+from collections.abc import Callable, Iterable, Iterator
 from dataclasses import dataclass
 from datetime import datetime, timezone, timedelta
 from fastapi import BackgroundTasks
@@ -19,9 +18,13 @@ import requests
 from sqlalchemy.orm import Session, sessionmaker
 from sqlalchemy import func, text
 
-from app.models.models import ApiProvider, Assistant, ChatSession, CotRecord, Diary, Memory, Message, ModelPreset, SessionSummary, Settings, SummaryLayer, TheaterStory, UserProfile
+from app.models.models import ApiProvider, Assistant, ChatSession, CotRecord, Diary, Memory, Message, ModelPreset, SessionSummary, SummaryLayer, TheaterStory, UserProfile
+from app.services.blob_store import load_data_url
 from app.services.core_blocks_service import CoreBlocksService
 from app.services.embedding_service import EmbeddingService
+from app.services.memory_scoring import DECAYED_SCORE_SQL
+from app.services.recall_cache import memories_version, recall_cache
+from app.services.settings_store import settings_store
 from app.services.summary_service import SummaryService
 from app.services.world_books_service import WorldBooksService
 from app.database import SessionLocal
@@ -55,6 +58,115 @@ DEFAULT_SUMMARY_BUDGET_LONGTERM = 800
 DEFAULT_SUMMARY_BUDGET_DAILY = 800
 DEFAULT_SUMMARY_BUDGET_RECENT = 2000
 
+# Hybrid summary search: candidates taken from each ranking, RRF damping constant
+SUMMARY_SEARCH_POOL = 50
+SUMMARY_SEARCH_RRF_K = 60
+# Vector candidates below this cosine similarity are not matches (as in fast_recall)
+SUMMARY_SEARCH_MIN_SIMILARITY = 0.35
+# fast_recall runs before the reply starts: embedding + rerank must finish within this
+# many seconds, otherwise recall degrades to keyword-only / unreranked candidates
+FAST_RECALL_DEADLINE_SECONDS = 4.0
+
+def summarize_message_ids(
+    session_factory: sessionmaker,
+    session_id: int,
+    message_ids: list[int],
+    assistant_id: int,
+) -> None:
+    """Summarize the not-yet-summarized messages among ``message_ids``.
+
+    Pending images are described first. Skipped if another summary for the
+    session is already running.
+    """
+    if not message_ids:
+        logger.warning(
+            "Summary trigger skipped: no trimmed message ids (session_id=%s).",
+            session_id,
+        )
+        return
+
+    # Prevent concurrent summary generation for the same session
+    lock = _get_summary_lock(session_id)
+    if not lock.acquire(blocking=False):
+        logger.info(
+            "Summary trigger skipped: another summary in progress (session_id=%s).",
+            session_id,
+        )
+        return
+
+    db: Session = session_factory()
+    try:
+        # Find the latest summary's msg_id_end to avoid re-summarizing
+        last_summary = (
+            db.query(SessionSummary)
+            .filter(
+                SessionSummary.session_id == session_id,
+                SessionSummary.assistant_id == assistant_id,
+                SessionSummary.deleted_at.is_(None),
+                SessionSummary.msg_id_end.isnot(None),
+            )
+            .order_by(SessionSummary.msg_id_end.desc())
+            .first()
+        )
+        last_end = last_summary.msg_id_end if last_summary else 0
+
+        trimmed_query = (
+            db.query(Message)
+            .filter(
+                Message.session_id == session_id,
+                Message.id.in_(message_ids),
+                Message.id > last_end,
+                Message.summary_group_id.is_(None),
+            )
+            .order_by(Message.created_at.asc(), Message.id.asc())
+        )
+        trimmed_messages = trimmed_query.all()
+        if not trimmed_messages:
+            logger.info(
+                "Summary trigger skipped: all trimmed messages already summarized "
+                "(session_id=%s, last_end=%s, candidates=%d).",
+                session_id, last_end, len(message_ids),
+            )
+            return
+        logger.info(
+            "Summary trigger: %d new messages (session_id=%s, last_end=%s, range=%s~%s).",
+            len(trimmed_messages), session_id, last_end,
+            trimmed_messages[0].id, trimmed_messages[-1].id,
+        )
+        # Pre-summary: describe pending images in the range first (concurrent batches)
+        image_ids = [m.id for m in trimmed_messages if m.image_hash]
+        if image_ids:
+            try:
+                from app.services.image_description_service import describe_images
+                describe_images(session_factory, session_id, assistant_id, image_ids)
+                # Descriptions were written by other sessions; reload the contents
+                db.expire_all()
+                trimmed_messages = trimmed_query.all()
+            except Exception:
+                logger.warning("Pre-summary image description failed", exc_info=True)
+
+        from app.services.backlog_summarizer import (
+            BACKLOG_CHUNK_TOKENS,
+            estimate_message_tokens,
+            summarize_backlog,
+        )
+        if estimate_message_tokens(trimmed_messages) > BACKLOG_CHUNK_TOKENS:
+            # Large backlog: chunked, parallel map-reduce instead of one mega-prompt
+            summarize_backlog(session_factory, session_id, assistant_id, trimmed_messages)
+            return
+        summary_service = SummaryService(session_factory)
+        summary_service.generate_summary(session_id, trimmed_messages, assistant_id)
+    except Exception:
+        logger.exception(
+            "Summary trigger failed (session_id=%s, assistant_id=%s).",
+            session_id,
+            assistant_id,
+        )
+    finally:
+        lock.release()
+        db.close()
+
+
 @dataclass
 class ToolCall:
     name: str
@@ -453,38 +565,73 @@ class MemoryService:
         if not query:
             return {"query": query, "total": 0, "offset": offset, "limit": limit, "results": []}
 
-        # Pgroonga search on session_summaries
-        pgroonga_where = "WHERE summary_content &@~ :query AND deleted_at IS NULL"
-        pgroonga_params: dict[str, Any] = {"query": query, "limit": limit, "offset": offset}
+        # Hybrid search: vector KNN and pgroonga candidates fused by reciprocal
+        # rank in one query. Both branches only return real matches (similarity
+        # floor / full-text hit), each capped at the pool size, so the window
+        # COUNT is the number of matches among the top candidates.
+        filter_sql = "deleted_at IS NULL"
+        params: dict[str, Any] = {
+            "query": query,
+            "limit": limit,
+            "offset": offset,
+            "pool": max(SUMMARY_SEARCH_POOL, offset + limit),
+            "rrf_k": SUMMARY_SEARCH_RRF_K,
+            "min_similarity": SUMMARY_SEARCH_MIN_SIMILARITY,
+        }
         if assistant_id is not None:
-            pgroonga_where += " AND assistant_id = :assistant_id"
-            pgroonga_params["assistant_id"] = assistant_id
+            filter_sql += " AND assistant_id = :assistant_id"
+            params["assistant_id"] = assistant_id
         if start_time is not None:
-            pgroonga_where += " AND time_end >= :start_time"
-            pgroonga_params["start_time"] = start_time
+            filter_sql += " AND time_end >= :start_time"
+            params["start_time"] = start_time
         if end_time is not None:
-            pgroonga_where += " AND time_start <= :end_time"
-            pgroonga_params["end_time"] = end_time
+            filter_sql += " AND time_start <= :end_time"
+            params["end_time"] = end_time
 
-        # Count total matches
-        count_sql = text(
-            "SELECT COUNT(*) FROM session_summaries {pgroonga_where}".format(
-                pgroonga_where=pgroonga_where
-            )
-        )
-        total = self.db.execute(count_sql, pgroonga_params).scalar() or 0
+        query_vector = self.embedding_service.get_embedding(query)
+        if query_vector is not None:
+            params["query_embedding"] = str(query_vector)
+            vector_cte = """
+    SELECT id, ROW_NUMBER() OVER (ORDER BY distance) AS rnk
+    FROM (
+        SELECT id, embedding <=> :query_embedding AS distance
+        FROM session_summaries
+        WHERE {filter_sql} AND embedding IS NOT NULL
+        ORDER BY embedding <=> :query_embedding
+        LIMIT :pool
+    ) knn
+    WHERE 1 - distance >= :min_similarity
+""".format(filter_sql=filter_sql)
+        else:
+            vector_cte = "    SELECT NULL::integer AS id, NULL::bigint AS rnk WHERE FALSE\n"
 
-        pgroonga_sql = text(
+        hybrid_sql = text(
             """
-    SELECT id, summary_content, session_id, assistant_id, msg_id_start, msg_id_end,
-           time_start, time_end, mood_tag
-    FROM session_summaries
-    {pgroonga_where}
-    ORDER BY pgroonga_score(tableoid, ctid) DESC
-    LIMIT :limit OFFSET :offset
-""".format(pgroonga_where=pgroonga_where)
+WITH vec AS (
+{vector_cte}), txt AS (
+    SELECT id, ROW_NUMBER() OVER (ORDER BY score DESC) AS rnk
+    FROM (
+        SELECT id, pgroonga_score(tableoid, ctid) AS score
+        FROM session_summaries
+        WHERE {filter_sql} AND summary_content &@~ :query
+        ORDER BY score DESC
+        LIMIT :pool
+    ) fts
+), fused AS (
+    SELECT COALESCE(vec.id, txt.id) AS id,
+           COALESCE(1.0 / (:rrf_k + vec.rnk), 0) + COALESCE(1.0 / (:rrf_k + txt.rnk), 0) AS score
+    FROM vec FULL OUTER JOIN txt ON vec.id = txt.id
+)
+SELECT s.id, s.summary_content, s.session_id, s.assistant_id, s.msg_id_start, s.msg_id_end,
+       s.time_start, s.time_end, s.mood_tag, COUNT(*) OVER () AS total
+FROM fused f
+JOIN session_summaries s ON s.id = f.id
+ORDER BY f.score DESC, s.id DESC
+LIMIT :limit OFFSET :offset
+""".format(vector_cte=vector_cte, filter_sql=filter_sql)
         )
-        rows = self.db.execute(pgroonga_sql, pgroonga_params).all()
+        rows = self.db.execute(hybrid_sql, params).all()
+        total = rows[0].total if rows else 0
 
         results = [
             {
@@ -730,21 +877,39 @@ class MemoryService:
         return {"query": query, "results": results}
 
     def fast_recall(
-        self, query: str, limit: int = 5, current_mood_tag: str | None = None
+        self, query: str, limit: int = 5, current_mood_tag: str | None = None,
+        session_id: int | None = None,
     ) -> list[dict[str, Any]]:
-        """Dual-path recall: vector top 20 + pgroonga top 20, then rerank and decay-score."""
+        """Dual-path recall: vector top 20 + pgroonga top 20, then rerank and decay-score.
+
+        With ``session_id``, results are cached per session and reused for an
+        identical or near-identical query while memories are unchanged.
+        """
         CANDIDATE_POOL_SIZE = 20
         TAG_EXPANSION_LIMIT = 3
         rerank_top_n = max(limit, 1)
-        query_vector = self.embedding_service.get_embedding(query)
+        mood_key = (current_mood_tag or "").strip().lower()
+        # Read before querying, so a result is never cached against newer memories
+        version = memories_version()
+        if session_id is not None:
+            cached = recall_cache.lookup_text(session_id, query, mood_key)
+            if cached is not None:
+                return cached
+        deadline = time.monotonic() + FAST_RECALL_DEADLINE_SECONDS
+        query_vector = self.embedding_service.get_embedding(query, deadline=deadline)
+        if session_id is not None:
+            cached = recall_cache.lookup_vector(session_id, query_vector, mood_key)
+            if cached is not None:
+                return cached
         if query_vector is None:
-            return []
+            logger.info("fast_recall: no query embedding, keyword-only recall")
 
         # Vector search top 20
+        vector_rows = []
         vector_sql = text(
             """
-    SELECT id, content, tags, source, klass, importance, manual_boost, hits,
-           halflife_days, last_access_ts, created_at
+    SELECT id, content, tags, source, klass, created_at,
+           {decayed_score_sql} AS decayed_score
     FROM memories
     WHERE embedding IS NOT NULL
       AND deleted_at IS NULL
@@ -752,27 +917,28 @@ class MemoryService:
       AND 1 - (embedding <=> :query_embedding) >= :min_similarity
     ORDER BY embedding <=> :query_embedding
     LIMIT :limit
-"""
+""".format(decayed_score_sql=DECAYED_SCORE_SQL)
         )
-        vector_rows = self.db.execute(
-            vector_sql,
-            {
-                "query_embedding": str(query_vector),
-                "limit": CANDIDATE_POOL_SIZE,
-                "min_similarity": 0.35,
-            },
-        ).all()
+        if query_vector is not None:
+            vector_rows = self.db.execute(
+                vector_sql,
+                {
+                    "query_embedding": str(query_vector),
+                    "limit": CANDIDATE_POOL_SIZE,
+                    "min_similarity": 0.35,
+                },
+            ).all()
 
         # Pgroonga full-text search top 20
         pgroonga_sql = text(
             """
-    SELECT id, content, tags, source, klass, importance, manual_boost, hits,
-           halflife_days, last_access_ts, created_at
+    SELECT id, content, tags, source, klass, created_at,
+           {decayed_score_sql} AS decayed_score
     FROM memories
     WHERE deleted_at IS NULL AND is_pending = FALSE AND search_text &@~ :query
     ORDER BY pgroonga_score(tableoid, ctid) DESC
     LIMIT 20
-"""
+""".format(decayed_score_sql=DECAYED_SCORE_SQL)
         )
         pgroonga_rows = self.db.execute(pgroonga_sql, {"query": query}).all()
 
@@ -793,8 +959,9 @@ class MemoryService:
             primary_rows = list(candidate_rows)
         else:
             documents = [row.content or "" for row in candidate_rows]
+            # Empty on failure, open circuit or missed deadline: keep candidate order
             rerank_results = self.embedding_service.rerank(
-                query, documents, top_n=rerank_top_n
+                query, documents, top_n=rerank_top_n, deadline=deadline
             )
             if not rerank_results:
                 primary_rows = list(candidate_rows[:5])
@@ -819,46 +986,14 @@ class MemoryService:
                     primary_rows = primary_rows[:rerank_top_n]
 
         # Always apply decay score weighting after reranking
+        # (decayed_score is computed by memory_decayed_score() in the candidate queries)
         try:
             scored_rows: list[tuple[float, Any]] = []
-            now_utc = datetime.now(timezone.utc)
             mood = (current_mood_tag or "").strip().lower()
             is_negative_mood = mood in NEGATIVE_MOOD_TAGS
 
             for row in primary_rows:
-                created_at = row.created_at
-                if created_at is None:
-                    age_days = 0.0
-                else:
-                    if created_at.tzinfo is None:
-                        created_utc = created_at.replace(tzinfo=timezone.utc)
-                    else:
-                        created_utc = created_at.astimezone(timezone.utc)
-                    last_access_ts = row.last_access_ts
-                    if last_access_ts is not None:
-                        if last_access_ts.tzinfo is None:
-                            last_access_utc = last_access_ts.replace(
-                                tzinfo=timezone.utc
-                            )
-                        else:
-                            last_access_utc = last_access_ts.astimezone(
-                                timezone.utc
-                            )
-                        base_time = last_access_utc
-                    else:
-                        base_time = created_utc
-                    age_days = max(
-                        0.0, (now_utc - base_time).total_seconds() / 86400.0
-                    )
-                base = min(
-                    max((row.importance or 0.5) + (row.manual_boost or 0.0), 0.0),
-                    1.0,
-                )
-                halflife = row.halflife_days or 60.0
-                boost = 1 + 0.35 * math.log(1 + (row.hits or 0))
-                decayed_score = (
-                    base * math.exp(-math.log(2) / halflife * age_days) * boost
-                )
+                decayed_score = float(row.decayed_score or 0.0)
                 # Extra boost for conflict/bond in negative mood
                 if is_negative_mood:
                     if row.klass == "conflict":
@@ -939,6 +1074,9 @@ class MemoryService:
                     "created_at": row.created_at.replace(tzinfo=timezone.utc).astimezone(TZ_EAST8).strftime("%Y.%m.%d %H:%M"),
                 }
             )
+        # Degraded (keyword-only) results are not worth reusing
+        if session_id is not None and query_vector is not None:
+            recall_cache.store(session_id, query, query_vector, mood_key, version, results)
         return results
 
 # ── Anthropic format converters ──
@@ -1194,33 +1332,14 @@ class ChatService:
         sb_daily = DEFAULT_SUMMARY_BUDGET_DAILY
         sb_recent = DEFAULT_SUMMARY_BUDGET_RECENT
         try:
-            rows = (
-                self.db.query(Settings)
-                .filter(
-                    Settings.key.in_([
-                        "dialogue_retain_budget", "dialogue_trigger_threshold",
-                        "summary_budget_longterm", "summary_budget_daily", "summary_budget_recent",
-                    ])
-                )
-                .all()
-            )
-            kv = {row.key: row.value for row in rows}
-            retain_budget = self._safe_int(
-                kv.get("dialogue_retain_budget"), DEFAULT_DIALOGUE_RETAIN_BUDGET
-            )
-            trigger_threshold = self._safe_int(
-                kv.get("dialogue_trigger_threshold"),
-                DEFAULT_DIALOGUE_TRIGGER_THRESHOLD,
-            )
-            sb_longterm = self._safe_int(
-                kv.get("summary_budget_longterm"), DEFAULT_SUMMARY_BUDGET_LONGTERM
-            )
-            sb_daily = self._safe_int(
-                kv.get("summary_budget_daily"), DEFAULT_SUMMARY_BUDGET_DAILY
-            )
-            sb_recent = self._safe_int(
-                kv.get("summary_budget_recent"), DEFAULT_SUMMARY_BUDGET_RECENT
+            snap = settings_store.snapshot(self.db)
+            retain_budget = snap.get_int("dialogue_retain_budget", DEFAULT_DIALOGUE_RETAIN_BUDGET)
+            trigger_threshold = snap.get_int(
+                "dialogue_trigger_threshold", DEFAULT_DIALOGUE_TRIGGER_THRESHOLD,
             )
+            sb_longterm = snap.get_int("summary_budget_longterm", DEFAULT_SUMMARY_BUDGET_LONGTERM)
+            sb_daily = snap.get_int("summary_budget_daily", DEFAULT_SUMMARY_BUDGET_DAILY)
+            sb_recent = snap.get_int("summary_budget_recent", DEFAULT_SUMMARY_BUDGET_RECENT)
         except Exception:
             logger.exception("Failed to load context budget settings, using defaults.")
         retain_budget = max(1, retain_budget)
@@ -1230,13 +1349,6 @@ class ChatService:
         sb_recent = max(500, sb_recent)
         return retain_budget, trigger_threshold, sb_longterm, sb_daily, sb_recent
 
-    @staticmethod
-    def _safe_int(raw_value: Any, default: int) -> int:
-        try:
-            return int(str(raw_value).strip())
-        except Exception:
-            return default
-
     @staticmethod
     def _estimate_tokens(text: str) -> int:
         if not text:
@@ -1363,7 +1475,7 @@ class ChatService:
             all_trimmed_messages.extend(self._trimmed_messages)
             all_trimmed_message_ids.extend(self._trimmed_message_ids)
         session = self.db.get(ChatSession, session_id)
-        # Post-reply triggers: image description + file summarization
+        # Post-reply trigger: file summarization
         _ns_assistant_id = session.assistant_id if session and session.assistant_id else None
         if _ns_assistant_id is None:
             _ns_assistant_row = self.db.query(Assistant).first()
@@ -1600,8 +1712,7 @@ class ChatService:
             full_system_prompt += "\n\n" + core_blocks_text
         if not self.proactive_extra_prompt:
             if short_mode:
-                short_max_row = self.db.query(Settings).filter(Settings.key == "short_msg_max").first()
-                short_max = int(short_max_row.value) if short_max_row else 8
+                short_max = settings_store.snapshot(self.db).get_int("short_msg_max", 8)
                 full_system_prompt += (
                     "\n\n[短消息模式]\n"
                     f"像真人发微信一样回复，用[NEXT]拆条，最多{short_max}条。"
@@ -1661,7 +1772,7 @@ class ChatService:
                     if raw_text and len(raw_text.strip()) > 10:
                         recall_query = raw_text.strip()[:200]
             recall_results = self.memory_service.fast_recall(
-                recall_query, limit=5, current_mood_tag=latest_mood_tag
+                recall_query, limit=5, current_mood_tag=latest_mood_tag, session_id=session_id
             )
             if recall_results:
                 self._last_recall_results = recall_results
@@ -1711,12 +1822,12 @@ class ChatService:
             {"type": "function", "function": {"name": "write_diary", "description": "写交换日记。用于表达深层感受、内心想法、或不适合作为直接聊天回复的情感。这是你的私人日记本,也可以写给她看的信。\n支持定时解锁：设置 unlock_at 后，她在解锁前只能看到标题，适合用于早安信、晚安信、生日惊喜、纪念日信件等场景——比如睡前写一封信，设置第二天早上解锁让她醒来就能看到。", "parameters": {"type": "object", "properties": {"title": {"type": "string", "description": "日记标题"}, "content": {"type": "string", "description": "日记正文"}, "unlock_at": {"type": "string", "description": "定时解锁时间，ISO格式如 2025-03-01T09:00:00+08:00，时区用+08:00。不传则立即可见。设置后她只能看到标题，到时间后才能阅读内容。主动使用这个功能给她惊喜。"}}, "required": ["title", "content"]}}},
             {"type": "function", "function": {"name": "list_memories", "description": "按时间范围或分类列出已存的记忆，不做搜索。用于回顾已存记忆、避免重复存储。", "parameters": {"type": "object", "properties": {"start_time": {"type": "string", "description": "起始时间，ISO格式如 2025-02-20 或 2025-02-20T14:00:00+08:00"}, "end_time": {"type": "string", "description": "结束时间，同上格式。不传则不限结束时间"}, "klass": {"type": "string", "description": "分类筛选: identity/relationship/bond/conflict/fact/preference/health/task/ephemeral/other"}, "limit": {"type": "integer", "description": "返回条数，默认10，最大20。一般只在需要回顾已存记忆、避免重复存储时使用，不要一次拉太多，够用就不要加大limit"}}}}},
             {"type": "function", "function": {"name": "search_memory", "description": "搜索记忆卡片。从长期记忆中按关键词或语义查找信息。返回匹配的记忆条目。", "parameters": {"type": "object", "properties": {"query": {"type": "string"}, "source": {"type": "string"}}}}},
-            {"type": "function", "function": {"name": "search_summary", "description": "搜索对话摘要。用于查找过去某段对话的概要、定位时间范围。可用返回的 msg_id_start 和 msg_id_end 配合 search_chat_history 拉取原文。返回 total 表示总匹配数，可通过 offset 翻页。", "parameters": {"type": "object", "properties": {"query": {"type": "string"}, "limit": {"type": "integer", "description": "每页条数，最多10"}, "offset": {"type": "integer", "description": "翻页偏移量，默认0"}, "start_time": {"type": "string", "description": "起始时间，ISO格式如 2025-02-20"}, "end_time": {"type": "string", "description": "结束时间，同上格式"}}, "required": ["query"]}}},
+            {"type": "function", "function": {"name": "search_summary", "description": "搜索对话摘要（关键词与语义混合检索，可用自然语言描述）。用于查找过去某段对话的概要、定位时间范围。可用返回的 msg_id_start 和 msg_id_end 配合 search_chat_history 拉取原文。返回 total 表示匹配条数（只统计最相关的前50条左右），可通过 offset 在其中翻页；没有相关摘要时 results 为空。", "parameters": {"type": "object", "properties": {"query": {"type": "string"}, "limit": {"type": "integer", "description": "每页条数，最多10"}, "offset": {"type": "integer", "description": "翻页偏移量，默认0"}, "start_time": {"type": "string", "description": "起始时间，ISO格式如 2025-02-20"}, "end_time": {"type": "string", "description": "结束时间，同上格式"}}, "required": ["query"]}}},
             {"type": "function", "function": {"name": "get_summary_by_id", "description": "按id查看摘要详情，返回摘要完整内容", "parameters": {"type": "object", "properties": {"id": {"type": "integer"}}, "required": ["id"]}}},
             {"type": "function", "function": {"name": "search_chat_history", "description": "搜索聊天记录原文。三种模式：\n1) 关键词搜索：传 query，返回命中消息（不带上下文），返回 total 表示总匹配数，可通过 offset 翻页\n2) ID 范围：传 msg_id_start + msg_id_end，拉取该范围内的完整对话（最多20条，返回 total 表示范围内总数）\n3) 单条 ID：传 message_id，返回该条及前后各 3 条上下文", "parameters": {"type": "object", "properties": {"query": {"type": "string"}, "msg_id_start": {"type": "integer"}, "msg_id_end": {"type": "integer"}, "message_id": {"type": "integer"}, "offset": {"type": "integer", "description": "关键词搜索翻页偏移量，默认0"}}}}},
             {"type": "function", "function": {"name": "search_theater", "description": "搜索小剧场故事摘要。用于查找过去的 RP / 小剧场剧情记录，返回故事标题、AI伙伴、摘要全文、时间跨度。", "parameters": {"type": "object", "properties": {"query": {"type": "string"}, "limit": {"type": "integer"}}, "required": ["query"]}}},
             {"type": "function", "function": {"name": "read_diary", "description": "读取交换日记。两种模式：\n1) list 模式：不传 diary_id，可选传 author（user/assistant）筛选，返回日记列表（id、title、author、created_at、unlock_at、read_at），不含正文。未解锁的定时日记也会列出但标记 locked=true。\n2) read 模式：传 diary_id，返回该日记完整内容（id、title、content、author、created_at、unlock_at）。用户写给你的日记（author=user）读取时自动记录已读时间。未解锁的定时日记不允许读取。", "parameters": {"type": "object", "properties": {"diary_id": {"type": "integer", "description": "日记ID，传入则为read模式"}, "author": {"type": "string", "enum": ["user", "assistant"], "description": "list模式下按作者筛选"}}}}},
-            {"type": "function", "function": {"name": "web_search", "description": "搜索互联网获取信息。返回搜索结果列表，每条包含标题、链接和摘要。搜索后如需查看某个结果的完整内容，再调用 web_fetch。每次搜索后最多读取2个网页。", "parameters": {"type": "object", "properties": {"query": {"type": "string", "description": "搜索关键词"}}, "required": ["query"]}}},
+            {"type": "function", "function": {"name": "web_search", "description": "搜索互联网获取信息。返回搜索结果列表，每条包含标题、链接和摘要。搜索后如需查看某个结果的完整内容，再调用 web_fetch。每次搜索后最多读取2个网页。", "parameters": {"type": "object", "properties": {"query": {"type": "string", "description": "搜索关键词"}, "queries": {"type": "array", "items": {"type": "string"}, "description": "可选，需要同时搜索的其他相关关键词，会与query一起并行搜索"}}, "required": ["query"]}}},
             {"type": "function", "function": {"name": "web_fetch", "description": "读取指定URL的网页内容，返回markdown格式的正文。内容较长时会截断，可通过offset参数翻页继续阅读。也可以直接用于读取用户发送的链接。", "parameters": {"type": "object", "properties": {"url": {"type": "string", "description": "网页地址"}, "offset": {"type": "integer", "description": "起始偏移量，用于翻页，默认0"}}, "required": ["url"]}}},
         ]
         # Add client-side tools when source is terminal
@@ -1874,8 +1985,9 @@ class ChatService:
                     content = f"[{_get_ts(message)}] {content}"
             elif role == "user" and content is not None:
                 timestamp = _get_ts(message)
-                image_data = message.get("image_data")
-                if image_data and image_data.startswith("data:"):
+                image_hash = message.get("image_hash")
+                image_data = load_data_url(image_hash, message.get("image_media_type")) if image_hash else None
+                if image_data:
                     # Multimodal: image + text
                     text_part = f"[{timestamp}] {content}" if isinstance(content, str) else str(content)
                     content = [
@@ -1913,6 +2025,37 @@ class ChatService:
         tool_results: list[dict[str, Any]] | None = None,
     ) -> Iterable[str]:
         """Streaming chat completion. Yields SSE events."""
+        for event in self.iter_chat_events(
+            session_id, messages, background_tasks=background_tasks,
+            short_mode=short_mode, source=source, tool_results=tool_results,
+        ):
+            kind = event["type"]
+            if kind == "delta":
+                yield f'data: {json.dumps({"content": event["content"]})}\n\n'
+            elif kind == "error":
+                yield f'data: {json.dumps({"error": event["error"]})}\n\n'
+            elif kind == "tool_call":
+                tool_call = {"id": event["id"], "name": event["name"], "arguments": event["arguments"]}
+                yield f'data: {json.dumps({"tool_call": tool_call})}\n\n'
+            elif kind == "done":
+                yield 'data: [DONE]\n\n'
+
+    def iter_chat_events(
+        self,
+        session_id: int,
+        messages: list[dict[str, Any]],
+        background_tasks: BackgroundTasks | None = None,
+        short_mode: bool = False,
+        source: str | None = None,
+        tool_results: list[dict[str, Any]] | None = None,
+    ) -> Iterator[dict[str, Any]]:
+        """Run the chat loop, yielding structured events.
+
+        Event types: ``delta`` (text), ``round_end`` (a tool round closed the
+        current text), ``tool_use`` (server-side tool executed), ``tool_call``
+        (client-side tool for the caller), ``message`` (assistant message
+        persisted, with its DB id), ``error`` and a final ``done``.
+        """
         request_id = str(uuid.uuid4())
         start_time = time.monotonic()
         # If tool_results provided, reconstruct the tool round in messages
@@ -2032,12 +2175,12 @@ class ChatService:
                 params = self._build_api_call_params(messages, session_id, short_mode=short_mode, source=source)
             except Exception as e:
                 logger.error("[stream] Failed to build API call params (session=%s): %s", session_id, e)
-                yield f'data: {json.dumps({"error": str(e)})}\n\n'
-                yield 'data: [DONE]\n\n'
+                yield {"type": "error", "error": str(e)}
+                yield {"type": "done"}
                 return
             if params is None:
                 logger.error("[stream] _build_api_call_params returned None (session=%s)", session_id)
-                yield 'data: [DONE]\n\n'
+                yield {"type": "done"}
                 return
             client, model_name, api_messages, tools, preset_temperature, preset_top_p, use_anthropic, preset_max_tokens, preset_thinking_budget, provider_base_url = params
             all_trimmed_message_ids.extend(self._trimmed_message_ids)
@@ -2101,7 +2244,7 @@ class ChatService:
                                     })
                                 elif hasattr(delta, "text"):
                                     content_chunks.append(delta.text)
-                                    yield f'data: {json.dumps({"content": delta.text})}\n\n'
+                                    yield {"type": "delta", "content": delta.text}
                                     cot_broadcaster.publish({
                                         "type": "text_delta",
                                         "request_id": request_id,
@@ -2139,8 +2282,8 @@ class ChatService:
                         }
                 except Exception as e:
                     logger.error(f"Anthropic streaming error: {e}")
-                    yield f'data: {json.dumps({"error": str(e)})}\n\n'
-                    yield 'data: [DONE]\n\n'
+                    yield {"type": "error", "error": str(e)}
+                    yield {"type": "done"}
                     return
             else:
                 _apply_cache_control_oai(api_messages, use_blocks="openrouter.ai" in (provider_base_url or ""))
@@ -2165,8 +2308,8 @@ class ChatService:
                     stream = client.chat.completions.create(**stream_params)
                 except Exception as e:
                     logger.error(f"Streaming request failed: {e}")
-                    yield f'data: {json.dumps({"error": str(e)})}\n\n'
-                    yield 'data: [DONE]\n\n'
+                    yield {"type": "error", "error": str(e)}
+                    yield {"type": "done"}
                     return
                 oai_finish_reason = None
                 try:
@@ -2207,7 +2350,7 @@ class ChatService:
                             })
                         if getattr(delta, "content", None):
                             content_chunks.append(delta.content)
-                            yield f'data: {json.dumps({"content": delta.content})}\n\n'
+                            yield {"type": "delta", "content": delta.content}
                             cot_broadcaster.publish({
                                 "type": "text_delta",
                                 "request_id": request_id,
@@ -2228,8 +2371,8 @@ class ChatService:
                                         tool_calls_acc[idx]["arguments"] += tc_delta.function.arguments
                 except Exception as e:
                     logger.error(f"Stream iteration error: {e}")
-                    yield f'data: {json.dumps({"error": str(e)})}\n\n'
-                    yield 'data: [DONE]\n\n'
+                    yield {"type": "error", "error": str(e)}
+                    yield {"type": "done"}
                     return
             if tool_calls_acc:
                 tool_calls_payload = []
@@ -2266,13 +2409,15 @@ class ChatService:
                     clean_mid = re.sub(r'\[\[used:\d+\]\]', '', full_content).strip()
                     if clean_mid:
                         try:
-                            self._persist_message(session_id, "assistant", clean_mid, {}, request_id=request_id)
+                            mid_msg = self._persist_message(session_id, "assistant", clean_mid, {}, request_id=request_id)
+                            yield {"type": "message", "id": mid_msg.id, "content": clean_mid}
                         except Exception as e:
                             logger.error("Failed to persist intermediate text message: %s", e)
                             try:
                                 self.db.rollback()
                             except Exception:
                                 pass
+                yield {"type": "round_end"}
                 # Persist tool_calls message (hidden from chat list by API filter)
                 try:
                     self._persist_message(session_id, "assistant", "", {"tool_calls": tool_calls_payload}, request_id=request_id)
@@ -2300,6 +2445,7 @@ class ChatService:
                             self.db.rollback()
                         except Exception:
                             pass
+                    yield {"type": "tool_use", "name": tc.name}
                     try:
                         tool_result = self._execute_tool(tc)
                     except Exception as e:
@@ -2339,7 +2485,7 @@ class ChatService:
                                 self.db.rollback()
                             except Exception:
                                 pass
-                        yield f'data: {json.dumps({"tool_call": {"id": tc.id, "name": tc.name, "arguments": tc.arguments}})}\n\n'
+                        yield {"type": "tool_call", "id": tc.id, "name": tc.name, "arguments": tc.arguments}
                     # End the stream — CLI will execute tools and send results back
                     cot_broadcaster.publish({
                         "type": "done", "request_id": request_id,
@@ -2347,7 +2493,7 @@ class ChatService:
                         "elapsed_ms": int((time.monotonic() - start_time) * 1000),
                         "cache_hit": anth_cache_hit, "total_input": total_input_raw,
                     })
-                    yield 'data: [DONE]\n\n'
+                    yield {"type": "done"}
                     return
                 # Broadcast running token totals so COT page shows tokens during tool rounds
                 cot_broadcaster.publish({
@@ -2359,7 +2505,7 @@ class ChatService:
                 round_index += 1
                 if round_index >= 15:
                     logger.warning("[stream] Max tool rounds reached (session=%s)", session_id)
-                    yield f'data: {json.dumps({"content": "(已达到最大工具调用轮次)"})}\n\n'
+                    yield {"type": "delta", "content": "(已达到最大工具调用轮次)"}
                     break
                 continue
             # If model returned nothing after tool calls, just end
@@ -2387,15 +2533,16 @@ class ChatService:
                 clean_content = "(No relevant memory found.)"
             if short_mode and "[NEXT]" in clean_content:
                 parts = [p.strip() for p in clean_content.split("[NEXT]") if p.strip()]
-                for part in parts:
-                    self._persist_message(session_id, "assistant", part, {}, request_id=request_id)
             else:
-                self._persist_message(session_id, "assistant", clean_content, {}, request_id=request_id)
+                parts = [clean_content]
+            for part in parts:
+                final_msg_row = self._persist_message(session_id, "assistant", part, {}, request_id=request_id)
+                yield {"type": "message", "id": final_msg_row.id, "content": part}
             session = self.db.get(ChatSession, session_id)
             if session:
                 session.updated_at = datetime.now(timezone.utc)
                 self.db.commit()
-            # Post-reply triggers: image description + file summarization
+            # Post-reply trigger: file summarization
             _stream_assistant_id = session.assistant_id if session else None
             self._maybe_trigger_post_reply(session_id, _stream_assistant_id, background_tasks)
             _stream_all_ids = list(all_trimmed_message_ids)
@@ -2429,7 +2576,7 @@ class ChatService:
                 "prompt_tokens": total_prompt_tokens, "completion_tokens": total_completion_tokens,
                 "elapsed_ms": elapsed_ms, "cache_hit": anth_cache_hit, "total_input": total_input_raw,
             })
-            yield 'data: [DONE]\n\n'
+            yield {"type": "done"}
             return
 
         # ===== break 退出循环后（如最大工具轮次），补发 done 事件 =====
@@ -2444,7 +2591,7 @@ class ChatService:
             "prompt_tokens": total_prompt_tokens, "completion_tokens": total_completion_tokens,
             "elapsed_ms": elapsed_ms, "cache_hit": anth_cache_hit, "total_input": total_input_raw,
         })
-        yield 'data: [DONE]\n\n'
+        yield {"type": "done"}
 
     def _execute_tool(self, tool_call: ToolCall) -> dict[str, Any]:
         tool_name = tool_call.name
@@ -2681,58 +2828,31 @@ class ChatService:
         assistant_id: int | None,
         background_tasks: BackgroundTasks | None = None,
     ) -> None:
-        """Trigger image description (≥5 pending) and file summarization after AI reply."""
+        """Trigger image description and file summarization after AI reply.
+
+        Only images that already left the active context are described.
+        """
         if not assistant_id or not self.session_factory:
             return
-        from app.services.image_description_service import describe_images, summarize_file_messages
+        from app.services.image_description_service import summarize_file_messages
+        from app.services.pending_media import pending_media
 
-        # Image description: check count of pending images
         try:
-            pending_images = (
-                self.db.query(Message)
-                .filter(
-                    Message.session_id == session_id,
-                    Message.image_data.isnot(None),
-                )
-                .count()
-            )
-            if pending_images >= 5:
-                logger.info("[PostReply] Triggering image description (%d images, session=%s)", pending_images, session_id)
-                if background_tasks:
-                    background_tasks.add_task(describe_images, self.session_factory, session_id, assistant_id)
-                else:
-                    threading.Thread(
-                        target=describe_images,
-                        args=(self.session_factory, session_id, assistant_id),
-                        daemon=True,
-                    ).start()
+            pending_media.dispatch_ready(self.session_factory, session_id, assistant_id)
         except Exception:
             logger.warning("[PostReply] Image description check failed", exc_info=True)
 
-        # File summarization: check for pending file messages
-        try:
-            pending_files = (
-                self.db.query(Message)
-                .filter(
-                    Message.session_id == session_id,
-                    Message.meta_info.op("->>")(
-                        "needs_file_summary"
-                    ) == "true",
-                )
-                .count()
-            )
-            if pending_files > 0:
-                logger.info("[PostReply] Triggering file summarization (%d files, session=%s)", pending_files, session_id)
-                if background_tasks:
-                    background_tasks.add_task(summarize_file_messages, self.session_factory, session_id, assistant_id)
-                else:
-                    threading.Thread(
-                        target=summarize_file_messages,
-                        args=(self.session_factory, session_id, assistant_id),
-                        daemon=True,
-                    ).start()
-        except Exception:
-            logger.warning("[PostReply] File summarization check failed", exc_info=True)
+        # File summarization: pending file messages were recorded on insert
+        if pending_media.pop_file_session(session_id):
+            logger.info("[PostReply] Triggering file summarization (session=%s)", session_id)
+            if background_tasks:
+                background_tasks.add_task(summarize_file_messages, self.session_factory, session_id, assistant_id)
+            else:
+                threading.Thread(
+                    target=summarize_file_messages,
+                    args=(self.session_factory, session_id, assistant_id),
+                    daemon=True,
+                ).start()
 
     def _trigger_summary(
         self,
@@ -2746,79 +2866,7 @@ class ChatService:
                 session_id,
             )
             return
-        if not message_ids:
-            logger.warning(
-                "Summary trigger skipped: no trimmed message ids (session_id=%s).",
-                session_id,
-            )
-            return
-
-        # Prevent concurrent summary generation for the same session
-        lock = _get_summary_lock(session_id)
-        if not lock.acquire(blocking=False):
-            logger.info(
-                "Summary trigger skipped: another summary in progress (session_id=%s).",
-                session_id,
-            )
-            return
-
-        db: Session = self.session_factory()
-        try:
-            # Find the latest summary's msg_id_end to avoid re-summarizing
-            last_summary = (
-                db.query(SessionSummary)
-                .filter(
-                    SessionSummary.session_id == session_id,
-                    SessionSummary.assistant_id == assistant_id,
-                    SessionSummary.deleted_at.is_(None),
-                    SessionSummary.msg_id_end.isnot(None),
-                )
-                .order_by(SessionSummary.msg_id_end.desc())
-                .first()
-            )
-            last_end = last_summary.msg_id_end if last_summary else 0
-
-            trimmed_messages = (
-                db.query(Message)
-                .filter(
-                    Message.session_id == session_id,
-                    Message.id.in_(message_ids),
-                    Message.id > last_end,
-                    Message.summary_group_id.is_(None),
-                )
-                .order_by(Message.created_at.asc(), Message.id.asc())
-                .all()
-            )
-            if not trimmed_messages:
-                logger.info(
-                    "Summary trigger skipped: all trimmed messages already summarized "
-                    "(session_id=%s, last_end=%s, candidates=%d).",
-                    session_id, last_end, len(message_ids),
-                )
-                return
-            logger.info(
-                "Summary trigger: %d new messages (session_id=%s, last_end=%s, range=%s~%s).",
-                len(trimmed_messages), session_id, last_end,
-                trimmed_messages[0].id, trimmed_messages[-1].id,
-            )
-            # Pre-summary: describe any pending images first
-            try:
-                from app.services.image_description_service import describe_images
-                describe_images(self.session_factory, session_id, assistant_id)
-            except Exception:
-                logger.warning("Pre-summary image description failed", exc_info=True)
-
-            summary_service = SummaryService(self.session_factory)
-            summary_service.generate_summary(session_id, trimmed_messages, assistant_id)
-        except Exception:
-            logger.exception(
-                "Summary trigger failed (session_id=%s, assistant_id=%s).",
-                session_id,
-                assistant_id,
-            )
-        finally:
-            lock.release()
-            db.close()
+        summarize_message_ids(self.session_factory, session_id, message_ids, assistant_id)
 
     def fetch_available_models(self) -> list[dict[str, Any]]:
         api_provider = self.db.query(ApiProvider).first()
@@ -0,0 +1,214 @@
+"""Bounded, off-loop text extraction for uploaded documents.
+
+PDFs used to be opened with pdfplumber in the calling thread (the Telegram
+handler, i.e. the event loop) with every page's text held in memory, so a
+300-page document stalled the bot and could take hundreds of MB. Here:
+
+- the file is written to the blob store and identified by its SHA-256;
+- PDF pages are parsed one at a time in a separate process, each page's
+  layout cache is released after its text is taken, and extraction stops
+  at ``DOC_MAX_PAGES`` pages or ``DOC_MAX_CHARS`` characters;
+- the extracted text is cached next to the blob, so the same file sent
+  again (or summarized later, see ``summarize_file_messages``) is not
+  parsed again.
+
+The pool uses the spawn start method (the parent holds DB connections and
+threads), and each worker is recycled after a number of documents so
+pdfminer's allocations do not accumulate. A document still being parsed
+after ``DOC_EXTRACT_TIMEOUT_SECONDS`` has its worker killed (the pool is
+replaced), so a pathological PDF cannot pin a worker forever.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+from app.services.blob_store import blob_store
+
+logger = logging.getLogger(__name__)
+
+TEXT_EXTENSIONS = {
+    ".txt", ".md", ".py", ".js", ".json", ".csv", ".ts", ".html", ".css",
+    ".yaml", ".yml", ".xml", ".sh", ".bash", ".sql", ".log", ".ini", ".cfg",
+    ".conf", ".toml", ".env", ".jsx", ".tsx", ".java", ".go", ".rs", ".c",
+    ".cpp", ".h", ".hpp", ".rb", ".php", ".swift", ".kt", ".r", ".lua",
+}
+
+DOC_MAX_PAGES = int(os.getenv("DOC_MAX_PAGES", "200"))
+DOC_MAX_CHARS = int(os.getenv("DOC_MAX_CHARS", "400000"))
+DOC_WORKERS = int(os.getenv("DOC_WORKERS", "2"))
+DOC_EXTRACT_TIMEOUT_SECONDS = 120
+# Documents parsed by one worker process before it is replaced
+DOC_TASKS_PER_WORKER = 20
+
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class ExtractedDocument:
+    digest: str
+    text: str
+    pages_read: int | None = None
+    pages_total: int | None = None
+    truncated: bool = False
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=DOC_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                max_tasks_per_child=DOC_TASKS_PER_WORKER,
+            )
+        return _pool
+
+
+def _reset_pool(kill: bool = False) -> None:
+    """Drop the pool; with ``kill``, also terminate its workers.
+
+    ``shutdown`` never interrupts a running task, so a stuck worker has to
+    be killed. Other documents in flight on the same pool fail with
+    BrokenProcessPool and come back empty.
+    """
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is None:
+        return
+    # The executor has no public handle on its worker processes
+    workers = list((getattr(pool, "_processes", None) or {}).values()) if kill else []
+    pool.shutdown(wait=False, cancel_futures=True)
+    for worker in workers:
+        if worker.is_alive():
+            worker.kill()
+    for worker in workers:
+        worker.join(timeout=5)
+
+
+def extract_pdf_pages(path: str, max_pages: int, max_chars: int) -> dict:
+    """Extract text page by page; runs inside a pool worker.
+
+    Stops after ``max_pages`` pages or ``max_chars`` characters. Each page's
+    parsed objects are released before the next one is read.
+    """
+    import pdfplumber
+
+    parts: list[str] = []
+    chars = 0
+    pages_read = 0
+    truncated = False
+    with pdfplumber.open(path, pages=range(1, max_pages + 1)) as pdf:
+        try:
+            from pdfminer.pdftypes import resolve1
+
+            pages_total = int(resolve1(pdf.doc.catalog["Pages"])["Count"])
+        except Exception:
+            pages_total = None
+        for page in pdf.pages:
+            text = page.extract_text() or ""
+            page.close()
+            pages_read += 1
+            if chars + len(text) > max_chars:
+                parts.append(text[: max_chars - chars])
+                truncated = True
+                break
+            parts.append(text)
+            chars += len(text)
+    if pages_total is not None and pages_read < pages_total:
+        truncated = True
+    return {
+        "text": "\n".join(parts),
+        "pages_read": pages_read,
+        "pages_total": pages_total,
+        "truncated": truncated,
+    }
+
+
+def _cache_name(kind: str) -> str:
+    return f"text-{kind}-p{DOC_MAX_PAGES}-c{DOC_MAX_CHARS}.json"
+
+
+def _kind(filename: str) -> str | None:
+    ext = Path(filename).suffix.lower()
+    if ext in TEXT_EXTENSIONS:
+        return "plain"
+    if ext == ".pdf":
+        return "pdf"
+    return None
+
+
+def cached_document(digest: str, filename: str) -> ExtractedDocument | None:
+    kind = _kind(filename)
+    if kind is None:
+        return None
+    raw = blob_store.get_derived(digest, _cache_name(kind))
+    if raw is None:
+        return None
+    return ExtractedDocument(digest=digest, **json.loads(raw))
+
+
+def extract_document_sync(filename: str, data: bytes) -> ExtractedDocument:
+    """Store ``data`` and return its (capped, cached) text; empty text if unsupported or unreadable."""
+    digest = blob_store.put(data)
+    kind = _kind(filename)
+    if kind is None:
+        return ExtractedDocument(digest=digest, text="")
+    cached = cached_document(digest, filename)
+    if cached is not None:
+        return cached
+
+    if kind == "plain":
+        text = data[: DOC_MAX_CHARS * 4].decode("utf-8", errors="replace")
+        result = {
+            "text": text[:DOC_MAX_CHARS],
+            "truncated": len(text) > DOC_MAX_CHARS or len(data) > DOC_MAX_CHARS * 4,
+        }
+    else:
+        try:
+            future = _get_pool().submit(
+                extract_pdf_pages, str(blob_store.path(digest)), DOC_MAX_PAGES, DOC_MAX_CHARS,
+            )
+            result = future.result(timeout=DOC_EXTRACT_TIMEOUT_SECONDS)
+        except TimeoutError:
+            logger.warning(
+                "PDF extraction timed out after %ds (%s), killing workers",
+                DOC_EXTRACT_TIMEOUT_SECONDS, filename,
+            )
+            _reset_pool(kill=True)
+            return ExtractedDocument(digest=digest, text="")
+        except ImportError:
+            logger.warning("pdfplumber not installed, cannot extract PDF")
+            return ExtractedDocument(digest=digest, text="")
+        except BrokenProcessPool:
+            logger.warning("PDF extraction worker died (%s), resetting pool", filename)
+            _reset_pool()
+            return ExtractedDocument(digest=digest, text="")
+        except Exception as exc:
+            logger.warning("PDF extraction failed: %s", exc)
+            return ExtractedDocument(digest=digest, text="")
+
+    doc = ExtractedDocument(digest=digest, **result)
+    payload = {k: v for k, v in asdict(doc).items() if k != "digest"}
+    blob_store.put_derived(digest, _cache_name(kind), json.dumps(payload, ensure_ascii=False).encode())
+    if doc.truncated:
+        logger.info(
+            "[ingest] %s truncated: %s/%s pages, %d chars",
+            filename, doc.pages_read, doc.pages_total, len(doc.text),
+        )
+    return doc
+
+
+async def ingest_document(filename: str, data: bytes) -> ExtractedDocument:
+    return await asyncio.to_thread(extract_document_sync, filename, data)
@@ -2,78 +2,174 @@ from __future__ import annotations
 
 import logging
 import os
-from typing import Any
+import threading
+from typing import Any, Protocol
 
-import requests
+from app.services.resilient_http import CircuitBreaker, CircuitOpen, ResilientClient
 
 logger = logging.getLogger(__name__)
 
+# siliconflow (default) | local (ONNX, see local_embedding) | hashing (offline tests)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "siliconflow")
+EMBEDDING_DIM = 1024
 
-class EmbeddingService:
-    _api_key: str | None = None
+SILICONFLOW_BASE_URL = os.getenv("SILICONFLOW_BASE_URL", "https://api.siliconflow.cn/v1").rstrip("/")
+# Per-attempt read timeouts (seconds); callers can pass a tighter deadline
+EMBEDDING_TIMEOUT = float(os.getenv("EMBEDDING_TIMEOUT", "8"))
+RERANK_TIMEOUT = float(os.getenv("RERANK_TIMEOUT", "6"))
 
-    def __init__(self) -> None:
-        self._load_api_key()
+# Shared by every EmbeddingService instance: one keep-alive pool, one breaker per endpoint
+_client = ResilientClient(
+    pool_size=16,
+    connect_timeout=3.0,
+    retries=int(os.getenv("EMBEDDING_RETRIES", "2")),
+)
+_embedding_breaker = CircuitBreaker(
+    "embedding",
+    failure_threshold=int(os.getenv("EMBEDDING_BREAKER_FAILURES", "5")),
+    reset_seconds=float(os.getenv("EMBEDDING_BREAKER_RESET", "30")),
+)
+_rerank_breaker = CircuitBreaker(
+    "rerank",
+    failure_threshold=int(os.getenv("EMBEDDING_BREAKER_FAILURES", "5")),
+    reset_seconds=float(os.getenv("EMBEDDING_BREAKER_RESET", "30")),
+)
+
+
+class EmbeddingBackend(Protocol):
+    name: str
+
+    def embed(self, texts: list[str], deadline: float | None = None) -> list[list[float]]:
+        """One vector per text; raises on failure."""
+        ...
+
+    def rerank(
+        self, query: str, documents: list[str], top_n: int, deadline: float | None = None
+    ) -> list[dict[str, Any]]:
+        """``{"index", "relevance_score"}`` dicts, best first; raises on failure."""
+        ...
 
-    @classmethod
-    def _load_api_key(cls) -> str:
-        if cls._api_key is not None:
-            return cls._api_key
+
+class SiliconFlowBackend:
+    name = "siliconflow"
+
+    def __init__(self) -> None:
         api_key = os.environ.get("SILICONFLOW_API_KEY", "").strip()
         if not api_key:
             raise RuntimeError("SILICONFLOW_API_KEY is not configured")
-        cls._api_key = api_key
-        return api_key
+        self._headers = {"Authorization": f"Bearer {api_key}"}
+
+    def embed(self, texts: list[str], deadline: float | None = None) -> list[list[float]]:
+        payload = {
+            "model": "BAAI/bge-m3",
+            "input": texts,
+        }
+        data: dict[str, Any] = _client.post_json(
+            f"{SILICONFLOW_BASE_URL}/embeddings", payload,
+            headers=self._headers, read_timeout=EMBEDDING_TIMEOUT,
+            deadline=deadline, breaker=_embedding_breaker,
+        )
+        values = data.get("data", [])
+        if len(values) != len(texts) or any("embedding" not in v for v in values):
+            raise RuntimeError("SiliconFlow embedding response missing 'embedding'")
+        # Responses carry an index; don't rely on their order
+        values = sorted(values, key=lambda v: v.get("index", 0))
+        return [v["embedding"] for v in values]
+
+    def rerank(
+        self, query: str, documents: list[str], top_n: int, deadline: float | None = None
+    ) -> list[dict[str, Any]]:
+        payload = {
+            "model": "Qwen/Qwen3-Reranker-8B",
+            "query": query,
+            "documents": documents,
+            "top_n": top_n,
+        }
+        data: dict[str, Any] = _client.post_json(
+            f"{SILICONFLOW_BASE_URL}/rerank", payload,
+            headers=self._headers, read_timeout=RERANK_TIMEOUT,
+            deadline=deadline, breaker=_rerank_breaker,
+        )
+        results = data.get("results", [])
+        return results if isinstance(results, list) else []
+
 
-    def get_embedding(self, text: str) -> list[float] | None:
+_backend: EmbeddingBackend | None = None
+_backend_lock = threading.Lock()
+
+
+def get_backend() -> EmbeddingBackend:
+    """The process-wide backend, created on first use from ``EMBEDDING_BACKEND``."""
+    global _backend
+    if _backend is not None:
+        return _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = _create_backend(EMBEDDING_BACKEND)
+    return _backend
+
+
+def _create_backend(name: str) -> EmbeddingBackend:
+    if name == "hashing":
+        from app.services.local_embedding import HashingEmbeddingBackend
+        return HashingEmbeddingBackend(EMBEDDING_DIM)
+    if name == "local":
+        model_dir = os.getenv("LOCAL_EMBEDDING_MODEL_DIR", "")
         try:
-            api_key = self._load_api_key()
-            url = "https://api.siliconflow.cn/v1/embeddings"
-            payload = {
-                "model": "BAAI/bge-m3",
-                "input": [text],
-            }
-            headers = {"Authorization": f"Bearer {api_key}"}
-            response = requests.post(url, json=payload, headers=headers, timeout=30)
-            response.raise_for_status()
-            data: dict[str, Any] = response.json()
-            values = data.get("data", [])
-            if not values or "embedding" not in values[0]:
-                raise RuntimeError("SiliconFlow embedding response missing 'embedding'")
-            embedding = values[0]["embedding"]
-            if not isinstance(embedding, list):
-                raise RuntimeError("SiliconFlow embedding response has invalid format")
-            if len(embedding) != 1024:
-                raise RuntimeError(
-                    f"SiliconFlow embedding dimension mismatch: expected 1024, got {len(embedding)}"
-                )
-            return embedding
+            from app.services.local_embedding import OnnxEmbeddingBackend
+            return OnnxEmbeddingBackend(model_dir, os.getenv("LOCAL_RERANK_MODEL_DIR") or None)
+        except Exception as exc:
+            logger.warning("[embedding] Local backend unavailable (%s), using SiliconFlow: %s", model_dir, exc)
+    elif name != "siliconflow":
+        logger.warning("[embedding] Unknown EMBEDDING_BACKEND %r, using SiliconFlow", name)
+    return SiliconFlowBackend()
+
+
+class EmbeddingService:
+    def __init__(self) -> None:
+        self.backend = get_backend()
+
+    def get_embedding(self, text: str, deadline: float | None = None) -> list[float] | None:
+        """Embedding for ``text``, or None on failure.
+
+        ``deadline`` is a ``time.monotonic()`` value bounding retries.
+        """
+        return self.get_embeddings([text], deadline=deadline)[0]
+
+    def get_embeddings(
+        self, texts: list[str], deadline: float | None = None
+    ) -> list[list[float] | None]:
+        """Embeddings for ``texts`` in one backend call; None entries on failure."""
+        if not texts:
+            return []
+        try:
+            vectors = self.backend.embed(texts, deadline=deadline)
+        except CircuitOpen:
+            return [None] * len(texts)
         except Exception as exc:
-            logger.warning("SiliconFlow embedding failed, fallback to None: %s", exc)
-            return None
+            logger.warning("%s embedding failed, fallback to None: %s", self.backend.name, exc)
+            return [None] * len(texts)
+        results: list[list[float] | None] = []
+        for embedding in vectors:
+            if not isinstance(embedding, list) or len(embedding) != EMBEDDING_DIM:
+                logger.warning(
+                    "%s embedding dimension mismatch: expected %d, got %s",
+                    self.backend.name, EMBEDDING_DIM,
+                    len(embedding) if isinstance(embedding, list) else type(embedding).__name__,
+                )
+                embedding = None
+            results.append(embedding)
+        return results
 
     def rerank(
-        self, query: str, documents: list[str], top_n: int = 5
+        self, query: str, documents: list[str], top_n: int = 5, deadline: float | None = None
     ) -> list[dict[str, Any]]:
         if not documents:
             return []
         try:
-            api_key = self._load_api_key()
-            url = "https://api.siliconflow.cn/v1/rerank"
-            payload = {
-                "model": "Qwen/Qwen3-Reranker-8B",
-                "query": query,
-                "documents": documents,
-                "top_n": top_n,
-            }
-            headers = {"Authorization": f"Bearer {api_key}"}
-            response = requests.post(url, json=payload, headers=headers, timeout=15)
-            response.raise_for_status()
-            data: dict[str, Any] = response.json()
-            results = data.get("results", [])
-            if isinstance(results, list):
-                return results
+            return self.backend.rerank(query, documents, top_n, deadline=deadline)
+        except CircuitOpen:
             return []
         except Exception as exc:
-            logger.warning("SiliconFlow rerank failed, fallback to original order: %s", exc)
+            logger.warning("%s rerank failed, fallback to original order: %s", self.backend.name, exc)
             return []
@@ -0,0 +1,194 @@
+"""Bounded cache for fetched web documents.
+
+- In memory: LRU bounded by the UTF-8 size of the cached documents
+  (``max_bytes``), with a TTL checked on read.
+- On disk (optional, ``disk_dir``): one JSON file per URL hash, so fetched
+  pages survive a restart. Files past the TTL are ignored and the directory
+  is pruned, oldest first, to ``disk_max_bytes``.
+- Singleflight: concurrent requests for the same key wait for the one
+  fetch in flight instead of each calling the upstream. Failures are
+  passed to every waiter and are not cached.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from concurrent.futures import Future
+from dataclasses import dataclass
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Disk pruning runs after this many writes
+_PRUNE_EVERY = 50
+
+
+@dataclass(frozen=True)
+class FetchedDocument:
+    url: str
+    title: str
+    content: str
+    fetched_at: float
+
+    @property
+    def size(self) -> int:
+        return len(self.content.encode("utf-8")) + len(self.title.encode("utf-8"))
+
+
+class FetchCache:
+    def __init__(
+        self,
+        max_bytes: int,
+        ttl_seconds: float,
+        disk_dir: str | Path | None = None,
+        disk_max_bytes: int = 0,
+    ) -> None:
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.disk_max_bytes = disk_max_bytes
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, tuple[FetchedDocument, int]] = OrderedDict()
+        self._bytes = 0
+        self._inflight: dict[str, Future] = {}
+        self._disk_writes = 0
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "coalesced": 0, "evictions": 0}
+
+    # ── Public ──
+
+    def get_or_fetch(self, url: str, fetch: Callable[[str], FetchedDocument]) -> FetchedDocument:
+        """Cached document for ``url``, calling ``fetch(url)`` at most once per miss."""
+        with self._lock:
+            doc = self._get_memory(url)
+            if doc is not None:
+                self.stats["hits"] += 1
+                return doc
+            future = self._inflight.get(url)
+            leader = future is None
+            if leader:
+                future = self._inflight[url] = Future()
+            else:
+                self.stats["coalesced"] += 1
+        if not leader:
+            return future.result()
+
+        try:
+            doc = self._get_disk(url)
+            if doc is not None:
+                with self._lock:
+                    self.stats["disk_hits"] += 1
+            else:
+                with self._lock:
+                    self.stats["misses"] += 1
+                doc = fetch(url)
+                self._put_disk(doc)
+            with self._lock:
+                self._put_memory(doc)
+            future.set_result(doc)
+            return doc
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(url, None)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {**self.stats, "entries": len(self._entries), "bytes": self._bytes}
+
+    # ── Memory tier (call with the lock held) ──
+
+    def _get_memory(self, url: str) -> FetchedDocument | None:
+        item = self._entries.get(url)
+        if item is None:
+            return None
+        doc, size = item
+        if time.time() - doc.fetched_at >= self.ttl_seconds:
+            del self._entries[url]
+            self._bytes -= size
+            return None
+        self._entries.move_to_end(url)
+        return doc
+
+    def _put_memory(self, doc: FetchedDocument) -> None:
+        size = doc.size
+        if size > self.max_bytes:
+            return
+        old = self._entries.pop(doc.url, None)
+        if old is not None:
+            self._bytes -= old[1]
+        self._entries[doc.url] = (doc, size)
+        self._bytes += size
+        while self._bytes > self.max_bytes and self._entries:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self._bytes -= evicted
+            self.stats["evictions"] += 1
+
+    # ── Disk tier ──
+
+    def _disk_path(self, url: str) -> Path:
+        return self.disk_dir / f"{hashlib.sha256(url.encode('utf-8')).hexdigest()}.json"
+
+    def _get_disk(self, url: str) -> FetchedDocument | None:
+        if self.disk_dir is None:
+            return None
+        try:
+            data = json.loads(self._disk_path(url).read_text(encoding="utf-8"))
+        except (FileNotFoundError, ValueError):
+            return None
+        except OSError as exc:
+            logger.warning("[fetch_cache] Disk read failed: %s", exc)
+            return None
+        doc = FetchedDocument(**data)
+        if doc.url != url or time.time() - doc.fetched_at >= self.ttl_seconds:
+            return None
+        return doc
+
+    def _put_disk(self, doc: FetchedDocument) -> None:
+        if self.disk_dir is None:
+            return
+        try:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+            fd, tmp_name = tempfile.mkstemp(dir=self.disk_dir, prefix=".incoming-")
+            with os.fdopen(fd, "w", encoding="utf-8") as tmp:
+                json.dump(
+                    {"url": doc.url, "title": doc.title, "content": doc.content, "fetched_at": doc.fetched_at},
+                    tmp, ensure_ascii=False,
+                )
+            os.replace(tmp_name, self._disk_path(doc.url))
+        except OSError as exc:
+            logger.warning("[fetch_cache] Disk write failed: %s", exc)
+            return
+        with self._lock:
+            self._disk_writes += 1
+            prune = self._disk_writes % _PRUNE_EVERY == 0
+        if prune:
+            self._prune_disk()
+
+    def _prune_disk(self) -> None:
+        now = time.time()
+        files = []
+        for path in self.disk_dir.glob("*.json"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            if now - stat.st_mtime >= self.ttl_seconds:
+                path.unlink(missing_ok=True)
+            else:
+                files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.disk_max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
@@ -1,10 +1,9 @@
 from __future__ import annotations
 
-import io
 import json
 import logging
 import re
-from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any
 
 from openai import OpenAI
@@ -14,23 +13,16 @@ from sqlalchemy.orm import Session, sessionmaker
 from app.models.models import (
     ApiProvider,
     Assistant,
+    ChatSession,
     Message,
     ModelPreset,
-    Settings,
 )
+from app.services.blob_store import load_base64
+from app.services.document_ingest import cached_document, extract_document_sync
+from app.services.settings_store import settings_store
 
 logger = logging.getLogger(__name__)
 
-# ── File extraction constants ────────────────────────────────────────────────
-
-TEXT_EXTENSIONS = {
-    ".txt", ".md", ".py", ".js", ".json", ".csv", ".ts", ".html", ".css",
-    ".yaml", ".yml", ".xml", ".sh", ".bash", ".sql", ".log", ".ini", ".cfg",
-    ".conf", ".toml", ".env", ".jsx", ".tsx", ".java", ".go", ".rs", ".c",
-    ".cpp", ".h", ".hpp", ".rb", ".php", ".swift", ".kt", ".r", ".lua",
-}
-
-
 # ── Token estimation (same logic as ChatService) ────────────────────────────
 
 def _estimate_tokens(text: str) -> int:
@@ -51,32 +43,8 @@ def _estimate_tokens(text: str) -> int:
 # ── File content extraction ──────────────────────────────────────────────────
 
 def extract_file_content(filename: str, data: bytes) -> str:
-    """Extract text content from file bytes based on extension."""
-    ext = Path(filename).suffix.lower()
-    if ext in TEXT_EXTENSIONS:
-        try:
-            return data.decode("utf-8", errors="replace")
-        except Exception:
-            return ""
-    elif ext == ".pdf":
-        return _extract_pdf(data)
-    else:
-        return ""
-
-
-def _extract_pdf(data: bytes) -> str:
-    try:
-        import pdfplumber
-
-        with pdfplumber.open(io.BytesIO(data)) as pdf:
-            pages = [page.extract_text() or "" for page in pdf.pages]
-            return "\n".join(pages)
-    except ImportError:
-        logger.warning("pdfplumber not installed, cannot extract PDF")
-        return ""
-    except Exception as exc:
-        logger.warning("PDF extraction failed: %s", exc)
-        return ""
+    """Extract text content from file bytes based on extension (capped, cached by hash)."""
+    return extract_document_sync(filename, data).text
 
 
 def truncate_to_tokens(text: str, max_tokens: int) -> str:
@@ -95,14 +63,8 @@ def truncate_to_tokens(text: str, max_tokens: int) -> str:
 
 
 def get_trigger_threshold(db: Session) -> int:
-    """Read dialogue_trigger_threshold from Settings."""
-    try:
-        row = db.query(Settings).filter(Settings.key == "dialogue_trigger_threshold").first()
-        if row:
-            return int(row.value)
-    except Exception:
-        pass
-    return 16000
+    """Read dialogue_trigger_threshold from the cached settings."""
+    return settings_store.snapshot(db).get_int("dialogue_trigger_threshold", 16000)
 
 
 # ── Model resolution (mirrors summary_service pattern) ──────────────────────
@@ -228,61 +190,66 @@ def _call_model_text(
 
 # ── Image description ────────────────────────────────────────────────────────
 
-def describe_images(
+# Images per multimodal call
+IMAGE_BATCH_SIZE = 5
+
+
+def describe_image_batch(
     session_factory: sessionmaker,
-    session_id: int,
-    assistant_id: int,
-) -> None:
-    """Batch-describe all pending images in a session.
+    assistant_id: int | None,
+    message_ids: list[int],
+) -> bool:
+    """Describe one batch of pending images and write the results back in one commit.
 
-    Queries messages with non-null image_data, calls model to describe them,
-    updates content from [图片] to [图片：description], clears image_data.
+    Updates content from [图片] to [图片：description] and clears image_hash.
+    Returns False if the model calls failed (images stay pending for a retry).
     """
     db: Session = session_factory()
     try:
         pending = (
             db.query(Message)
             .filter(
-                Message.session_id == session_id,
-                Message.image_data.isnot(None),
+                Message.id.in_(message_ids),
+                Message.image_hash.isnot(None),
             )
             .order_by(Message.id.asc())
             .all()
         )
         if not pending:
-            return
+            return True
 
-        logger.info(
-            "[ImageDesc] Processing %d images (session=%s, assistant=%s)",
-            len(pending), session_id, assistant_id,
-        )
-
-        assistant = db.get(Assistant, assistant_id)
+        if assistant_id is None:
+            chat_session = db.get(ChatSession, pending[0].session_id)
+            assistant_id = chat_session.assistant_id if chat_session else None
+        assistant = db.get(Assistant, assistant_id) if assistant_id else None
         if not assistant:
             logger.warning("[ImageDesc] Assistant not found: %s", assistant_id)
-            return
+            return False
 
         primary = _resolve_primary_preset(db, assistant)
         fallback = _resolve_fallback_preset(db, assistant)
         if not primary:
             logger.warning("[ImageDesc] No model preset available")
-            return
+            return False
 
         # Build image list
         images: list[dict[str, str]] = []
+        loaded: list[Message] = []
         for msg in pending:
-            data_url = msg.image_data or ""
-            if not data_url.startswith("data:"):
-                continue
             try:
-                meta_part, b64_data = data_url.split(",", 1)
-                media_type = meta_part.split(":")[1].split(";")[0]
-                images.append({"media_type": media_type, "data": b64_data})
-            except Exception:
-                logger.warning("[ImageDesc] Failed to parse image_data for msg %d", msg.id)
+                images.append({
+                    "media_type": msg.image_media_type or "image/jpeg",
+                    "data": load_base64(msg.image_hash),
+                })
+                loaded.append(msg)
+            except (FileNotFoundError, ValueError):
+                # Can never be described; drop the reference so it stops counting as pending
+                logger.warning("[ImageDesc] Missing blob %s for msg %d", msg.image_hash, msg.id)
+                msg.image_hash = None
 
         if not images:
-            return
+            db.commit()
+            return True
 
         user_prompt = (
             f"请简短描述以下{len(images)}张图片的内容，每张一行。\n"
@@ -306,14 +273,15 @@ def describe_images(
                     logger.exception("[ImageDesc] Fallback model also failed")
 
         if not result:
-            logger.warning("[ImageDesc] All models failed, image_data preserved for retry")
-            return
+            logger.warning("[ImageDesc] All models failed, image_hash preserved for retry")
+            db.rollback()
+            return False
 
         # Parse descriptions
-        descriptions = _parse_descriptions(result, len(pending))
+        descriptions = _parse_descriptions(result, len(loaded))
 
         # Update messages
-        for i, msg in enumerate(pending):
+        for i, msg in enumerate(loaded):
             desc = descriptions[i] if i < len(descriptions) else "图片"
             # Replace [图片] marker in content
             old_content = msg.content or ""
@@ -321,21 +289,39 @@ def describe_images(
                 msg.content = old_content.replace("[图片]", f"[图片：{desc}]", 1)
             else:
                 msg.content = f"[图片：{desc}]"
-            msg.image_data = None
+            msg.image_hash = None
 
         db.commit()
-        logger.info("[ImageDesc] Described %d images successfully", len(pending))
+        logger.info("[ImageDesc] Described %d images successfully", len(loaded))
+        return True
 
     except Exception:
-        logger.exception("[ImageDesc] Failed (session=%s)", session_id)
+        logger.exception("[ImageDesc] Batch failed (messages=%s)", message_ids)
         try:
             db.rollback()
         except Exception:
             pass
+        return False
     finally:
         db.close()
 
 
+def describe_images(
+    session_factory: sessionmaker,
+    session_id: int,
+    assistant_id: int,
+    message_ids: list[int] | None = None,
+) -> None:
+    """Describe pending images among ``message_ids`` (default: already-summarized ones) and wait.
+
+    Batches run concurrently on the pending-media worker; batches it
+    already started for these images are awaited rather than repeated.
+    """
+    from app.services.pending_media import pending_media
+
+    pending_media.describe_session(session_factory, session_id, assistant_id, message_ids)
+
+
 def _parse_descriptions(text: str, expected_count: int) -> list[str]:
     """Parse model output like '图片1: xxx\n图片2: yyy' into a list of descriptions."""
     lines = [line.strip() for line in text.strip().split("\n") if line.strip()]
@@ -356,12 +342,123 @@ def _parse_descriptions(text: str, expected_count: int) -> list[str]:
 
 # ── File summarization ───────────────────────────────────────────────────────
 
+# Estimated tokens of document text per summary call
+FILE_CHUNK_TOKENS = 8000
+# Files summarized in parallel, and chunk calls in parallel across them
+FILE_SUMMARY_CONCURRENCY = 3
+FILE_CHUNK_CONCURRENCY = 4
+
+_FILE_SYSTEM_PROMPT = "你是文件概括助手。请用中文简短概括以下文件的主要内容，不超过500字。只输出概括内容。"
+_FILE_CHUNK_PROMPT = "你是文件概括助手。以下是一个长文件中的一部分，请用中文概括这部分的要点，不超过300字。只输出概括内容。"
+_FILE_REDUCE_PROMPT = "你是文件概括助手。以下是一个长文件各部分的概括（按顺序），请合并成对整个文件的概括，不超过500字。只输出概括内容。"
+
+_file_executor = ThreadPoolExecutor(max_workers=FILE_SUMMARY_CONCURRENCY, thread_name_prefix="file-summary")
+_file_chunk_executor = ThreadPoolExecutor(max_workers=FILE_CHUNK_CONCURRENCY, thread_name_prefix="file-chunk")
+
+
+def split_text_by_tokens(text: str, max_tokens: int = FILE_CHUNK_TOKENS) -> list[str]:
+    """Split at line boundaries into pieces of about ``max_tokens``; overlong lines are cut."""
+    # 1.5 tokens per CJK char is the densest case, so this many chars always fit
+    hard_chars = max(1, max_tokens * 2 // 3)
+    chunks: list[str] = []
+    current: list[str] = []
+    tokens = 0
+    for line in text.splitlines():
+        pieces = [line[i:i + hard_chars] for i in range(0, len(line), hard_chars)] or [""]
+        for piece in pieces:
+            piece_tokens = _estimate_tokens(piece) + 1
+            if current and tokens + piece_tokens > max_tokens:
+                chunks.append("\n".join(current))
+                current, tokens = [], 0
+            current.append(piece)
+            tokens += piece_tokens
+    if current and "".join(current).strip():
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def _call_text_with_fallback(
+    session_factory: sessionmaker,
+    primary_id: int,
+    fallback_id: int | None,
+    system_prompt: str,
+    user_text: str,
+    label: str,
+) -> str | None:
+    """One text call on its own DB session (safe to run on a worker thread)."""
+    db: Session = session_factory()
+    try:
+        for preset_id in (primary_id, fallback_id):
+            if preset_id is None:
+                continue
+            preset = db.get(ModelPreset, preset_id)
+            if not preset:
+                continue
+            try:
+                result = _call_model_text(db, preset, system_prompt, user_text)
+                if result and result.strip():
+                    return result.strip()
+            except Exception:
+                logger.exception("[FileSum] Model %s failed for %s", preset_id, label)
+        return None
+    finally:
+        db.close()
+
+
+def _summarize_document(
+    session_factory: sessionmaker,
+    primary_id: int,
+    fallback_id: int | None,
+    file_name: str,
+    text: str,
+) -> str | None:
+    """Summarize one file; long ones are summarized chunk-wise in parallel, then merged."""
+    chunks = split_text_by_tokens(text)
+    if len(chunks) <= 1:
+        return _call_text_with_fallback(
+            session_factory, primary_id, fallback_id,
+            _FILE_SYSTEM_PROMPT, f"文件名：{file_name}\n\n{text}", file_name,
+        )
+
+    logger.info("[FileSum] %s: %d chunks", file_name, len(chunks))
+    futures = [
+        _file_chunk_executor.submit(
+            _call_text_with_fallback, session_factory, primary_id, fallback_id,
+            _FILE_CHUNK_PROMPT, f"文件名：{file_name}（第{i + 1}/{len(chunks)}部分）\n\n{chunk}",
+            f"{file_name}#{i + 1}",
+        )
+        for i, chunk in enumerate(chunks)
+    ]
+    parts: list[str] = []
+    for i, future in enumerate(futures):
+        try:
+            part = future.result()
+        except Exception:
+            logger.exception("[FileSum] Chunk %d of %s failed", i + 1, file_name)
+            part = None
+        if part:
+            parts.append(f"第{i + 1}部分：{part}")
+    if not parts:
+        return None
+    if len(parts) < len(chunks):
+        logger.warning("[FileSum] %s: %d/%d chunks failed", file_name, len(chunks) - len(parts), len(chunks))
+    return _call_text_with_fallback(
+        session_factory, primary_id, fallback_id,
+        _FILE_REDUCE_PROMPT, f"文件名：{file_name}\n\n" + "\n\n".join(parts), file_name,
+    )
+
+
 def summarize_file_messages(
     session_factory: sessionmaker,
     session_id: int,
     assistant_id: int,
 ) -> None:
-    """Find messages with file content that needs summarization and summarize them."""
+    """Find messages with file content that needs summarization and summarize them.
+
+    The full extracted text is taken from the document cache when the
+    message carries ``file_hash`` (the message itself only holds a
+    truncated copy); files are summarized in parallel.
+    """
     db: Session = session_factory()
     try:
         # Find messages marked for file summary
@@ -392,57 +489,54 @@ def summarize_file_messages(
         fallback = _resolve_fallback_preset(db, assistant)
         if not primary:
             return
+        fallback_id = fallback.id if fallback and fallback.id != primary.id else None
 
+        # Format: "[文件：filename]\n文件内容" or "caption\n\n[文件：filename]\n文件内容"
+        file_marker_pattern = re.compile(r"\[文件：([^\]]+)\]\n")
+        jobs = []
         for msg in pending:
             meta = msg.meta_info or {}
             file_name = meta.get("file_name", "unknown")
             content = msg.content or ""
 
-            # Extract the file content part
-            # Format: "[文件：filename]\n文件内容" or "caption\n\n[文件：filename]\n文件内容"
-            file_marker_pattern = re.compile(r"\[文件：([^\]]+)\]\n")
             match = file_marker_pattern.search(content)
-            if not match:
-                # No file marker found, skip
-                meta.pop("needs_file_summary", None)
-                msg.meta_info = {**meta}
-                continue
-
-            marker_end = match.end()
-            caption_part = content[:match.start()].strip()
-            file_content = content[marker_end:]
-
+            file_content = content[match.end():] if match else ""
             if not file_content.strip():
+                # No file marker or empty content, nothing to summarize
                 meta.pop("needs_file_summary", None)
                 msg.meta_info = {**meta}
                 continue
 
-            # Summarize
-            system_prompt = "你是文件概括助手。请用中文简短概括以下文件的主要内容，不超过500字。只输出概括内容。"
-            user_text = f"文件名：{file_name}\n\n{file_content}"
-
-            summary: str | None = None
+            full = cached_document(meta["file_hash"], file_name) if meta.get("file_hash") else None
+            text = full.text if full and full.text.strip() else file_content
+            jobs.append((
+                msg,
+                content[:match.start()].strip(),
+                file_name,
+                _file_executor.submit(
+                    _summarize_document, session_factory, primary.id, fallback_id, file_name, text,
+                ),
+            ))
+
+        for msg, caption_part, file_name, future in jobs:
             try:
-                summary = _call_model_text(db, primary, system_prompt, user_text)
+                summary = future.result()
             except Exception:
-                logger.exception("[FileSum] Primary model failed for msg %d", msg.id)
-                if fallback and fallback.id != primary.id:
-                    try:
-                        summary = _call_model_text(db, fallback, system_prompt, user_text)
-                    except Exception:
-                        logger.exception("[FileSum] Fallback also failed for msg %d", msg.id)
-
-            if summary and summary.strip():
+                logger.exception("[FileSum] Failed for msg %d", msg.id)
+                summary = None
+
+            if summary:
                 if caption_part:
-                    msg.content = f"{caption_part}\n\n[文件：{file_name}] {summary.strip()}"
+                    msg.content = f"{caption_part}\n\n[文件：{file_name}] {summary}"
                 else:
-                    msg.content = f"[文件：{file_name}] {summary.strip()}"
+                    msg.content = f"[文件：{file_name}] {summary}"
             else:
                 if caption_part:
                     msg.content = f"{caption_part}\n\n[文件：{file_name}，概括失败，原文过长已丢弃]"
                 else:
                     msg.content = f"[文件：{file_name}，概括失败，原文过长已丢弃]"
 
+            meta = msg.meta_info or {}
             meta.pop("needs_file_summary", None)
             msg.meta_info = {**meta}
 
@@ -0,0 +1,218 @@
+"""Image normalization before storage and multimodal calls.
+
+Photos and uploads used to be stored and sent at whatever size they
+arrived, so a 12MP phone photo cost several MB of base64 per request,
+plus the provider's upload and vision-token time. Every incoming image now
+goes through ``process_image`` on a small worker pool:
+
+1. decode (JPEG decoding is reduced to about the target size via draft mode),
+2. apply the EXIF orientation,
+3. downscale so the longer edge is at most ``IMAGE_MAX_EDGE``,
+4. re-encode as ``IMAGE_OUTPUT_FORMAT`` (webp or jpeg) at ``IMAGE_QUALITY``,
+5. render a ``IMAGE_THUMB_EDGE`` thumbnail for the frontend.
+
+The source is either bytes or a seekable file object; a file is decoded
+from disk by Pillow instead of being read into memory first. The output
+and the thumbnail are written to the blob store. Results are cached by the
+SHA-256 of the source bytes together with the settings, so a re-sent or
+forwarded image is not processed twice.
+
+Pillow is optional. Without it, or for images it cannot decode (and for
+animated GIFs), the original bytes are stored unchanged and no thumbnail
+is produced.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import io
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+from typing import BinaryIO
+
+from app.services.blob_store import blob_store
+
+logger = logging.getLogger(__name__)
+
+IMAGE_MAX_EDGE = int(os.getenv("IMAGE_MAX_EDGE", "1568"))
+IMAGE_THUMB_EDGE = int(os.getenv("IMAGE_THUMB_EDGE", "320"))
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "80"))
+IMAGE_OUTPUT_FORMAT = os.getenv("IMAGE_OUTPUT_FORMAT", "webp").lower()
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+# Processed results remembered per source hash
+IMAGE_CACHE_SIZE = 1024
+_CHUNK_SIZE = 64 * 1024
+
+_FORMATS = {"webp": ("WEBP", "image/webp"), "jpeg": ("JPEG", "image/jpeg")}
+
+_image_executor = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix="image-pipeline")
+
+
+@dataclass(frozen=True)
+class ProcessedImage:
+    digest: str
+    media_type: str
+    width: int | None
+    height: int | None
+    thumb_digest: str | None
+    thumb_media_type: str | None
+    source_bytes: int
+    output_bytes: int
+
+
+_cache: OrderedDict[tuple, ProcessedImage] = OrderedDict()
+_cache_lock = threading.Lock()
+_pillow_warned = False
+
+
+def _settings_key(max_edge: int, output_format: str, quality: int) -> tuple:
+    return (max_edge, output_format, quality, IMAGE_THUMB_EDGE)
+
+
+def _encode(img, output_format: str, quality: int) -> tuple[bytes, str]:
+    pil_format, media_type = _FORMATS.get(output_format, _FORMATS["webp"])
+    if pil_format == "JPEG" and img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    buf = io.BytesIO()
+    if pil_format == "WEBP":
+        img.save(buf, format="WEBP", quality=quality, method=4)
+    else:
+        img.save(buf, format="JPEG", quality=quality, optimize=True, progressive=True)
+    return buf.getvalue(), media_type
+
+
+def _chunks(fileobj: BinaryIO):
+    fileobj.seek(0)
+    while chunk := fileobj.read(_CHUNK_SIZE):
+        yield chunk
+
+
+def _hash_file(fileobj: BinaryIO) -> str:
+    hasher = hashlib.sha256()
+    for chunk in _chunks(fileobj):
+        hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def _store_original(fileobj: BinaryIO) -> str:
+    return blob_store.put_stream(_chunks(fileobj))
+
+
+def _passthrough(fileobj: BinaryIO, size: int, media_type: str) -> ProcessedImage:
+    return ProcessedImage(
+        digest=_store_original(fileobj),
+        media_type=media_type,
+        width=None,
+        height=None,
+        thumb_digest=None,
+        thumb_media_type=None,
+        source_bytes=size,
+        output_bytes=size,
+    )
+
+
+def _process(
+    fileobj: BinaryIO, media_type: str, max_edge: int, output_format: str, quality: int
+) -> ProcessedImage:
+    global _pillow_warned
+    size = fileobj.seek(0, io.SEEK_END)
+    fileobj.seek(0)
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        if not _pillow_warned:
+            logger.warning("Pillow not installed, images are stored without normalization")
+            _pillow_warned = True
+        return _passthrough(fileobj, size, media_type)
+
+    try:
+        img = Image.open(fileobj)
+        if getattr(img, "is_animated", False):
+            return _passthrough(fileobj, size, media_type)
+        source_size = img.size
+        orientation = img.getexif().get(0x0112, 1)
+        if img.format == "JPEG":
+            # Let libjpeg decode at a reduced scale instead of full size
+            img.draft("RGB", (max_edge, max_edge))
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ("RGB", "RGBA", "L"):
+            img = img.convert("RGBA" if "A" in img.getbands() or "transparency" in img.info else "RGB")
+        img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+        output, out_type = _encode(img, output_format, quality)
+        keep_original = (
+            len(output) >= size
+            and img.size == source_size
+            and orientation == 1
+            and media_type in ("image/jpeg", "image/png", "image/webp")
+        )
+
+        thumb = img.copy()
+        thumb.thumbnail((IMAGE_THUMB_EDGE, IMAGE_THUMB_EDGE), Image.LANCZOS)
+        thumb_bytes, thumb_type = _encode(thumb, output_format, min(quality, 70))
+    except Exception as exc:
+        logger.warning("Image normalization failed (%s), storing original", exc)
+        return _passthrough(fileobj, size, media_type)
+
+    if keep_original:
+        # Already small and upright; re-encoding would only grow it
+        digest, out_type, output_bytes = _store_original(fileobj), media_type, size
+    else:
+        digest, output_bytes = blob_store.put(output), len(output)
+    return ProcessedImage(
+        digest=digest,
+        media_type=out_type,
+        width=img.width,
+        height=img.height,
+        thumb_digest=blob_store.put(thumb_bytes),
+        thumb_media_type=thumb_type,
+        source_bytes=size,
+        output_bytes=output_bytes,
+    )
+
+
+def process_image_sync(
+    source: bytes | BinaryIO,
+    media_type: str = "image/jpeg",
+    *,
+    source_digest: str | None = None,
+    max_edge: int = IMAGE_MAX_EDGE,
+    output_format: str = IMAGE_OUTPUT_FORMAT,
+    quality: int = IMAGE_QUALITY,
+) -> ProcessedImage:
+    """Normalize ``source``, store the result and its thumbnail; cached by source hash.
+
+    ``source_digest`` is the SHA-256 of the source when the caller already has it.
+    """
+    fileobj = io.BytesIO(source) if isinstance(source, bytes) else source
+    if source_digest is None:
+        source_digest = _hash_file(fileobj)
+    key = (source_digest, *_settings_key(max_edge, output_format, quality))
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached is not None:
+            _cache.move_to_end(key)
+    if cached is not None and blob_store.exists(cached.digest):
+        return cached
+
+    result = _process(fileobj, media_type, max_edge, output_format, quality)
+    with _cache_lock:
+        _cache[key] = result
+        _cache.move_to_end(key)
+        while len(_cache) > IMAGE_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return result
+
+
+async def process_image(
+    source: bytes | BinaryIO, media_type: str = "image/jpeg", source_digest: str | None = None
+) -> ProcessedImage:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _image_executor, partial(process_image_sync, source, media_type, source_digest=source_digest),
+    )
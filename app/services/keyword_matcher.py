@@ -0,0 +1,81 @@
+"""Multi-keyword matching with an Aho-Corasick automaton.
+
+Keywords and text go through the same normalization (NFKC, so full-width
+Latin letters, digits and punctuation match their ASCII forms, then
+casefold), after which all keywords are found in a single pass over the
+text regardless of how many there are.
+"""
+
+from __future__ import annotations
+
+import unicodedata
+from collections import deque
+from collections.abc import Iterable
+
+
+def normalize_text(text: str) -> str:
+    return unicodedata.normalize("NFKC", text).casefold()
+
+
+class KeywordAutomaton:
+    """Aho-Corasick automaton over normalized keywords.
+
+    ``find(text)`` returns the indices (into the ``keywords`` passed to the
+    constructor) of every keyword occurring in ``text``. Empty keywords
+    never match.
+    """
+
+    def __init__(self, keywords: Iterable[str]) -> None:
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._out: list[tuple[int, ...]] = [()]
+        self.size = 0
+        for index, keyword in enumerate(keywords):
+            self.size += 1
+            self._add(normalize_text(keyword.strip()), index)
+        self._link()
+
+    def _add(self, keyword: str, index: int) -> None:
+        if not keyword:
+            return
+        node = 0
+        for char in keyword:
+            nxt = self._goto[node].get(char)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][char] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+            node = nxt
+        self._out[node] += (index,)
+
+    def _link(self) -> None:
+        # Breadth-first: a node's failure link points at its longest proper
+        # suffix in the trie; outputs are merged along the link.
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(char, 0)
+                self._fail[child] = target if target != child else 0
+                if self._out[self._fail[child]]:
+                    self._out[child] += self._out[self._fail[child]]
+
+    def find(self, text: str, normalized: bool = False) -> set[int]:
+        if not normalized:
+            text = normalize_text(text)
+        goto, fail, out = self._goto, self._fail, self._out
+        found: set[int] = set()
+        node = 0
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if out[node]:
+                found.update(out[node])
+        return found
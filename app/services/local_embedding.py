@@ -0,0 +1,199 @@
+"""In-process embedding and rerank backends (no network).
+
+Selected with ``EMBEDDING_BACKEND`` (see ``embedding_service``):
+
+- ``local``: an ONNX Runtime export of the embedding model (bge-m3 by
+  default, 1024-dim CLS pooling) loaded from ``LOCAL_EMBEDDING_MODEL_DIR``
+  (``model.onnx`` + ``tokenizer.json``). Texts are sorted by length and run
+  in batches of ``LOCAL_EMBEDDING_BATCH`` on a small thread pool; ONNX
+  sessions are safe to call concurrently. Rerank uses a cross-encoder
+  export from ``LOCAL_RERANK_MODEL_DIR`` when set, otherwise score fusion
+  of embedding similarity and character-bigram overlap.
+- ``hashing``: deterministic feature-hashed character n-gram vectors, for
+  offline tests and benchmarks. Pure Python, no model files.
+
+onnxruntime, tokenizers and numpy are optional and imported on first use.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_DIM = 1024
+LOCAL_EMBEDDING_BATCH = int(os.getenv("LOCAL_EMBEDDING_BATCH", "16"))
+LOCAL_EMBEDDING_THREADS = int(os.getenv("LOCAL_EMBEDDING_THREADS", "2"))
+LOCAL_EMBEDDING_MAX_TOKENS = int(os.getenv("LOCAL_EMBEDDING_MAX_TOKENS", "512"))
+# Weight of embedding cosine vs. bigram overlap in the fusion reranker
+FUSION_VECTOR_WEIGHT = 0.7
+
+
+# ── Rerank helpers ──
+
+def _bigrams(text: str) -> set[str]:
+    text = "".join(text.casefold().split())
+    if len(text) < 2:
+        return {text} if text else set()
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+def _cosine(a: list[float], b: list[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+def fusion_scores(query: str, documents: list[str], vectors: list[list[float]] | None) -> list[float]:
+    """Embedding cosine fused with character-bigram coverage of the query.
+
+    Bigrams rather than words so Chinese text needs no segmenter. With no
+    vectors, the lexical score is used alone.
+    """
+    query_grams = _bigrams(query)
+    lexical = [
+        len(query_grams & _bigrams(doc)) / len(query_grams) if query_grams else 0.0
+        for doc in documents
+    ]
+    if not vectors:
+        return lexical
+    query_vector, doc_vectors = vectors[0], vectors[1:]
+    return [
+        FUSION_VECTOR_WEIGHT * _cosine(query_vector, vec) + (1 - FUSION_VECTOR_WEIGHT) * lex
+        for vec, lex in zip(doc_vectors, lexical)
+    ]
+
+
+def rank_results(scores: list[float], top_n: int) -> list[dict[str, Any]]:
+    """Scores in the remote rerank response shape, best first."""
+    order = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)[:top_n]
+    return [{"index": i, "relevance_score": float(scores[i])} for i in order]
+
+
+# ── Hashing backend ──
+
+class HashingEmbeddingBackend:
+    name = "hashing"
+
+    def __init__(self, dim: int = EMBEDDING_DIM) -> None:
+        self.dim = dim
+
+    def embed(self, texts: list[str], deadline: float | None = None) -> list[list[float]]:
+        return [self._embed_one(text) for text in texts]
+
+    def rerank(
+        self, query: str, documents: list[str], top_n: int, deadline: float | None = None
+    ) -> list[dict[str, Any]]:
+        vectors = self.embed([query, *documents])
+        return rank_results(fusion_scores(query, documents, vectors), top_n)
+
+    def _embed_one(self, text: str) -> list[float]:
+        vector = [0.0] * self.dim
+        text = "".join(text.casefold().split())
+        grams = [text[i:i + n] for n in (1, 2, 3) for i in range(len(text) - n + 1)]
+        for gram in grams:
+            digest = hashlib.blake2b(gram.encode("utf-8"), digest_size=8).digest()
+            index = int.from_bytes(digest[:4], "little") % self.dim
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+        return [x / norm for x in vector]
+
+
+# ── ONNX backend ──
+
+class _OnnxModel:
+    """ONNX session + tokenizer from ``model_dir``; raises if unavailable."""
+
+    def __init__(self, model_dir: Path) -> None:
+        import numpy as np
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self.np = np
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = int(os.getenv("LOCAL_EMBEDDING_INTRA_THREADS", "0"))
+        self.session = ort.InferenceSession(
+            str(model_dir / "model.onnx"), sess_options=options, providers=["CPUExecutionProvider"],
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.output_names = [o.name for o in self.session.get_outputs()]
+        self.tokenizer = Tokenizer.from_file(str(model_dir / "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=LOCAL_EMBEDDING_MAX_TOKENS)
+        self.tokenizer.enable_padding()
+
+    def run(self, batch: list[Any]) -> Any:
+        encodings = self.tokenizer.encode_batch(batch)
+        feeds = {
+            "input_ids": self.np.array([e.ids for e in encodings], dtype=self.np.int64),
+            "attention_mask": self.np.array([e.attention_mask for e in encodings], dtype=self.np.int64),
+        }
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = self.np.array([e.type_ids for e in encodings], dtype=self.np.int64)
+        feeds = {k: v for k, v in feeds.items() if k in self.input_names}
+        return dict(zip(self.output_names, self.session.run(None, feeds)))
+
+
+class OnnxEmbeddingBackend:
+    name = "local"
+
+    def __init__(self, model_dir: str, rerank_model_dir: str | None = None) -> None:
+        self._model = _OnnxModel(Path(model_dir))
+        self._reranker: _OnnxModel | None = None
+        if rerank_model_dir:
+            try:
+                self._reranker = _OnnxModel(Path(rerank_model_dir))
+            except Exception as exc:
+                logger.warning("[embedding] Local reranker unavailable, using score fusion: %s", exc)
+        self._executor = ThreadPoolExecutor(
+            max_workers=LOCAL_EMBEDDING_THREADS, thread_name_prefix="local-embedding",
+        )
+        logger.info(
+            "[embedding] Local ONNX backend loaded from %s (reranker: %s)",
+            model_dir, rerank_model_dir if self._reranker else "score fusion",
+        )
+
+    def embed(self, texts: list[str], deadline: float | None = None) -> list[list[float]]:
+        if not texts:
+            return []
+        # Similar lengths per batch keep padding small
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        batches = [order[i:i + LOCAL_EMBEDDING_BATCH] for i in range(0, len(order), LOCAL_EMBEDDING_BATCH)]
+        futures = [
+            self._executor.submit(self._embed_batch, [texts[i] for i in batch]) for batch in batches
+        ]
+        vectors: list[list[float]] = [[] for _ in texts]
+        for batch, future in zip(batches, futures):
+            for i, vector in zip(batch, future.result()):
+                vectors[i] = vector
+        return vectors
+
+    def rerank(
+        self, query: str, documents: list[str], top_n: int, deadline: float | None = None
+    ) -> list[dict[str, Any]]:
+        if self._reranker is None:
+            vectors = self.embed([query, *documents])
+            return rank_results(fusion_scores(query, documents, vectors), top_n)
+        scores: list[float] = []
+        for start in range(0, len(documents), LOCAL_EMBEDDING_BATCH):
+            chunk = documents[start:start + LOCAL_EMBEDDING_BATCH]
+            outputs = self._reranker.run([(query, doc) for doc in chunk])
+            logits = outputs[self._reranker.output_names[0]].reshape(len(chunk), -1)[:, -1]
+            scores.extend(float(s) for s in 1 / (1 + self._reranker.np.exp(-logits)))
+        return rank_results(scores, top_n)
+
+    def _embed_batch(self, batch: list[str]) -> list[list[float]]:
+        np = self._model.np
+        outputs = self._model.run(batch)
+        # Exports that already pool (e.g. "sentence_embedding"/"dense_vecs") are used as-is;
+        # otherwise CLS pooling of the last hidden state, as bge models are trained
+        pooled = next((outputs[k] for k in ("sentence_embedding", "dense_vecs") if k in outputs), None)
+        if pooled is None:
+            pooled = outputs[self._model.output_names[0]][:, 0]
+        pooled = pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled.astype(np.float32).tolist()
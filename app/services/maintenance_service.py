@@ -1,16 +1,96 @@
 from __future__ import annotations
 
+import asyncio
+import json
 import logging
-import math
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
+from typing import Any
 
 from sqlalchemy import text
 from sqlalchemy.orm import Session
 
-from app.models.models import Memory
+from app.activity_tracker import activity_tracker
+from app.models.models import Memory, SessionSummary, Settings
+from app.services.memory_scoring import decayed_score_column
 
 logger = logging.getLogger(__name__)
 
+MERGE_CURSOR_KEY = "maintenance_merge_cursor"
+STAGE_STATE_KEY_PREFIX = "maintenance_stage_"
+
+# Background scheduler tuning: only work after this much quiet time, in slices
+# of at most SLICE_SECONDS, checking for due stages every TICK_SECONDS.
+IDLE_SECONDS = 300
+SLICE_SECONDS = 5.0
+TICK_SECONDS = 60
+
+
+@dataclass(frozen=True)
+class MaintenanceStage:
+    name: str
+    # Minimum time between the end of one full pass and the start of the next
+    interval: timedelta
+
+
+MAINTENANCE_STAGES: tuple[MaintenanceStage, ...] = (
+    MaintenanceStage("expiry", timedelta(hours=6)),
+    MaintenanceStage("merge", timedelta(minutes=30)),
+    MaintenanceStage("trash", timedelta(hours=24)),
+    MaintenanceStage("summary_embeddings", timedelta(hours=1)),
+)
+
+
+@dataclass(frozen=True)
+class PurgeTarget:
+    table: str
+    # Statements run with :ids before the batch is deleted, for rows that reference it
+    cascade: tuple[str, ...] = ()
+
+
+PURGE_TARGETS: dict[str, PurgeTarget] = {
+    "memories": PurgeTarget(
+        "memories",
+        (
+            "DELETE FROM pending_memories WHERE memory_id = ANY(:ids)",
+            "UPDATE pending_memories SET related_memory_id = NULL WHERE related_memory_id = ANY(:ids)",
+        ),
+    ),
+    "session_summaries": PurgeTarget(
+        "session_summaries",
+        (
+            "UPDATE pending_memories SET summary_id = NULL WHERE summary_id = ANY(:ids)",
+            "UPDATE core_block_candidates SET source_summary_id = NULL WHERE source_summary_id = ANY(:ids)",
+        ),
+    ),
+    "diary": PurgeTarget("diary"),
+}
+
+
+class _UnionFind:
+    def __init__(self) -> None:
+        self.parent: dict[int, int] = {}
+
+    def find(self, node: int) -> int:
+        parent = self.parent.setdefault(node, node)
+        if parent != node:
+            parent = self.parent[node] = self.find(parent)
+        return parent
+
+    def union(self, a: int, b: int) -> None:
+        root_a = self.find(a)
+        root_b = self.find(b)
+        if root_a != root_b:
+            self.parent[root_b] = root_a
+
+    def groups(self) -> list[list[int]]:
+        clusters: dict[int, list[int]] = {}
+        for node in self.parent:
+            clusters.setdefault(self.find(node), []).append(node)
+        return list(clusters.values())
+
 
 class MaintenanceService:
     def __init__(self, db: Session) -> None:
@@ -18,134 +98,446 @@ class MaintenanceService:
 
     def cleanup_expired_memories(self, threshold: float = 0.05) -> int:
         now_utc = datetime.now(timezone.utc)
-        candidates = (
+        deleted_count = (
             self.db.query(Memory)
             .filter(
                 Memory.klass.in_(["ephemeral", "task"]),
                 Memory.deleted_at.is_(None),
                 Memory.is_pending.is_(False),
+                Memory.created_at.isnot(None),
+                decayed_score_column(now_utc) < threshold,
             )
-            .all()
+            .update({Memory.deleted_at: now_utc}, synchronize_session=False)
         )
-        deleted_count = 0
-        for memory in candidates:
-            created_at = memory.created_at
-            if created_at is None:
-                continue
-            if created_at.tzinfo is None:
-                created_at = created_at.replace(tzinfo=timezone.utc)
-            else:
-                created_at = created_at.astimezone(timezone.utc)
-
-            last_access_ts = memory.last_access_ts
-            if last_access_ts is not None:
-                if last_access_ts.tzinfo is None:
-                    last_access_ts = last_access_ts.replace(tzinfo=timezone.utc)
-                else:
-                    last_access_ts = last_access_ts.astimezone(timezone.utc)
-                age_base = last_access_ts
-            else:
-                age_base = created_at
+        self.db.commit()
+        return deleted_count
 
-            age_days = (now_utc - age_base).total_seconds() / 86400.0
-            base = min(
-                max((memory.importance or 0.5) + (memory.manual_boost or 0.0), 0.0), 1.0
+    def cleanup_expired_memories_step(
+        self,
+        threshold: float = 0.05,
+        after_id: int = 0,
+        batch_size: int = 500,
+    ) -> dict[str, Any]:
+        """Expire decayed memories among the next ``batch_size`` candidates by id."""
+        now_utc = datetime.now(timezone.utc)
+        candidate_ids = [
+            row.id
+            for row in self.db.query(Memory.id)
+            .filter(
+                Memory.id > after_id,
+                Memory.klass.in_(["ephemeral", "task"]),
+                Memory.deleted_at.is_(None),
+                Memory.is_pending.is_(False),
+                Memory.created_at.isnot(None),
             )
-            halflife = memory.halflife_days or 60.0
-            boost = 1 + 0.35 * math.log(1 + (memory.hits or 0))
-            decayed_score = (
-                base * math.exp(-math.log(2) / halflife * age_days) * boost
+            .order_by(Memory.id)
+            .limit(batch_size)
+            .all()
+        ]
+        deleted_count = 0
+        if candidate_ids:
+            deleted_count = (
+                self.db.query(Memory)
+                .filter(
+                    Memory.id.in_(candidate_ids),
+                    decayed_score_column(now_utc) < threshold,
+                )
+                .update({Memory.deleted_at: now_utc}, synchronize_session=False)
             )
-            if decayed_score < threshold:
-                memory.deleted_at = now_utc
-                deleted_count += 1
+        self.db.commit()
+        return {
+            "processed": len(candidate_ids),
+            "deleted": deleted_count,
+            "last_id": candidate_ids[-1] if candidate_ids else after_id,
+            "done": len(candidate_ids) < batch_size,
+        }
 
+    def embed_missing_summaries_step(
+        self, after_id: int = 0, batch_size: int = 20,
+    ) -> dict[str, Any]:
+        """Backfill embeddings for the next ``batch_size`` unembedded summaries by id."""
+        from app.services.embedding_service import EmbeddingService
+
+        rows = (
+            self.db.query(SessionSummary.id, SessionSummary.summary_content)
+            .filter(
+                SessionSummary.id > after_id,
+                SessionSummary.embedding.is_(None),
+                SessionSummary.deleted_at.is_(None),
+            )
+            .order_by(SessionSummary.id)
+            .limit(batch_size)
+            .all()
+        )
+        # Release the pooled connection while the embedding API is called
         self.db.commit()
-        return deleted_count
 
-    def merge_similar_memories(self, similarity_threshold: float = 0.90) -> int:
-        pair_rows = self.db.execute(
+        embeddings: dict[int, list[float]] = {}
+        if rows:
+            pending = [row for row in rows if row.summary_content]
+            vectors = EmbeddingService().get_embeddings([row.summary_content for row in pending])
+            for row, vector in zip(pending, vectors):
+                if vector is not None:
+                    embeddings[row.id] = vector
+        for summary_id, vector in embeddings.items():
+            self.db.query(SessionSummary).filter(
+                SessionSummary.id == summary_id,
+                SessionSummary.embedding.is_(None),
+            ).update({SessionSummary.embedding: vector}, synchronize_session=False)
+        self.db.commit()
+        return {
+            "processed": len(rows),
+            "embedded": len(embeddings),
+            "last_id": rows[-1].id if rows else after_id,
+            "done": len(rows) < batch_size,
+        }
+
+    def _read_cursor(self, key: str) -> dict[str, Any]:
+        row = self.db.query(Settings).filter(Settings.key == key).first()
+        if not row or not row.value:
+            return {}
+        try:
+            value = json.loads(row.value)
+        except Exception:
+            logger.warning("Invalid maintenance cursor %s, resetting", key)
+            return {}
+        return value if isinstance(value, dict) else {}
+
+    def _write_cursor(self, key: str, value: dict[str, Any]) -> None:
+        payload = json.dumps(value, ensure_ascii=False)
+        row = self.db.query(Settings).filter(Settings.key == key).first()
+        if row:
+            row.value = payload
+            row.updated_at = datetime.now(timezone.utc)
+        else:
+            self.db.add(Settings(key=key, value=payload))
+
+    def merge_similar_memories_step(
+        self,
+        similarity_threshold: float = 0.90,
+        batch_size: int = 100,
+        neighbors: int = 5,
+    ) -> dict[str, Any]:
+        """Dedup one batch of new or changed memories against their nearest neighbours.
+
+        New memories are walked by id above the persisted watermark; once caught
+        up, memories updated since the last pass are walked by (updated_at, id).
+        Each probe is a K-nearest-neighbour lookup through the embedding ANN
+        index, near-duplicates are clustered with union-find and every cluster
+        keeps only its newest member.
+        """
+        cursor = self._read_cursor(MERGE_CURSOR_KEY)
+        last_id = int(cursor.get("last_id") or 0)
+        changed_ts = cursor.get("changed_ts")
+        changed_id = int(cursor.get("changed_id") or 0)
+
+        phase = "new"
+        batch = self.db.execute(
             text(
                 """
-SELECT a.id AS id_a,
-       b.id AS id_b,
-       a.created_at AS created_at_a,
-       b.created_at AS created_at_b,
-       1 - (a.embedding <=> b.embedding) AS similarity
-FROM memories a
-JOIN memories b ON a.id < b.id
-WHERE a.embedding IS NOT NULL
-  AND b.embedding IS NOT NULL
-  AND a.deleted_at IS NULL
-  AND b.deleted_at IS NULL
-  AND a.is_pending = FALSE
-  AND b.is_pending = FALSE
-  AND 1 - (a.embedding <=> b.embedding) > :threshold
-ORDER BY similarity DESC
-LIMIT 50
+SELECT id, updated_at
+FROM memories
+WHERE id > :last_id
+  AND embedding IS NOT NULL
+  AND deleted_at IS NULL
+  AND is_pending = FALSE
+ORDER BY id
+LIMIT :batch_size
 """
             ),
-            {"threshold": similarity_threshold},
+            {"last_id": last_id, "batch_size": batch_size},
         ).all()
+        if not batch:
+            phase = "changed"
+            if changed_ts is None:
+                # First full pass: everything up to the watermark was just probed.
+                changed_ts = datetime.now(timezone.utc).isoformat()
+            batch = self.db.execute(
+                text(
+                    """
+SELECT id, updated_at
+FROM memories
+WHERE id <= :last_id
+  AND updated_at IS NOT NULL
+  AND (updated_at, id) > (CAST(:changed_ts AS TIMESTAMPTZ), :changed_id)
+  AND embedding IS NOT NULL
+  AND deleted_at IS NULL
+  AND is_pending = FALSE
+ORDER BY updated_at, id
+LIMIT :batch_size
+"""
+                ),
+                {
+                    "last_id": last_id,
+                    "changed_ts": changed_ts,
+                    "changed_id": changed_id,
+                    "batch_size": batch_size,
+                },
+            ).all()
 
-        deleted_ids: set[int] = set()
-        deleted_count = 0
-        for row in pair_rows:
-            id_a = row.id_a
-            id_b = row.id_b
-            if id_a in deleted_ids or id_b in deleted_ids:
-                continue
+        probe_ids = [row.id for row in batch]
+        merged = 0
+        if probe_ids:
+            edge_rows = self.db.execute(
+                text(
+                    """
+SELECT src.id AS src_id,
+       src.created_at AS src_created_at,
+       nb.id AS nb_id,
+       nb.created_at AS nb_created_at
+FROM memories src
+CROSS JOIN LATERAL (
+    SELECT n.id, n.created_at, n.embedding <=> src.embedding AS distance
+    FROM memories n
+    WHERE n.id <> src.id
+      AND n.embedding IS NOT NULL
+      AND n.deleted_at IS NULL
+      AND n.is_pending = FALSE
+    ORDER BY n.embedding <=> src.embedding
+    LIMIT :neighbors
+) nb
+WHERE src.id = ANY(:probe_ids)
+  AND src.deleted_at IS NULL
+  AND 1 - nb.distance > :threshold
+"""
+                ),
+                {
+                    "probe_ids": probe_ids,
+                    "neighbors": neighbors,
+                    "threshold": similarity_threshold,
+                },
+            ).all()
 
-            created_at_a = row.created_at_a
-            created_at_b = row.created_at_b
-            if created_at_a is None or created_at_b is None:
-                delete_id = id_a if id_a < id_b else id_b
-            else:
-                if created_at_a.tzinfo is None:
-                    created_at_a = created_at_a.replace(tzinfo=timezone.utc)
-                else:
-                    created_at_a = created_at_a.astimezone(timezone.utc)
-                if created_at_b.tzinfo is None:
-                    created_at_b = created_at_b.replace(tzinfo=timezone.utc)
-                else:
-                    created_at_b = created_at_b.astimezone(timezone.utc)
-
-                if created_at_a < created_at_b:
-                    delete_id = id_a
-                elif created_at_b < created_at_a:
-                    delete_id = id_b
-                else:
-                    delete_id = id_a if id_a < id_b else id_b
-
-            memory = self.db.get(Memory, delete_id)
-            if not memory:
-                deleted_ids.add(delete_id)
-                continue
+            uf = _UnionFind()
+            created: dict[int, datetime] = {}
+            epoch = datetime.min.replace(tzinfo=timezone.utc)
+            for row in edge_rows:
+                created[row.src_id] = self._to_utc(row.src_created_at) or epoch
+                created[row.nb_id] = self._to_utc(row.nb_created_at) or epoch
+                uf.union(row.src_id, row.nb_id)
 
-            memory.deleted_at = datetime.now(timezone.utc)
-            deleted_ids.add(delete_id)
-            deleted_count += 1
+            delete_ids: list[int] = []
+            for group in uf.groups():
+                if len(group) < 2:
+                    continue
+                # Keep the newest memory of each cluster (ties: highest id)
+                keep_id = max(group, key=lambda mid: (created[mid], mid))
+                delete_ids.extend(mid for mid in group if mid != keep_id)
+
+            if delete_ids:
+                merged = (
+                    self.db.query(Memory)
+                    .filter(Memory.id.in_(delete_ids), Memory.deleted_at.is_(None))
+                    .update({Memory.deleted_at: datetime.now(timezone.utc)}, synchronize_session=False)
+                )
+
+            if phase == "new":
+                last_id = probe_ids[-1]
+            else:
+                tail = batch[-1]
+                changed_ts = self._to_utc(tail.updated_at).isoformat()
+                changed_id = tail.id
 
+        done = not probe_ids or (phase == "changed" and len(probe_ids) < batch_size)
+        self._write_cursor(
+            MERGE_CURSOR_KEY,
+            {"last_id": last_id, "changed_ts": changed_ts, "changed_id": changed_id},
+        )
         self.db.commit()
-        return deleted_count
+        if merged:
+            logger.info(
+                "[merge_similar] %s batch: probed=%d merged=%d (last_id=%s)",
+                phase, len(probe_ids), merged, last_id,
+            )
+        return {
+            "phase": phase,
+            "processed": len(probe_ids),
+            "merged": merged,
+            "last_id": last_id,
+            "done": done,
+        }
 
-    def cleanup_trash(self, retention_days: int = 30) -> int:
-        cutoff = datetime.now(timezone.utc) - timedelta(days=retention_days)
-        rows = (
-            self.db.query(Memory)
-            .filter(
-                Memory.deleted_at.is_not(None),
-                Memory.deleted_at < cutoff,
+    def merge_similar_memories(
+        self,
+        similarity_threshold: float = 0.90,
+        time_budget_seconds: float | None = None,
+        batch_size: int = 100,
+    ) -> int:
+        """Run incremental dedup batches until caught up or out of time budget."""
+        deadline = (
+            time.monotonic() + time_budget_seconds if time_budget_seconds is not None else None
+        )
+        merged = 0
+        while True:
+            progress = self.merge_similar_memories_step(
+                similarity_threshold=similarity_threshold, batch_size=batch_size,
             )
-            .all()
+            merged += progress["merged"]
+            if progress["done"]:
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+        return merged
+
+    @staticmethod
+    def _to_utc(value: datetime | None) -> datetime | None:
+        if value is None:
+            return None
+        if value.tzinfo is None:
+            return value.replace(tzinfo=timezone.utc)
+        return value.astimezone(timezone.utc)
+
+    def purge_trash(
+        self,
+        target: str = "memories",
+        retention_days: int = 30,
+        batch_size: int = 500,
+        time_budget_seconds: float | None = None,
+    ) -> int:
+        """Permanently delete soft-deleted rows older than the retention period.
+
+        Works in chunks: each batch locks up to ``batch_size`` expired ids,
+        clears rows that reference them, deletes them with RETURNING and
+        commits, so no transaction stays open for the whole purge.
+        """
+        spec = PURGE_TARGETS.get(target)
+        if spec is None:
+            raise ValueError(f"Unknown purge target: {target}")
+        cutoff = datetime.now(timezone.utc) - timedelta(days=retention_days)
+        deadline = (
+            time.monotonic() + time_budget_seconds if time_budget_seconds is not None else None
+        )
+        select_sql = text(
+            f"SELECT id FROM {spec.table} "
+            "WHERE deleted_at IS NOT NULL AND deleted_at < :cutoff "
+            "ORDER BY id LIMIT :batch_size FOR UPDATE SKIP LOCKED"
         )
+        delete_sql = text(f"DELETE FROM {spec.table} WHERE id = ANY(:ids) RETURNING id")
+        cascade_sql = [text(stmt) for stmt in spec.cascade]
+
         deleted_count = 0
-        for row in rows:
-            self.db.delete(row)
-            deleted_count += 1
-        self.db.commit()
+        while True:
+            try:
+                ids = [
+                    row.id
+                    for row in self.db.execute(
+                        select_sql, {"cutoff": cutoff, "batch_size": batch_size}
+                    ).all()
+                ]
+                if not ids:
+                    self.db.commit()
+                    break
+                for stmt in cascade_sql:
+                    self.db.execute(stmt, {"ids": ids})
+                purged = self.db.execute(delete_sql, {"ids": ids}).all()
+                self.db.commit()
+            except Exception:
+                self.db.rollback()
+                raise
+            deleted_count += len(purged)
+            if len(ids) < batch_size:
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+        if deleted_count:
+            logger.info("[purge_trash] %s: purged %d rows", target, deleted_count)
         return deleted_count
 
+    def cleanup_trash(self, retention_days: int = 30) -> int:
+        return self.purge_trash("memories", retention_days=retention_days)
+
+    def get_stage_states(self) -> dict[str, dict[str, Any]]:
+        return {
+            stage.name: self._read_cursor(f"{STAGE_STATE_KEY_PREFIX}{stage.name}")
+            for stage in MAINTENANCE_STAGES
+        }
+
+    @staticmethod
+    def stage_is_due(stage: MaintenanceStage, state: dict[str, Any], now: datetime) -> bool:
+        if state.get("in_progress"):
+            return True
+        last_completed = state.get("last_completed_at")
+        if not last_completed:
+            return True
+        try:
+            completed_at = datetime.fromisoformat(last_completed)
+        except ValueError:
+            return True
+        return now - completed_at >= stage.interval
+
+    def run_stage_slice(
+        self,
+        stage_name: str,
+        time_budget_seconds: float = SLICE_SECONDS,
+        should_continue: Callable[[], bool] | None = None,
+    ) -> dict[str, Any]:
+        """Advance one maintenance stage by small batches within a time budget.
+
+        The stage's cursor and last-run stats are persisted after every batch,
+        so a slice interrupted by incoming traffic (``should_continue`` turning
+        false) or a restart resumes where it stopped.
+        """
+        key = f"{STAGE_STATE_KEY_PREFIX}{stage_name}"
+        state = self._read_cursor(key)
+        started = time.monotonic()
+        deadline = started + time_budget_seconds
+        processed = affected = batches = 0
+        done = False
+
+        while True:
+            if stage_name == "expiry":
+                progress = self.cleanup_expired_memories_step(
+                    after_id=int(state.get("cursor") or 0),
+                )
+                done = progress["done"]
+                state["cursor"] = 0 if done else progress["last_id"]
+                step_processed, step_affected = progress["processed"], progress["deleted"]
+            elif stage_name == "merge":
+                progress = self.merge_similar_memories_step()
+                done = progress["done"]
+                step_processed, step_affected = progress["processed"], progress["merged"]
+            elif stage_name == "summary_embeddings":
+                progress = self.embed_missing_summaries_step(
+                    after_id=int(state.get("cursor") or 0),
+                )
+                done = progress["done"]
+                state["cursor"] = 0 if done else progress["last_id"]
+                step_processed, step_affected = progress["processed"], progress["embedded"]
+            elif stage_name == "trash":
+                batch_size = 200
+                purged = self.purge_trash("memories", batch_size=batch_size, time_budget_seconds=0)
+                done = purged < batch_size
+                step_processed = step_affected = purged
+            else:
+                raise ValueError(f"Unknown maintenance stage: {stage_name}")
+
+            batches += 1
+            processed += step_processed
+            affected += step_affected
+            state["in_progress"] = not done
+            self._write_cursor(key, state)
+            self.db.commit()
+            if done or time.monotonic() >= deadline:
+                break
+            if should_continue is not None and not should_continue():
+                break
+
+        now_iso = datetime.now(timezone.utc).isoformat()
+        state.update(
+            {
+                "last_run_at": now_iso,
+                "last_duration_ms": int((time.monotonic() - started) * 1000),
+                "last_batches": batches,
+                "last_processed": processed,
+                "last_affected": affected,
+            }
+        )
+        if done:
+            state["last_completed_at"] = now_iso
+        self._write_cursor(key, state)
+        self.db.commit()
+        return {"stage": stage_name, "processed": processed, "affected": affected, "done": done}
+
     def run_all(self) -> dict[str, int]:
         result = {"expired_cleaned": 0, "similar_merged": 0, "trash_cleaned": 0}
 
@@ -168,3 +560,54 @@ LIMIT 50
             result["trash_cleaned"] = -1
 
         return result
+
+
+def _run_due_stage() -> dict[str, Any] | None:
+    from app.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        service = MaintenanceService(db)
+        now = datetime.now(timezone.utc)
+        states = service.get_stage_states()
+        for stage in MAINTENANCE_STAGES:
+            if not service.stage_is_due(stage, states.get(stage.name, {}), now):
+                continue
+            return service.run_stage_slice(
+                stage.name,
+                time_budget_seconds=SLICE_SECONDS,
+                should_continue=lambda: activity_tracker.is_idle(IDLE_SECONDS),
+            )
+        return None
+    finally:
+        db.close()
+
+
+async def maintenance_loop() -> None:
+    """Background loop running memory maintenance in short slices while idle.
+
+    Only one slice (one pooled DB connection) runs at a time, and nothing runs
+    until web chat and Telegram have been quiet for IDLE_SECONDS.
+    """
+    await asyncio.sleep(120)  # Startup delay
+    logger.info("[maintenance] Loop started")
+
+    while True:
+        try:
+            await asyncio.sleep(TICK_SECONDS)
+            if not activity_tracker.is_idle(IDLE_SECONDS):
+                continue
+            # Keep slicing while idle and something is due; yield between slices.
+            while activity_tracker.is_idle(IDLE_SECONDS):
+                result = await asyncio.to_thread(_run_due_stage)
+                if result is None:
+                    break
+                if result["affected"]:
+                    logger.info(
+                        "[maintenance] %s slice: processed=%d affected=%d done=%s",
+                        result["stage"], result["processed"], result["affected"], result["done"],
+                    )
+                await asyncio.sleep(1)
+        except Exception as e:
+            logger.exception("[maintenance] Loop error: %s", e)
+            await asyncio.sleep(TICK_SECONDS)
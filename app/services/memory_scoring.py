@@ -0,0 +1,110 @@
+"""Memory decay scoring shared by recall, maintenance and the memories API.
+
+The score is importance (+ manual boost, clamped to [0, 1]) decayed with the
+memory's half-life since its last access (or creation), multiplied by a
+logarithmic hit boost. The SQL function below is the canonical version used
+by set-based queries; ``compute_decayed_score`` mirrors it for single rows
+that are already loaded in Python.
+"""
+
+from __future__ import annotations
+
+import math
+from datetime import datetime, timezone
+
+from sqlalchemy import Float, func
+from sqlalchemy.sql.elements import ColumnElement
+
+from app.models.models import Memory
+
+# Exponent floor keeps exp() away from float8 underflow errors on very old rows.
+_MIN_EXPONENT = -700.0
+
+DECAYED_SCORE_FUNCTION_SQL = """
+CREATE OR REPLACE FUNCTION memory_decayed_score(
+    importance DOUBLE PRECISION,
+    manual_boost DOUBLE PRECISION,
+    hits INTEGER,
+    halflife_days DOUBLE PRECISION,
+    last_access_ts TIMESTAMPTZ,
+    created_at TIMESTAMPTZ,
+    now_ts TIMESTAMPTZ
+) RETURNS DOUBLE PRECISION
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+SELECT LEAST(GREATEST(COALESCE(NULLIF(importance, 0), 0.5) + COALESCE(manual_boost, 0), 0), 1)
+     * exp(GREATEST(
+           -ln(2::double precision) / COALESCE(NULLIF(halflife_days, 0), 60)
+           * GREATEST(
+               EXTRACT(EPOCH FROM (now_ts - COALESCE(last_access_ts, created_at, now_ts)))::double precision
+               / 86400.0,
+               0
+           ),
+           -700
+       ))
+     * (1 + 0.35 * ln(1 + COALESCE(hits, 0)::double precision))
+$$
+"""
+
+# Argument list for raw SQL queries selecting from ``memories``.
+DECAYED_SCORE_SQL = (
+    "memory_decayed_score(importance, manual_boost, hits, halflife_days, "
+    "last_access_ts, created_at, now())"
+)
+
+
+def decayed_score_column(now: datetime | None = None) -> ColumnElement[float]:
+    """SQLAlchemy expression computing a Memory row's decayed score in Postgres."""
+    now_expr = now if now is not None else func.now()
+    return func.memory_decayed_score(
+        Memory.importance,
+        Memory.manual_boost,
+        Memory.hits,
+        Memory.halflife_days,
+        Memory.last_access_ts,
+        Memory.created_at,
+        now_expr,
+        type_=Float,
+    )
+
+
+def _to_utc(value: datetime | None) -> datetime | None:
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def compute_decayed_score(
+    importance: float | None,
+    manual_boost: float | None,
+    hits: int | None,
+    halflife_days: float | None,
+    last_access_ts: datetime | None,
+    created_at: datetime | None,
+    now: datetime | None = None,
+) -> float:
+    """Python mirror of ``memory_decayed_score`` for rows already in memory."""
+    now_utc = _to_utc(now) or datetime.now(timezone.utc)
+    age_base = _to_utc(last_access_ts) or _to_utc(created_at)
+    if age_base is None:
+        age_days = 0.0
+    else:
+        age_days = max(0.0, (now_utc - age_base).total_seconds() / 86400.0)
+    base = min(max((importance or 0.5) + (manual_boost or 0.0), 0.0), 1.0)
+    halflife = halflife_days or 60.0
+    boost = 1 + 0.35 * math.log(1 + (hits or 0))
+    exponent = max(-math.log(2) / halflife * age_days, _MIN_EXPONENT)
+    return base * math.exp(exponent) * boost
+
+
+def memory_decayed_score(memory: Memory, now: datetime | None = None) -> float:
+    return compute_decayed_score(
+        memory.importance,
+        memory.manual_boost,
+        memory.hits,
+        memory.halflife_days,
+        memory.last_access_ts,
+        memory.created_at,
+        now,
+    )
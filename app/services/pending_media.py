@@ -0,0 +1,282 @@
+"""Pending image descriptions and file summaries, tracked as they are persisted.
+
+Previously every reply ran two COUNT queries (pending images, pending file
+summaries) to decide whether to start a thread, and ``describe_images``
+sent all of a session's images batch after batch while the summary lock
+was held. Now:
+
+- an ``after_insert`` listener on Message records new images and file
+  messages, and ``after_commit`` queues them in ``pending_media`` (queueing
+  never starts a description);
+- describing replaces an image with text, so an image is only described
+  once it leaves the active context (its message is summarized, or is in
+  the range a summary is about to cover): after a reply, full batches of
+  queued images that are already out of context are described in the
+  background, with up to ``IMAGE_DESCRIBE_CONCURRENCY`` batches (across
+  sessions) in flight;
+- ``describe_session`` (pre-summary, idle pre-summarization) dispatches
+  the images it needs as concurrent batches and waits for them together
+  with any batches already running for those images;
+- the post-reply file trigger checks an in-memory set instead of counting.
+
+The queue is rebuilt from the messages table on startup (``seed``);
+messages stay the source of truth, so a lost entry only delays work until
+the next summary picks it up.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Any
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.models.models import Message
+from app.services.image_description_service import IMAGE_BATCH_SIZE, describe_image_batch
+
+logger = logging.getLogger(__name__)
+
+IMAGE_DESCRIBE_CONCURRENCY = int(os.getenv("IMAGE_DESCRIBE_CONCURRENCY", "3"))
+# How long a summary waits for the descriptions it needs
+IMAGE_DESCRIBE_WAIT_SECONDS = 180
+
+_describe_executor = ThreadPoolExecutor(
+    max_workers=IMAGE_DESCRIBE_CONCURRENCY, thread_name_prefix="image-describe",
+)
+
+
+class PendingMediaQueue:
+    def __init__(self, batch_size: int = IMAGE_BATCH_SIZE) -> None:
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        # session_id -> queued image message ids, oldest first
+        self._images: dict[int, list[int]] = {}
+        # message_id -> future of the batch describing it
+        self._inflight: dict[int, Future] = {}
+        self._file_sessions: set[int] = set()
+
+    # ── Feeding ──
+
+    def add_images(self, session_id: int, message_ids: list[int]) -> None:
+        """Queue new images; they are described after they leave the active context."""
+        with self._lock:
+            queued = self._images.setdefault(session_id, [])
+            for message_id in message_ids:
+                if message_id not in queued and message_id not in self._inflight:
+                    queued.append(message_id)
+
+    def add_file_session(self, session_id: int) -> None:
+        with self._lock:
+            self._file_sessions.add(session_id)
+
+    def pop_file_session(self, session_id: int) -> bool:
+        """True (once) if the session has file messages awaiting summarization."""
+        with self._lock:
+            if session_id in self._file_sessions:
+                self._file_sessions.discard(session_id)
+                return True
+            return False
+
+    def seed(self) -> None:
+        """Rebuild the queue from messages still pending in the database."""
+        from app.database import SessionLocal
+
+        db: Session = SessionLocal()
+        try:
+            rows = db.execute(text(
+                "SELECT session_id, id, image_hash IS NOT NULL AS has_image "
+                "FROM messages WHERE image_hash IS NOT NULL "
+                "OR meta_info->>'needs_file_summary' = 'true' ORDER BY id"
+            )).all()
+        finally:
+            db.close()
+        images: dict[int, list[int]] = {}
+        with self._lock:
+            for row in rows:
+                if row.has_image:
+                    images.setdefault(row.session_id, []).append(row.id)
+                else:
+                    self._file_sessions.add(row.session_id)
+        for session_id, message_ids in images.items():
+            self.add_images(session_id, message_ids)
+        logger.info(
+            "[pending_media] Seeded %d images in %d sessions, %d sessions with files",
+            sum(len(ids) for ids in images.values()), len(images), len(self._file_sessions),
+        )
+
+    # ── Describing ──
+
+    def dispatch_ready(
+        self, session_factory: sessionmaker, session_id: int, assistant_id: int | None,
+    ) -> None:
+        """After a reply: start full batches of queued images whose messages are summarized.
+
+        Images still in the active context (unsummarized messages) are left
+        alone, so the model keeps seeing the pictures it is talking about.
+        """
+        with self._lock:
+            queued = list(self._images.get(session_id, ()))
+        if len(queued) < self.batch_size:
+            return
+        db: Session = session_factory()
+        try:
+            ready = {
+                row.id for row in db.query(Message.id).filter(
+                    Message.id.in_(queued),
+                    Message.summary_group_id.isnot(None),
+                    Message.image_hash.isnot(None),
+                ).all()
+            }
+        finally:
+            db.close()
+        if len(ready) >= self.batch_size:
+            self._dispatch(session_factory, session_id, assistant_id, full_only=True, only_ids=ready)
+
+    def _dispatch(
+        self,
+        session_factory: sessionmaker | None,
+        session_id: int,
+        assistant_id: int | None,
+        *,
+        full_only: bool,
+        only_ids: set[int] | None = None,
+    ) -> list[Future]:
+        if session_factory is None:
+            from app.database import SessionLocal
+            session_factory = SessionLocal
+        futures: list[Future] = []
+        with self._lock:
+            queued = self._images.get(session_id, [])
+            take = [i for i in queued if only_ids is None or i in only_ids]
+            if full_only:
+                take = take[: len(take) - len(take) % self.batch_size]
+            if not take:
+                return futures
+            taken = set(take)
+            rest = [i for i in queued if i not in taken]
+            if rest:
+                self._images[session_id] = rest
+            else:
+                self._images.pop(session_id, None)
+            for start in range(0, len(take), self.batch_size):
+                batch = take[start:start + self.batch_size]
+                future = _describe_executor.submit(
+                    self._run_batch, session_factory, session_id, assistant_id, batch,
+                )
+                for message_id in batch:
+                    self._inflight[message_id] = future
+                futures.append(future)
+        logger.info(
+            "[pending_media] session=%s: %d images in %d batches dispatched",
+            session_id, len(take), len(futures),
+        )
+        return futures
+
+    def _run_batch(
+        self,
+        session_factory: sessionmaker,
+        session_id: int,
+        assistant_id: int | None,
+        batch: list[int],
+    ) -> bool:
+        ok = False
+        try:
+            ok = describe_image_batch(session_factory, assistant_id, batch)
+            return ok
+        finally:
+            with self._lock:
+                for message_id in batch:
+                    self._inflight.pop(message_id, None)
+                if not ok:
+                    # Back to the front of the queue; retried with the next batch or summary
+                    queued = self._images.setdefault(session_id, [])
+                    self._images[session_id] = batch + [i for i in queued if i not in batch]
+
+    def describe_session(
+        self,
+        session_factory: sessionmaker,
+        session_id: int,
+        assistant_id: int | None,
+        message_ids: list[int] | None = None,
+    ) -> None:
+        """Describe pending images among ``message_ids`` and wait.
+
+        ``message_ids`` is the range a summary is about to cover. Without it,
+        only images of already-summarized messages are described; those in
+        the active context are kept.
+        """
+        db: Session = session_factory()
+        try:
+            query = db.query(Message.id).filter(
+                Message.session_id == session_id,
+                Message.image_hash.isnot(None),
+            )
+            if message_ids is not None:
+                query = query.filter(Message.id.in_(message_ids))
+            else:
+                query = query.filter(Message.summary_group_id.isnot(None))
+            pending = [row.id for row in query.order_by(Message.id.asc()).all()]
+        finally:
+            db.close()
+        if not pending:
+            return
+
+        wanted = set(pending)
+        with self._lock:
+            queued = self._images.setdefault(session_id, [])
+            for message_id in pending:
+                if message_id not in queued and message_id not in self._inflight:
+                    queued.append(message_id)
+            running = {self._inflight[i] for i in wanted if i in self._inflight}
+        futures = self._dispatch(
+            session_factory, session_id, assistant_id, full_only=False, only_ids=wanted,
+        )
+        done, not_done = wait([*running, *futures], timeout=IMAGE_DESCRIBE_WAIT_SECONDS)
+        if not_done:
+            logger.warning(
+                "[pending_media] session=%s: %d batches still running after %ds",
+                session_id, len(not_done), IMAGE_DESCRIBE_WAIT_SECONDS,
+            )
+
+
+pending_media = PendingMediaQueue()
+
+
+# ── Persist hooks ──
+
+@event.listens_for(Message, "after_insert")
+def _on_message_insert(mapper: Any, connection: Any, target: Message) -> None:
+    session = Session.object_session(target)
+    if session is None:
+        return
+    if target.image_hash:
+        session.info.setdefault("pending_images", []).append((target.session_id, target.id))
+    if (target.meta_info or {}).get("needs_file_summary"):
+        session.info.setdefault("pending_file_sessions", set()).add(target.session_id)
+
+
+@event.listens_for(Session, "after_commit")
+def _queue_after_commit(session: Session) -> None:
+    images = session.info.pop("pending_images", None)
+    file_sessions = session.info.pop("pending_file_sessions", None)
+    try:
+        for session_id in file_sessions or ():
+            pending_media.add_file_session(session_id)
+        if images:
+            by_session: dict[int, list[int]] = {}
+            for session_id, message_id in images:
+                by_session.setdefault(session_id, []).append(message_id)
+            for session_id, message_ids in by_session.items():
+                pending_media.add_images(session_id, message_ids)
+    except Exception:
+        logger.exception("[pending_media] Failed to queue persisted media")
+
+
+@event.listens_for(Session, "after_rollback")
+def _clear_after_rollback(session: Session) -> None:
+    session.info.pop("pending_images", None)
+    session.info.pop("pending_file_sessions", None)
@@ -0,0 +1,157 @@
+"""Idle-time pre-summarization.
+
+Without this, a session is only summarized after a reply pushes its
+unsummarized dialogue past ``dialogue_trigger_threshold``; until that
+summary lands every turn carries the oversized history. The loop here
+summarizes the part of a session that trimming would drop (everything
+older than the newest ``dialogue_retain_budget`` tokens) ahead of time:
+
+- when the session has been quiet for ``presummary_idle_minutes``, or
+- when it is close to the trigger threshold and no reply is in flight.
+
+Pending image descriptions of quiet sessions (images whose messages were
+already summarized) are handled in the same pass.
+Work runs one session at a time and never while a chat request is in
+flight, so it does not compete with live turns for provider rate limits.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import text
+
+from app.activity_tracker import activity_tracker
+from app.database import SessionLocal
+from app.services.backlog_summarizer import select_backlog_range
+from app.services.chat_service import (
+    DEFAULT_DIALOGUE_RETAIN_BUDGET,
+    DEFAULT_DIALOGUE_TRIGGER_THRESHOLD,
+    summarize_message_ids,
+)
+from app.services.image_description_service import describe_images
+from app.services.settings_store import settings_store
+
+logger = logging.getLogger(__name__)
+
+PRESUMMARY_TICK_SECONDS = 60
+DEFAULT_PRESUMMARY_IDLE_MINUTES = 10
+# Summarize early once unsummarized dialogue reaches this share of the threshold
+PRESUMMARY_NEAR_RATIO = 0.8
+# Even near the threshold, leave a session alone until it has been quiet this long
+PRESUMMARY_MIN_QUIET_SECONDS = 60
+# Not worth a summary call for less than this many tokens beyond the retain budget
+PRESUMMARY_MIN_TOKENS = 1000
+# Only sessions active this recently are considered
+PRESUMMARY_LOOKBACK = timedelta(days=3)
+# A session is not retried sooner than this (e.g. after a failed summary call)
+PRESUMMARY_RETRY_SECONDS = 900
+
+_CANDIDATES_SQL = text(
+    """
+SELECT s.id AS session_id, s.assistant_id,
+       MAX(m.created_at) AS last_at,
+       COALESCE(SUM(char_length(m.content)) FILTER (WHERE m.role IN ('user', 'assistant')), 0) AS chars,
+       (SELECT COUNT(*) FROM messages mi
+        WHERE mi.session_id = s.id AND mi.image_hash IS NOT NULL
+          AND mi.summary_group_id IS NOT NULL) AS images
+FROM sessions s
+JOIN messages m ON m.session_id = s.id AND m.summary_group_id IS NULL
+WHERE s.type = 'chat' AND s.assistant_id IS NOT NULL AND s.updated_at > :since
+GROUP BY s.id, s.assistant_id
+"""
+)
+
+
+@dataclass(frozen=True)
+class PresummaryJob:
+    session_id: int
+    assistant_id: int
+    # Messages to summarize (empty: only describe pending images)
+    message_ids: tuple[int, ...]
+    reason: str
+
+
+def _to_utc(value: datetime | None) -> datetime | None:
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def find_presummary_jobs(now: datetime | None = None) -> list[PresummaryJob]:
+    now = now or datetime.now(timezone.utc)
+    db = SessionLocal()
+    try:
+        snap = settings_store.snapshot(db)
+        retain_budget = snap.get_int("dialogue_retain_budget", DEFAULT_DIALOGUE_RETAIN_BUDGET)
+        trigger = snap.get_int("dialogue_trigger_threshold", DEFAULT_DIALOGUE_TRIGGER_THRESHOLD)
+        idle_after = timedelta(
+            minutes=snap.get_int("presummary_idle_minutes", DEFAULT_PRESUMMARY_IDLE_MINUTES)
+        )
+        min_quiet = timedelta(seconds=PRESUMMARY_MIN_QUIET_SECONDS)
+
+        jobs: list[PresummaryJob] = []
+        for row in db.execute(_CANDIDATES_SQL, {"since": now - PRESUMMARY_LOOKBACK}).all():
+            last_at = _to_utc(row.last_at)
+            quiet = now - last_at if last_at else idle_after
+            if quiet < min_quiet:
+                continue
+            idle = quiet >= idle_after
+            # chars × 1.5 bounds the token estimate from above (CJK is 1.5 tokens/char)
+            if row.chars * 1.5 >= retain_budget + PRESUMMARY_MIN_TOKENS:
+                message_ids, total = select_backlog_range(db, row.session_id, retain_budget)
+                near = total >= trigger * PRESUMMARY_NEAR_RATIO
+                if (idle or near) and total - retain_budget >= PRESUMMARY_MIN_TOKENS and message_ids:
+                    jobs.append(PresummaryJob(
+                        row.session_id, row.assistant_id, tuple(message_ids),
+                        "idle" if idle else "near_threshold",
+                    ))
+                    continue
+            if idle and row.images:
+                jobs.append(PresummaryJob(row.session_id, row.assistant_id, (), "images"))
+        return jobs
+    finally:
+        db.close()
+
+
+def run_presummary_job(job: PresummaryJob) -> None:
+    logger.info(
+        "[presummary] %s: session=%s, %d messages",
+        job.reason, job.session_id, len(job.message_ids),
+    )
+    if job.message_ids:
+        # Describes pending images first, then summarizes
+        summarize_message_ids(SessionLocal, job.session_id, list(job.message_ids), job.assistant_id)
+    else:
+        describe_images(SessionLocal, job.session_id, job.assistant_id)
+
+
+async def presummary_loop() -> None:
+    """Background loop pre-summarizing quiet or nearly-full sessions."""
+    await asyncio.sleep(90)  # Startup delay
+    logger.info("[presummary] Loop started")
+    last_attempt: dict[int, float] = {}
+
+    while True:
+        try:
+            await asyncio.sleep(PRESUMMARY_TICK_SECONDS)
+            if activity_tracker.snapshot()["in_flight"]:
+                continue
+            jobs = await asyncio.to_thread(find_presummary_jobs)
+            for job in jobs:
+                # Yield to live traffic between sessions
+                if activity_tracker.snapshot()["in_flight"]:
+                    break
+                if time.monotonic() - last_attempt.get(job.session_id, -PRESUMMARY_RETRY_SECONDS) < PRESUMMARY_RETRY_SECONDS:
+                    continue
+                last_attempt[job.session_id] = time.monotonic()
+                await asyncio.to_thread(run_presummary_job, job)
+        except Exception as e:
+            logger.exception("[presummary] Loop error: %s", e)
+            await asyncio.sleep(PRESUMMARY_TICK_SECONDS)
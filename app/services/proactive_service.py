@@ -1,44 +1,46 @@
 """Proactive messaging service.
 
-Periodically checks whether the AI should send an unsolicited message
-to the user and, if so, generates one via the main ChatService flow
-and pushes it through Telegram.
+Checks whether an assistant should send an unsolicited message to the
+user when its next check falls due (see ``ProactiveScheduler``) and, if
+so, generates one via the main ChatService flow and pushes it through
+that assistant's Telegram bot.
 """
 
 from __future__ import annotations
 
 import asyncio
+import heapq
 import logging
 import random
 import time
+from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
-from typing import Any
 
-from sqlalchemy import cast
-from sqlalchemy.dialects.postgresql import JSONB as JSONB_TYPE
 from sqlalchemy.orm import Session
 
 from app.database import SessionLocal
 from app.models.models import (
     Assistant,
-    ChatSession,
     Message,
     ModelPreset,
+    ProactiveState,
     SessionSummary,
 )
+from app.services.proactive_state import add_state_listener, record_check, record_proactive_send
+from app.services.settings_store import SettingsSnapshot, settings_store
 from app.telegram.bot_instance import bots
 from app.telegram.config import BOTS_CONFIG, ALLOWED_CHAT_ID
-from app.telegram.service import (
-    get_setting,
-    _get_session_info_sync,
-    update_telegram_message_id,
-)
+from app.telegram.service import update_telegram_message_id
 
 logger = logging.getLogger(__name__)
 
 TZ_EAST8 = timezone(timedelta(hours=8))
 
-ACHENG_ASSISTANT_ID = BOTS_CONFIG.get("acheng", {}).get("assistant_id", 2)
+# Telegram bot used to reach each assistant's user
+_BOT_KEY_BY_ASSISTANT = {cfg["assistant_id"]: key for key, cfg in BOTS_CONFIG.items()}
+
+# Longest the scheduler sleeps without re-reading settings
+_MAX_IDLE_WAIT_SECONDS = 300
 
 PROACTIVE_EXTRA_PROMPT = (
     "你现在不是在回复她的消息，而是在主动找她。\n"
@@ -85,127 +87,110 @@ def _format_gap(td: timedelta) -> str:
     return f"{minutes}分钟"
 
 
-def _get_session_id(db: Session) -> int | None:
-    """Get the most recent chat session for 阿澄."""
-    session = (
-        db.query(ChatSession)
-        .filter(ChatSession.assistant_id == ACHENG_ASSISTANT_ID)
-        .order_by(ChatSession.updated_at.desc())
-        .first()
-    )
-    return session.id if session else None
-
+def _to_east8(value: datetime | None) -> datetime | None:
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=TZ_EAST8)
+    return value.astimezone(TZ_EAST8)
 
-# ── Layer 1: Rule-based checks (zero cost) ──────────────────────────────────
 
-def _check_rules() -> bool:
-    """Return True if rule-based checks pass (proactive message is allowed)."""
-    db = SessionLocal()
+def _parse_hhmm(raw: str | None) -> int | None:
+    """'HH:MM' → minutes after midnight, None if unset/invalid."""
+    if not raw:
+        return None
     try:
-        session_id = _get_session_id(db)
-        if session_id is None:
-            logger.debug("[proactive] No session found for acheng, skipping")
-            return False
-
-        now = _now_beijing()
-
-        # Setting values
-        min_gap = int(_get_setting_sync("proactive_min_gap", "30"))
-        retry_enabled = _get_setting_sync("proactive_retry_enabled", "true") == "true"
-        retry_gap = float(_get_setting_sync("proactive_retry_gap", "1.5"))
-        max_retries = int(_get_setting_sync("proactive_max_retries", "8"))
-
-        # Random mode: override min_gap and retry_gap
-        random_mode = _get_setting_sync("proactive_random", "false") == "true"
-        if random_mode:
-            min_gap = random.randint(15, 120)
-            retry_gap = round(random.uniform(0.5, 4.0), 1)
-            logger.info("[proactive] Random mode: min_gap=%d, retry_gap=%.1f", min_gap, retry_gap)
-
-        # Last user message
-        last_user_msg = (
-            db.query(Message)
-            .filter(
-                Message.session_id == session_id,
-                Message.role == "user",
-            )
-            .order_by(Message.id.desc())
-            .first()
-        )
-        if last_user_msg and last_user_msg.created_at:
-            user_time = last_user_msg.created_at
-            if user_time.tzinfo is None:
-                user_time = user_time.replace(tzinfo=TZ_EAST8)
-            gap = now - user_time
-            if gap < timedelta(minutes=min_gap):
-                logger.debug("[proactive] Last user msg too recent (%s < %dm), skipping", gap, min_gap)
-                return False
-
-        # Last proactive message
-        last_proactive = (
-            db.query(Message)
-            .filter(
-                Message.session_id == session_id,
-                Message.role == "assistant",
-                Message.meta_info.op("@>")(cast({"mode": "proactive"}, JSONB_TYPE)),
-            )
-            .order_by(Message.id.desc())
-            .first()
+        hours, minutes = raw.strip().split(":")
+        value = int(hours) * 60 + int(minutes)
+    except ValueError:
+        return None
+    return value if 0 <= value < 24 * 60 else None
+
+
+# ── Layer 1: Rule-based eligibility (no queries) ─────────────────────────────
+
+@dataclass(frozen=True)
+class _StateView:
+    assistant_id: int
+    session_id: int
+    last_user_at: datetime | None
+    last_proactive_at: datetime | None
+    unreplied_count: int
+    last_check_at: datetime | None
+    quiet_start: str | None
+    quiet_end: str | None
+
+    @classmethod
+    def from_row(cls, row: ProactiveState) -> "_StateView":
+        return cls(
+            assistant_id=row.assistant_id,
+            session_id=row.session_id,
+            last_user_at=_to_east8(row.last_user_at),
+            last_proactive_at=_to_east8(row.last_proactive_at),
+            unreplied_count=row.unreplied_count or 0,
+            last_check_at=_to_east8(row.last_check_at),
+            quiet_start=row.quiet_start,
+            quiet_end=row.quiet_end,
         )
 
-        if last_proactive:
-            # Check if user replied after the last proactive message
-            user_after_proactive = (
-                db.query(Message)
-                .filter(
-                    Message.session_id == session_id,
-                    Message.role == "user",
-                    Message.id > last_proactive.id,
-                )
-                .first()
-            )
-            if user_after_proactive is None:
-                # User hasn't replied — check retry rules
-                if not retry_enabled:
-                    logger.debug("[proactive] Retry disabled and user hasn't replied, skipping")
-                    return False
-
-                proactive_time = last_proactive.created_at
-                if proactive_time.tzinfo is None:
-                    proactive_time = proactive_time.replace(tzinfo=TZ_EAST8)
-                if now - proactive_time < timedelta(hours=retry_gap):
-                    logger.debug("[proactive] Retry gap not reached, skipping")
-                    return False
-
-                # Count consecutive unreplied proactive messages
-                last_user_id = last_user_msg.id if last_user_msg else 0
-                consecutive = (
-                    db.query(Message)
-                    .filter(
-                        Message.session_id == session_id,
-                        Message.role == "assistant",
-                        Message.id > last_user_id,
-                        Message.meta_info.op("@>")(cast({"mode": "proactive"}, JSONB_TYPE)),
-                    )
-                    .count()
-                )
-                if consecutive >= max_retries:
-                    logger.debug("[proactive] Max retries reached (%d >= %d), skipping", consecutive, max_retries)
-                    return False
 
-        logger.debug("[proactive] Layer 1 passed")
-        return True
-    finally:
-        db.close()
-
-
-def _get_setting_sync(key: str, default: str = "") -> str:
-    """Inline setting reader — avoids circular import with telegram.service."""
-    from app.models.models import Settings
+def _skip_quiet_hours(ts: datetime, start: int | None, end: int | None) -> datetime:
+    """Move ``ts`` to the end of the quiet window if it falls inside it."""
+    if start is None or end is None or start == end:
+        return ts
+    local = ts.astimezone(TZ_EAST8)
+    minute = local.hour * 60 + local.minute
+    midnight = local.replace(hour=0, minute=0, second=0, microsecond=0)
+    if start < end:
+        if start <= minute < end:
+            return midnight + timedelta(minutes=end)
+    elif minute >= start:
+        return midnight + timedelta(days=1, minutes=end)
+    elif minute < end:
+        return midnight + timedelta(minutes=end)
+    return ts
+
+
+def _next_eligible_at(state: _StateView, snap: SettingsSnapshot, now: datetime) -> datetime | None:
+    """Earliest time a proactive check may run for this state, None if never."""
+    interval = snap.get_int("proactive_interval", 30)
+    min_gap = snap.get_int("proactive_min_gap", 30)
+    retry_enabled = snap.get_bool("proactive_retry_enabled", True)
+    retry_gap = snap.get_float("proactive_retry_gap", 1.5)
+    max_retries = snap.get_int("proactive_max_retries", 8)
+
+    # Random mode: override min_gap and retry_gap
+    if snap.get_bool("proactive_random", False):
+        interval = 10
+        min_gap = random.randint(15, 120)
+        retry_gap = round(random.uniform(0.5, 4.0), 1)
+
+    candidates = [now]
+    if state.last_user_at is not None:
+        candidates.append(state.last_user_at + timedelta(minutes=min_gap))
+    if state.unreplied_count > 0:
+        # User hasn't replied to the last proactive message — retry rules
+        if not retry_enabled or state.unreplied_count >= max_retries:
+            return None
+        if state.last_proactive_at is not None:
+            candidates.append(state.last_proactive_at + timedelta(hours=retry_gap))
+    if state.last_check_at is not None:
+        candidates.append(state.last_check_at + timedelta(minutes=interval))
+
+    quiet_start = _parse_hhmm(state.quiet_start or snap.get("proactive_quiet_start", ""))
+    quiet_end = _parse_hhmm(state.quiet_end or snap.get("proactive_quiet_end", ""))
+    return _skip_quiet_hours(max(candidates), quiet_start, quiet_end)
+
+
+def _load_states(session_ids: list[int] | None = None) -> list[_StateView]:
     db = SessionLocal()
     try:
-        row = db.query(Settings).filter(Settings.key == key).first()
-        return row.value if row else default
+        query = db.query(ProactiveState).filter(
+            ProactiveState.assistant_id.in_(list(_BOT_KEY_BY_ASSISTANT))
+        )
+        if session_ids is not None:
+            query = query.filter(ProactiveState.session_id.in_(session_ids))
+        return [_StateView.from_row(row) for row in query.all()]
     finally:
         db.close()
 
@@ -219,13 +204,14 @@ def _is_timeout_error(exc: Exception) -> bool:
 
 # ── Layer 2: Lightweight model decision ──────────────────────────────────────
 
-def _check_with_fallback_model_sync() -> bool:
+def _check_with_fallback_model_sync(state: _StateView) -> bool:
     """Call the summary fallback model to decide yes/no."""
     from app.services.summary_service import _call_model_raw
 
+    session_id = state.session_id
     db = SessionLocal()
     try:
-        assistant = db.get(Assistant, ACHENG_ASSISTANT_ID)
+        assistant = db.get(Assistant, state.assistant_id)
         if not assistant:
             logger.warning("[proactive] Assistant not found, skipping layer 2")
             return False
@@ -242,10 +228,6 @@ def _check_with_fallback_model_sync() -> bool:
             logger.warning("[proactive] No model preset available, skipping layer 2")
             return False
 
-        session_id = _get_session_id(db)
-        if session_id is None:
-            return False
-
         # Latest summary
         latest_summary = (
             db.query(SessionSummary)
@@ -300,19 +282,7 @@ def _check_with_fallback_model_sync() -> bool:
 
         # Time since last user message
         now = _now_beijing()
-        last_user = (
-            db.query(Message)
-            .filter(Message.session_id == session_id, Message.role == "user")
-            .order_by(Message.id.desc())
-            .first()
-        )
-        if last_user and last_user.created_at:
-            user_time = last_user.created_at
-            if user_time.tzinfo is None:
-                user_time = user_time.replace(tzinfo=TZ_EAST8)
-            gap_str = _format_gap(now - user_time)
-        else:
-            gap_str = "未知"
+        gap_str = _format_gap(now - state.last_user_at) if state.last_user_at else "未知"
 
         system_prompt = summary_text + "\n[最近对话]\n" + context_text
         user_text = DECISION_PROMPT_TEMPLATE.format(
@@ -344,8 +314,8 @@ def _check_with_fallback_model_sync() -> bool:
         db.close()
 
 
-async def _check_with_fallback_model() -> bool:
-    return await asyncio.to_thread(_check_with_fallback_model_sync)
+async def _check_with_fallback_model(state: _StateView) -> bool:
+    return await asyncio.to_thread(_check_with_fallback_model_sync, state)
 
 
 # ── Layer 3: Generate and send ───────────────────────────────────────────────
@@ -364,32 +334,25 @@ def _cleanup_partial_messages(db: "Session", session_id: int, after_id: int) ->
         logger.info("[proactive] Cleaned up %d partial messages", len(partials))
 
 
-def _generate_sync() -> tuple[str | None, int | None]:
+def _generate_sync(state: _StateView) -> tuple[str | None, int | None]:
     """Generate a proactive message. Returns (content, db_message_id) or (None, None)."""
     from app.routers.chat import _load_session_messages
     from app.services.chat_service import ChatService
 
+    session_id = state.session_id
     db = SessionLocal()
     try:
-        session_id, assistant_name = _get_session_info_sync(ACHENG_ASSISTANT_ID)
+        assistant = db.get(Assistant, state.assistant_id)
+        if not assistant:
+            logger.warning("[proactive] Assistant %d not found, skipping layer 3", state.assistant_id)
+            return None, None
+        assistant_name = assistant.name
 
         messages = _load_session_messages(db, session_id)
 
         # Compute trigger prompt values
         now = _now_beijing()
-        last_user = (
-            db.query(Message)
-            .filter(Message.session_id == session_id, Message.role == "user")
-            .order_by(Message.id.desc())
-            .first()
-        )
-        if last_user and last_user.created_at:
-            user_time = last_user.created_at
-            if user_time.tzinfo is None:
-                user_time = user_time.replace(tzinfo=TZ_EAST8)
-            gap_str = _format_gap(now - user_time)
-        else:
-            gap_str = "未知"
+        gap_str = _format_gap(now - state.last_user_at) if state.last_user_at else "未知"
 
         mood_summary = (
             db.query(SessionSummary)
@@ -399,30 +362,10 @@ def _generate_sync() -> tuple[str | None, int | None]:
         )
         mood_tag = mood_summary.mood_tag if mood_summary else "unknown"
 
-        # Detect retry (user hasn't replied to last proactive message)
+        # Retry: user hasn't replied to the last proactive message
         retry_hint = ""
-        last_proactive = (
-            db.query(Message)
-            .filter(
-                Message.session_id == session_id,
-                Message.role == "assistant",
-                Message.meta_info.op("@>")(cast({"mode": "proactive"}, JSONB_TYPE)),
-            )
-            .order_by(Message.id.desc())
-            .first()
-        )
-        if last_proactive:
-            user_after = (
-                db.query(Message)
-                .filter(
-                    Message.session_id == session_id,
-                    Message.role == "user",
-                    Message.id > last_proactive.id,
-                )
-                .first()
-            )
-            if user_after is None:
-                retry_hint = "你上一条消息她没回。想再说点什么都行——换个话题也好，表达你现在的心情也好，着急了直接说着急也行。\n"
+        if state.unreplied_count > 0:
+            retry_hint = "你上一条消息她没回。想再说点什么都行——换个话题也好，表达你现在的心情也好，着急了直接说着急也行。\n"
 
         trigger_msg = {
             "role": "user",
@@ -456,8 +399,8 @@ def _generate_sync() -> tuple[str | None, int | None]:
             msgs_copy = [*messages, trigger_msg]
 
             try:
-                # Consume SSE stream (side effects: saves assistant message to DB)
-                for _ in chat_service.stream_chat_completion(session_id, msgs_copy, source="proactive"):
+                # Drain chat events (side effects: saves assistant message to DB)
+                for _ in chat_service.iter_chat_events(session_id, msgs_copy, source="proactive"):
                     pass
                 break  # success
             except Exception as api_err:
@@ -501,6 +444,7 @@ def _generate_sync() -> tuple[str | None, int | None]:
 
         # Tag the message as proactive
         msg.meta_info = {**(msg.meta_info or {}), "mode": "proactive"}
+        record_proactive_send(db, state.assistant_id, session_id, msg.id)
         db.commit()
 
         logger.info("[proactive] Generated message (id=%d): %s", msg.id, content[:60])
@@ -512,15 +456,16 @@ def _generate_sync() -> tuple[str | None, int | None]:
         db.close()
 
 
-async def _generate_and_send() -> None:
-    content, msg_db_id = await asyncio.to_thread(_generate_sync)
+async def _generate_and_send(state: _StateView) -> bool:
+    """Run layer 3; True if a proactive message was generated (and recorded)."""
+    content, msg_db_id = await asyncio.to_thread(_generate_sync, state)
     if not content:
-        return
+        return False
 
-    bot = bots.get("acheng")
+    bot = bots.get(_BOT_KEY_BY_ASSISTANT.get(state.assistant_id, ""))
     if not bot or not ALLOWED_CHAT_ID:
         logger.warning("[proactive] Bot or chat_id not available, cannot send")
-        return
+        return True
 
     try:
         sent = await bot.send_message(chat_id=ALLOWED_CHAT_ID, text=content)
@@ -529,6 +474,7 @@ async def _generate_and_send() -> None:
         logger.info("[proactive] Sent to Telegram (tg_msg_id=%d)", sent.message_id)
     except Exception as e:
         logger.exception("[proactive] Telegram send error: %s", e)
+    return True
 
     # TODO: TTS 接入后启用语音消息
     # voice_enabled = await get_setting("proactive_voice_enabled", "false") == "true"
@@ -537,42 +483,174 @@ async def _generate_and_send() -> None:
     #     ... send voice message ...
 
 
-# ── Main loop ────────────────────────────────────────────────────────────────
+def _record_check_sync(state: _StateView) -> None:
+    db = SessionLocal()
+    try:
+        record_check(db, state.assistant_id, state.session_id)
+        db.commit()
+    finally:
+        db.close()
 
-async def proactive_loop() -> None:
-    """Background loop that periodically checks and sends proactive messages."""
-    await asyncio.sleep(30)  # Startup delay
-    logger.info("[proactive] Loop started")
 
-    while True:
-        try:
-            interval = int(await get_setting("proactive_interval", "30"))
-            random_mode = await get_setting("proactive_random", "false") == "true"
-            if random_mode:
-                interval = 10
-            await asyncio.sleep(interval * 60)
+# ── Scheduler ────────────────────────────────────────────────────────────────
 
-            if await get_setting("proactive_enabled", "false") != "true":
-                continue
+class ProactiveScheduler:
+    """Wake up exactly when an assistant's next proactive check is due.
 
-            logger.info("[proactive] Checking rules (layer 1)...")
-            t0 = time.monotonic()
-            if not await asyncio.to_thread(_check_rules):
-                logger.info("[proactive] Layer 1 check took %.1fs (skipped)", time.monotonic() - t0)
-                continue
-            logger.info("[proactive] Layer 1 check took %.1fs (passed)", time.monotonic() - t0)
+    Each assistant with a Telegram bot contributes its most recently active
+    session; the earliest eligible time of each is kept in a heap. Writes to
+    ``proactive_states`` (a user message, a check, a send) notify the
+    scheduler after commit, which reloads just that session and recomputes
+    its due time, so nothing polls message history. Stale heap entries are
+    skipped lazily by comparing against ``_scheduled``.
+    """
 
-            logger.info("[proactive] Checking with fallback model (layer 2)...")
-            t1 = time.monotonic()
-            if not await _check_with_fallback_model():
-                logger.info("[proactive] Layer 2 check took %.1fs (NO)", time.monotonic() - t1)
+    def __init__(self) -> None:
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._wakeup: asyncio.Event | None = None
+        self._heap: list[tuple[datetime, int, int]] = []
+        self._scheduled: dict[int, tuple[datetime, int]] = {}
+        self._states: dict[int, _StateView] = {}
+        self._dirty: set[int] = set()
+        self._rebuild = True
+
+    # ── Thread-safe notifications ────────────────────────────────────────
+
+    def notify(self, assistant_id: int, session_id: int) -> None:
+        """State listener: called after a commit touched (assistant, session)."""
+        if self._loop is None or assistant_id not in _BOT_KEY_BY_ASSISTANT:
+            return
+        self._loop.call_soon_threadsafe(self._mark_dirty, session_id)
+
+    def request_rebuild(self) -> None:
+        """Recompute every due time (e.g. after proactive settings changed)."""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._mark_rebuild)
+
+    def _mark_dirty(self, session_id: int) -> None:
+        self._dirty.add(session_id)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _mark_rebuild(self) -> None:
+        self._rebuild = True
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    # ── Heap maintenance ─────────────────────────────────────────────────
+
+    def _apply(self, states: list[_StateView], snap: SettingsSnapshot) -> None:
+        now = _now_beijing()
+        for state in states:
+            current = self._states.get(state.assistant_id)
+            # Only the most recently active session of an assistant is considered
+            if (
+                current is not None
+                and current.session_id != state.session_id
+                and (current.last_user_at or now) >= (state.last_user_at or now)
+            ):
+                continue
+            self._states[state.assistant_id] = state
+            due = _next_eligible_at(state, snap, now)
+            if due is None:
+                self._scheduled.pop(state.assistant_id, None)
                 continue
-            logger.info("[proactive] Layer 2 check took %.1fs (YES)", time.monotonic() - t1)
-
-            logger.info("[proactive] Generating and sending (layer 3)...")
-            t2 = time.monotonic()
-            await _generate_and_send()
-            logger.info("[proactive] Layer 3 generate took %.1fs", time.monotonic() - t2)
-        except Exception as e:
-            logger.exception("[proactive] Loop error: %s", e)
-            await asyncio.sleep(60)
+            self._scheduled[state.assistant_id] = (due, state.session_id)
+            heapq.heappush(self._heap, (due, state.assistant_id, state.session_id))
+
+    async def _refresh(self) -> None:
+        snap = await settings_store.asnapshot()
+        if self._rebuild:
+            self._rebuild = False
+            self._dirty.clear()
+            self._heap.clear()
+            self._scheduled.clear()
+            self._states.clear()
+            states = await asyncio.to_thread(_load_states)
+            self._apply(states, snap)
+            logger.info("[proactive] Scheduled %d assistant(s)", len(self._scheduled))
+        elif self._dirty:
+            session_ids, self._dirty = list(self._dirty), set()
+            states = await asyncio.to_thread(_load_states, session_ids)
+            self._apply(states, snap)
+
+    def _pop_due(self) -> tuple[_StateView | None, float]:
+        """Return (due state, 0) or (None, seconds until the next entry)."""
+        now = _now_beijing()
+        while self._heap:
+            due, assistant_id, session_id = self._heap[0]
+            if self._scheduled.get(assistant_id) != (due, session_id):
+                heapq.heappop(self._heap)  # superseded entry
+                continue
+            if due > now:
+                return None, (due - now).total_seconds()
+            heapq.heappop(self._heap)
+            del self._scheduled[assistant_id]
+            return self._states[assistant_id], 0.0
+        return None, float(_MAX_IDLE_WAIT_SECONDS)
+
+    # ── Main loop ────────────────────────────────────────────────────────
+
+    async def run(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        add_state_listener(self.notify)
+        logger.info("[proactive] Scheduler started")
+
+        while True:
+            try:
+                # Cleared before the refresh: a notify arriving while states
+                # load sets it again, so the wait below returns at once
+                self._wakeup.clear()
+                await self._refresh()
+                state, wait = self._pop_due()
+                if state is None:
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=min(wait, _MAX_IDLE_WAIT_SECONDS))
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                await self._run_check(state)
+            except Exception as e:
+                logger.exception("[proactive] Loop error: %s", e)
+                self._rebuild = True  # the failed entry may have been dropped
+                await asyncio.sleep(60)
+
+    async def _run_check(self, state: _StateView) -> None:
+        snap = await settings_store.asnapshot()
+        if not snap.get_bool("proactive_enabled", False):
+            # Disabled: look again after one interval (a settings change rebuilds sooner)
+            due = _now_beijing() + timedelta(minutes=snap.get_int("proactive_interval", 30))
+            self._scheduled[state.assistant_id] = (due, state.session_id)
+            heapq.heappush(self._heap, (due, state.assistant_id, state.session_id))
+            return
+
+        logger.info(
+            "[proactive] Checking assistant=%d session=%d with fallback model (layer 2)...",
+            state.assistant_id, state.session_id,
+        )
+        t1 = time.monotonic()
+        if not await _check_with_fallback_model(state):
+            logger.info("[proactive] Layer 2 check took %.1fs (NO)", time.monotonic() - t1)
+            await asyncio.to_thread(_record_check_sync, state)
+            return
+        logger.info("[proactive] Layer 2 check took %.1fs (YES)", time.monotonic() - t1)
+
+        logger.info("[proactive] Generating and sending (layer 3)...")
+        t2 = time.monotonic()
+        generated = await _generate_and_send(state)
+        logger.info("[proactive] Layer 3 generate took %.1fs", time.monotonic() - t2)
+        if not generated:
+            # NO_MESSAGE or error: still push the next check out by one interval
+            await asyncio.to_thread(_record_check_sync, state)
+
+
+proactive_scheduler = ProactiveScheduler()
+
+
+# ── Main loop ────────────────────────────────────────────────────────────────
+
+async def proactive_loop() -> None:
+    """Background task that checks and sends proactive messages when due."""
+    await asyncio.sleep(30)  # Startup delay
+    await proactive_scheduler.run()
@@ -0,0 +1,132 @@
+"""Per-(assistant, session) state for proactive messaging.
+
+A ``proactive_states`` row is upserted in the same transaction whenever a
+user message is inserted, and updated by the proactive sender after every
+check and send, so scheduling never has to scan message history. Committed
+changes are reported to registered listeners (the proactive scheduler).
+"""
+
+from __future__ import annotations
+
+import logging
+from collections.abc import Callable
+from typing import Any
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+from app.models.models import Message
+
+logger = logging.getLogger(__name__)
+
+StateListener = Callable[[int, int], None]
+_listeners: list[StateListener] = []
+
+_USER_MESSAGE_UPSERT = text(
+    """
+INSERT INTO proactive_states (assistant_id, session_id, last_user_at, last_user_msg_id, unreplied_count, updated_at)
+SELECT s.assistant_id, s.id, COALESCE(CAST(:created_at AS TIMESTAMPTZ), now()), :message_id, 0, now()
+FROM sessions s
+WHERE s.id = :session_id AND s.assistant_id IS NOT NULL AND s.type = 'chat'
+ON CONFLICT ON CONSTRAINT uq_proactive_states_assistant_session DO UPDATE
+SET last_user_at = EXCLUDED.last_user_at,
+    last_user_msg_id = EXCLUDED.last_user_msg_id,
+    unreplied_count = 0,
+    updated_at = now()
+RETURNING assistant_id
+"""
+)
+
+SEED_STATES_SQL = """
+INSERT INTO proactive_states (
+    assistant_id, session_id, last_user_at, last_user_msg_id,
+    last_proactive_at, last_proactive_msg_id, unreplied_count, updated_at
+)
+SELECT s.assistant_id, s.id, lu.created_at, lu.id, lp.created_at, lp.id,
+       (SELECT COUNT(*) FROM messages m
+        WHERE m.session_id = s.id AND m.role = 'assistant'
+          AND m.id > COALESCE(lu.id, 0)
+          AND m.meta_info @> '{"mode": "proactive"}'::jsonb),
+       now()
+FROM sessions s
+LEFT JOIN LATERAL (
+    SELECT id, created_at FROM messages
+    WHERE session_id = s.id AND role = 'user'
+    ORDER BY id DESC LIMIT 1
+) lu ON TRUE
+LEFT JOIN LATERAL (
+    SELECT id, created_at FROM messages
+    WHERE session_id = s.id AND role = 'assistant'
+      AND meta_info @> '{"mode": "proactive"}'::jsonb
+    ORDER BY id DESC LIMIT 1
+) lp ON TRUE
+WHERE s.assistant_id IS NOT NULL AND s.type = 'chat' AND lu.id IS NOT NULL
+ON CONFLICT ON CONSTRAINT uq_proactive_states_assistant_session DO NOTHING
+"""
+
+
+def add_state_listener(listener: StateListener) -> None:
+    """Register ``listener(assistant_id, session_id)``, called after commits that changed a state."""
+    _listeners.append(listener)
+
+
+def _touch(session: Session | None, assistant_id: int, session_id: int) -> None:
+    if session is not None:
+        session.info.setdefault("proactive_touched", set()).add((assistant_id, session_id))
+
+
+@event.listens_for(Message, "after_insert")
+def _on_message_insert(mapper: Any, connection: Any, target: Message) -> None:
+    if target.role != "user":
+        return
+    row = connection.execute(
+        _USER_MESSAGE_UPSERT,
+        {
+            "session_id": target.session_id,
+            "message_id": target.id,
+            "created_at": target.created_at,
+        },
+    ).first()
+    if row is not None:
+        _touch(Session.object_session(target), row.assistant_id, target.session_id)
+
+
+@event.listens_for(Session, "after_commit")
+def _notify_after_commit(session: Session) -> None:
+    touched = session.info.pop("proactive_touched", None)
+    if not touched:
+        return
+    for assistant_id, session_id in touched:
+        for listener in _listeners:
+            try:
+                listener(assistant_id, session_id)
+            except Exception:
+                logger.exception("Proactive state listener failed")
+
+
+@event.listens_for(Session, "after_rollback")
+def _clear_after_rollback(session: Session) -> None:
+    session.info.pop("proactive_touched", None)
+
+
+def record_check(db: Session, assistant_id: int, session_id: int) -> None:
+    db.execute(
+        text(
+            "UPDATE proactive_states SET last_check_at = now(), updated_at = now() "
+            "WHERE assistant_id = :assistant_id AND session_id = :session_id"
+        ),
+        {"assistant_id": assistant_id, "session_id": session_id},
+    )
+    _touch(db, assistant_id, session_id)
+
+
+def record_proactive_send(db: Session, assistant_id: int, session_id: int, message_id: int) -> None:
+    db.execute(
+        text(
+            "UPDATE proactive_states SET last_proactive_at = now(), last_proactive_msg_id = :message_id, "
+            "unreplied_count = unreplied_count + 1, last_check_at = now(), updated_at = now() "
+            "WHERE assistant_id = :assistant_id AND session_id = :session_id"
+        ),
+        {"assistant_id": assistant_id, "session_id": session_id, "message_id": message_id},
+    )
+    _touch(db, assistant_id, session_id)
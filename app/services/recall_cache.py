@@ -0,0 +1,192 @@
+"""Per-session cache of ``fast_recall`` results for consecutive turns.
+
+Several short messages in a row usually recall the same memories. Each
+session keeps its last few recalls, keyed by query text and query
+embedding; a new query reuses a result when its text is identical (no
+embedding call at all) or its embedding is within ``RECALL_CACHE_THRESHOLD``
+cosine of a cached one.
+
+A cached result is only valid for the memories version it was computed
+against. The version is a process-wide counter bumped after any commit
+that inserted, updated or deleted ``memories`` rows, including bulk
+``query().update()``/``delete()``; code writing memories with raw SQL
+calls ``bump_memories_version``. Entries also expire after
+``RECALL_CACHE_TTL`` seconds, since decayed scores drift with time.
+"""
+
+from __future__ import annotations
+
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any
+
+from sqlalchemy import event
+from sqlalchemy.orm import ORMExecuteState, Session
+
+from app.models.models import Memory
+
+RECALL_CACHE_THRESHOLD = float(os.getenv("RECALL_CACHE_THRESHOLD", "0.92"))
+RECALL_CACHE_TTL = float(os.getenv("RECALL_CACHE_TTL", "600"))
+RECALL_CACHE_PER_SESSION = int(os.getenv("RECALL_CACHE_PER_SESSION", "4"))
+RECALL_CACHE_SESSIONS = int(os.getenv("RECALL_CACHE_SESSIONS", "256"))
+
+# ── Memories version ──
+
+_version = 0
+_version_lock = threading.Lock()
+
+
+def memories_version() -> int:
+    return _version
+
+
+def bump_memories_version() -> None:
+    global _version
+    with _version_lock:
+        _version += 1
+
+
+def _mark(session: Session | None) -> None:
+    if session is not None:
+        session.info["memories_changed"] = True
+
+
+@event.listens_for(Memory, "after_insert")
+@event.listens_for(Memory, "after_update")
+@event.listens_for(Memory, "after_delete")
+def _on_memory_write(mapper: Any, connection: Any, target: Memory) -> None:
+    _mark(Session.object_session(target))
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _on_bulk_write(state: ORMExecuteState) -> None:
+    if (state.is_update or state.is_delete) and state.bind_mapper is not None \
+            and state.bind_mapper.class_ is Memory:
+        _mark(state.session)
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_after_commit(session: Session) -> None:
+    if session.info.pop("memories_changed", False):
+        bump_memories_version()
+
+
+@event.listens_for(Session, "after_rollback")
+def _clear_after_rollback(session: Session) -> None:
+    session.info.pop("memories_changed", None)
+
+
+# ── Cache ──
+
+@dataclass
+class _Entry:
+    query: str
+    vector: list[float] | None
+    mood: str
+    version: int
+    created_at: float
+    results: list[dict[str, Any]]
+
+
+def _cosine(a: list[float], b: list[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class RecallCache:
+    def __init__(
+        self,
+        threshold: float = RECALL_CACHE_THRESHOLD,
+        ttl_seconds: float = RECALL_CACHE_TTL,
+        per_session: int = RECALL_CACHE_PER_SESSION,
+        max_sessions: int = RECALL_CACHE_SESSIONS,
+    ) -> None:
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.per_session = per_session
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._sessions: OrderedDict[int, list[_Entry]] = OrderedDict()
+        self.stats = {"lookups": 0, "text_hits": 0, "vector_hits": 0, "stale": 0, "misses": 0}
+
+    def lookup_text(self, session_id: int, query: str, mood: str) -> list[dict[str, Any]] | None:
+        """Result of an identical query, before any embedding is computed."""
+        with self._lock:
+            self.stats["lookups"] += 1
+            for entry in self._fresh_entries(session_id):
+                if entry.query == query and entry.mood == mood:
+                    self.stats["text_hits"] += 1
+                    return list(entry.results)
+        return None
+
+    def lookup_vector(
+        self, session_id: int, vector: list[float] | None, mood: str
+    ) -> list[dict[str, Any]] | None:
+        """Result of the most similar recent query within the threshold; counts a miss otherwise."""
+        with self._lock:
+            if vector is None:
+                self.stats["misses"] += 1
+                return None
+            best, best_score = None, self.threshold
+            for entry in self._fresh_entries(session_id):
+                if entry.vector is None or entry.mood != mood:
+                    continue
+                score = _cosine(vector, entry.vector)
+                if score >= best_score:
+                    best, best_score = entry, score
+            if best is None:
+                self.stats["misses"] += 1
+                return None
+            self.stats["vector_hits"] += 1
+            return list(best.results)
+
+    def store(
+        self,
+        session_id: int,
+        query: str,
+        vector: list[float] | None,
+        mood: str,
+        version: int,
+        results: list[dict[str, Any]],
+    ) -> None:
+        """Cache ``results`` computed against memories ``version`` (read before the recall ran)."""
+        if version != memories_version():
+            return
+        with self._lock:
+            entries = self._sessions.pop(session_id, [])
+            entries = [e for e in entries if e.query != query or e.mood != mood]
+            entries.append(_Entry(query, vector, mood, version, time.time(), results))
+            self._sessions[session_id] = entries[-self.per_session:]
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            hits = self.stats["text_hits"] + self.stats["vector_hits"]
+            lookups = self.stats["lookups"]
+            return {
+                **self.stats,
+                "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+                "sessions": len(self._sessions),
+            }
+
+    def _fresh_entries(self, session_id: int) -> list[_Entry]:
+        """Entries still valid for the current memories version (call with the lock held)."""
+        entries = self._sessions.get(session_id)
+        if not entries:
+            return []
+        version, now = memories_version(), time.time()
+        fresh = [e for e in entries if e.version == version and now - e.created_at < self.ttl_seconds]
+        if len(fresh) != len(entries):
+            self.stats["stale"] += len(entries) - len(fresh)
+            self._sessions[session_id] = fresh
+        self._sessions.move_to_end(session_id)
+        return fresh
+
+
+recall_cache = RecallCache()
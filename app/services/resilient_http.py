@@ -0,0 +1,171 @@
+"""Pooled HTTP with retries, deadlines and circuit breaking for model APIs.
+
+- One ``requests.Session`` per client, so calls reuse keep-alive
+  connections instead of paying a new TCP/TLS handshake each time.
+- ``post_json`` retries connection errors, timeouts, 429 and 5xx with
+  jittered exponential backoff, but never past the caller's deadline: each
+  attempt's read timeout is cut to the time remaining.
+- ``CircuitBreaker`` opens after ``failure_threshold`` consecutive failed
+  calls and rejects calls immediately (``CircuitOpen``) until
+  ``reset_seconds`` have passed; then a single probe call decides whether
+  it closes again.
+"""
+
+from __future__ import annotations
+
+import logging
+import random
+import threading
+import time
+from typing import Any
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+_RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class CircuitOpen(RuntimeError):
+    pass
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int = 5, reset_seconds: float = 30.0) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.reset_seconds:
+                return "half-open"
+            return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_seconds or self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._opened_at is not None:
+                logger.info("[http] Circuit %s closed", self.name)
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            # A failed probe re-opens the circuit for another full period
+            if self._probing or (self._opened_at is None and self._failures >= self.failure_threshold):
+                logger.warning(
+                    "[http] Circuit %s open after %d failures, skipping calls for %.0fs",
+                    self.name, self._failures, self.reset_seconds,
+                )
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+
+class ResilientClient:
+    def __init__(
+        self,
+        pool_size: int = 16,
+        connect_timeout: float = 3.0,
+        retries: int = 2,
+        backoff_base: float = 0.2,
+        backoff_max: float = 2.0,
+    ) -> None:
+        self.connect_timeout = connect_timeout
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def post_json(
+        self,
+        url: str,
+        payload: dict[str, Any],
+        *,
+        headers: dict[str, str] | None = None,
+        read_timeout: float,
+        deadline: float | None = None,
+        breaker: CircuitBreaker | None = None,
+    ) -> dict[str, Any]:
+        """POST ``payload`` and return the decoded JSON body.
+
+        ``deadline`` is a ``time.monotonic()`` value; no attempt or backoff
+        runs past it. Raises ``CircuitOpen`` without sending anything when
+        ``breaker`` is open, otherwise the last error once retries or time
+        run out.
+        """
+        if breaker is not None and not breaker.allow():
+            raise CircuitOpen(f"{breaker.name} circuit is open")
+        try:
+            data = self._post_with_retries(url, payload, headers, read_timeout, deadline)
+        except Exception:
+            if breaker is not None:
+                breaker.record_failure()
+            raise
+        if breaker is not None:
+            breaker.record_success()
+        return data
+
+    def _post_with_retries(
+        self,
+        url: str,
+        payload: dict[str, Any],
+        headers: dict[str, str] | None,
+        read_timeout: float,
+        deadline: float | None,
+    ) -> dict[str, Any]:
+        attempt = 0
+        while True:
+            timeout = read_timeout
+            if deadline is not None:
+                timeout = min(timeout, deadline - time.monotonic())
+                if timeout <= 0.05:
+                    raise DeadlineExceeded(f"deadline exceeded before POST {url}")
+            try:
+                response = self.session.post(
+                    url, json=payload, headers=headers,
+                    timeout=(min(self.connect_timeout, timeout), timeout),
+                )
+                if response.status_code not in _RETRY_STATUS:
+                    response.raise_for_status()
+                    return response.json()
+                error: Exception = requests.HTTPError(
+                    f"{response.status_code} from {url}", response=response,
+                )
+            except (requests.ConnectionError, requests.Timeout) as exc:
+                error = exc
+
+            if attempt >= self.retries:
+                raise error
+            # Full jitter: spreads retries from concurrent callers
+            delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+            if deadline is not None and time.monotonic() + delay >= deadline:
+                raise error
+            attempt += 1
+            logger.debug("[http] Retry %d for %s in %.2fs: %s", attempt, url, delay, error)
+            time.sleep(delay)
@@ -0,0 +1,148 @@
+"""Web search backends and the result cache in front of them.
+
+``WEB_SEARCH_PROVIDER`` selects the backend:
+
+- ``tavily`` (default): one long-lived ``TavilyClient``, created on first use.
+- ``stub``: deterministic local results with configurable latency
+  (``WEB_SEARCH_STUB_LATENCY``), for tests and load benchmarks.
+
+``SearchCache`` keys results by the normalized query (NFKC, case-folded,
+whitespace collapsed), bounded by entry count and TTL, and coalesces
+concurrent identical searches into one backend call.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from collections.abc import Callable
+from concurrent.futures import Future
+from typing import Protocol
+
+logger = logging.getLogger(__name__)
+
+WEB_SEARCH_PROVIDER = os.getenv("WEB_SEARCH_PROVIDER", "tavily")
+
+
+class SearchProvider(Protocol):
+    name: str
+
+    def search(self, query: str, max_results: int) -> list[dict]:
+        """Results as ``{"title", "url", "content"}`` dicts, best first."""
+        ...
+
+
+class TavilyProvider:
+    name = "tavily"
+
+    def __init__(self, api_key: str) -> None:
+        self._api_key = api_key
+        self._client = None
+        self._lock = threading.Lock()
+
+    def _get_client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from tavily import TavilyClient
+                    self._client = TavilyClient(api_key=self._api_key)
+        return self._client
+
+    def search(self, query: str, max_results: int) -> list[dict]:
+        resp = self._get_client().search(
+            query, max_results=max_results, search_depth="basic", include_answer=False,
+        )
+        return [
+            {"title": r.get("title", ""), "url": r.get("url", ""), "content": r.get("content", "")}
+            for r in resp.get("results", [])
+        ]
+
+
+class StubProvider:
+    name = "stub"
+
+    def __init__(self, latency: float = 0.0) -> None:
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def search(self, query: str, max_results: int) -> list[dict]:
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        slug = hashlib.sha1(query.encode("utf-8")).hexdigest()[:10]
+        return [
+            {
+                "title": f"{query} — result {i + 1}",
+                "url": f"https://search.invalid/{slug}/{i + 1}",
+                "content": f"Stub result {i + 1} for {query}.",
+            }
+            for i in range(max_results)
+        ]
+
+
+def create_provider(name: str = WEB_SEARCH_PROVIDER) -> SearchProvider:
+    if name == "stub":
+        return StubProvider(latency=float(os.getenv("WEB_SEARCH_STUB_LATENCY", "0")))
+    if name != "tavily":
+        logger.warning("[search] Unknown WEB_SEARCH_PROVIDER %r, using tavily", name)
+    return TavilyProvider(api_key=os.environ.get("TAVILY_API_KEY", ""))
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(unicodedata.normalize("NFKC", query).casefold().split())
+
+
+class SearchCache:
+    def __init__(self, max_entries: int, ttl_seconds: float) -> None:
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[tuple, tuple[float, list[dict]]] = OrderedDict()
+        self._inflight: dict[tuple, Future] = {}
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0}
+
+    def get_or_search(self, key: tuple, search: Callable[[], list[dict]]) -> list[dict]:
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None:
+                if time.time() - item[0] < self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return item[1]
+                del self._entries[key]
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+                self.stats["misses"] += 1
+            else:
+                self.stats["coalesced"] += 1
+        if not leader:
+            return future.result()
+
+        try:
+            results = search()
+            with self._lock:
+                self._entries[key] = (time.time(), results)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            future.set_result(results)
+            return results
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {**self.stats, "entries": len(self._entries)}
@@ -0,0 +1,156 @@
+"""In-process cache of the key/value ``settings`` table.
+
+All settings are loaded in one query into an immutable snapshot with typed
+accessors. Any committed ORM write to a ``Settings`` row bumps the store
+version, so the next read reloads; a short TTL covers writes made by other
+processes. Rows that hold background run state rather than configuration
+(``RUN_STATE_KEY_PREFIXES``) are written on every batch, so they are left
+out of the snapshot and do not invalidate it; their owners query them
+directly. Sync callers use ``settings_store.snapshot()``, async callers
+``await settings_store.asnapshot()``, which only leaves the event loop when
+a reload is actually needed.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.models.models import Settings
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on staleness for writes this process did not see.
+SETTINGS_TTL_SECONDS = 30.0
+# Cursors and run state kept in ``settings`` by maintenance_service and the
+# daily merge in summary_service
+RUN_STATE_KEY_PREFIXES = ("maintenance_merge_cursor", "maintenance_stage_", "daily_merge_state_")
+
+
+def is_run_state_key(key: str | None) -> bool:
+    return bool(key) and key.startswith(RUN_STATE_KEY_PREFIXES)
+
+
+@dataclass(frozen=True)
+class SettingsSnapshot:
+    values: dict[str, str] = field(default_factory=dict)
+    version: int = 0
+
+    def get(self, key: str, default: str = "") -> str:
+        value = self.values.get(key)
+        return default if value is None else value
+
+    def get_int(self, key: str, default: int) -> int:
+        try:
+            return int(str(self.values[key]).strip())
+        except (KeyError, TypeError, ValueError):
+            return default
+
+    def get_float(self, key: str, default: float) -> float:
+        try:
+            return float(str(self.values[key]).strip())
+        except (KeyError, TypeError, ValueError):
+            return default
+
+    def get_bool(self, key: str, default: bool) -> bool:
+        value = self.values.get(key)
+        if value is None:
+            return default
+        return value.strip().lower() == "true"
+
+
+class SettingsStore:
+    def __init__(self, ttl_seconds: float = SETTINGS_TTL_SECONDS) -> None:
+        self._ttl = ttl_seconds
+        self._lock = threading.Lock()
+        self._snapshot: SettingsSnapshot | None = None
+        self._loaded_at = 0.0
+        self._version = 0
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._version += 1
+
+    def _fresh(self) -> SettingsSnapshot | None:
+        snap = self._snapshot
+        if (
+            snap is not None
+            and snap.version == self._version
+            and time.monotonic() - self._loaded_at < self._ttl
+        ):
+            return snap
+        return None
+
+    def snapshot(self, db: Session | None = None) -> SettingsSnapshot:
+        """Return the cached snapshot, reloading it (one query) when stale."""
+        snap = self._fresh()
+        if snap is not None:
+            return snap
+        return self._reload(db)
+
+    async def asnapshot(self) -> SettingsSnapshot:
+        snap = self._fresh()
+        if snap is not None:
+            return snap
+        return await asyncio.to_thread(self._reload, None)
+
+    def _reload(self, db: Session | None) -> SettingsSnapshot:
+        version = self._version
+        if db is None:
+            from app.database import SessionLocal
+
+            session = SessionLocal()
+        else:
+            session = db
+        try:
+            rows = [
+                row for row in session.query(Settings.key, Settings.value).all()
+                if not is_run_state_key(row.key)
+            ]
+        except Exception:
+            logger.exception("Failed to load settings, serving previous snapshot")
+            return self._snapshot or SettingsSnapshot()
+        finally:
+            if db is None:
+                session.close()
+        snap = SettingsSnapshot({row.key: row.value for row in rows}, version)
+        with self._lock:
+            # A write committed during the load bumped the version: keep it stale
+            self._snapshot = snap
+            self._loaded_at = time.monotonic()
+        return snap
+
+
+settings_store = SettingsStore()
+
+
+# ── Invalidation on committed writes ─────────────────────────────────────────
+
+def _mark_settings_dirty(mapper: Any, connection: Any, target: Settings) -> None:
+    if is_run_state_key(target.key):
+        return
+    session = Session.object_session(target)
+    if session is not None:
+        session.info["settings_dirty"] = True
+
+
+for _evt in ("after_insert", "after_update", "after_delete"):
+    event.listen(Settings, _evt, _mark_settings_dirty)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session: Session) -> None:
+    if session.info.pop("settings_dirty", False):
+        settings_store.invalidate()
+
+
+@event.listens_for(Session, "after_rollback")
+def _clear_after_rollback(session: Session) -> None:
+    session.info.pop("settings_dirty", None)
@@ -3,7 +3,12 @@ from __future__ import annotations
 import asyncio
 import json
 import logging
+import os
+import random
 import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from typing import Any
 
@@ -26,11 +31,34 @@ from app.models.models import (
     UserProfile,
 )
 from app.services.core_blocks_updater import CoreBlocksUpdater
+from app.services.settings_store import settings_store
 
 logger = logging.getLogger(__name__)
 
 TZ_EAST8 = timezone(timedelta(hours=8))
 
+# Midnight daily → longterm roll-over: per-assistant run state lives in
+# Settings under this prefix so missed runs are caught up after a restart.
+DAILY_MERGE_STATE_KEY_PREFIX = "daily_merge_state_"
+DAILY_MERGE_CONCURRENCY = int(os.getenv("DAILY_MERGE_CONCURRENCY", "3"))
+# Random delay before each run so restarts / midnight don't all fire at once
+DAILY_MERGE_JITTER_SECONDS = 120
+# Retry interval for assistants whose merge failed
+DAILY_MERGE_RETRY_SECONDS = 1800
+
+# Layer merges: one LLM call gets at most MERGE_INPUT_FACTOR × the layer's
+# output size (summary_budget_<layer> // 2 chars). Overflowing summaries are
+# first merged chunk by chunk; past MERGE_MAX_LEVELS rounds the digests are
+# clipped so every round at least halves the parts and the reduction ends.
+MERGE_INPUT_FACTOR = 6
+MERGE_MAX_LEVELS = 3
+
+_daily_merge_executor = ThreadPoolExecutor(
+    max_workers=DAILY_MERGE_CONCURRENCY, thread_name_prefix="daily-merge"
+)
+# On-demand layer merges (after trimming, from the flush endpoint)
+_layer_merge_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="layer-merge")
+
 
 def _call_model_raw(
     db: Session, preset: ModelPreset, system_prompt: str, user_text: str,
@@ -138,28 +166,9 @@ class SummaryService:
             if not messages:
                 return
 
-            assistant = db.get(Assistant, assistant_id)
-            if not assistant:
-                logger.warning(
-                    "Summary skipped: assistant not found (assistant_id=%s).",
-                    assistant_id,
-                )
-                return
-
-            primary_preset = self._resolve_primary_preset(db, assistant)
-            if not primary_preset:
-                logger.warning(
-                    "Summary skipped: no available preset (assistant_id=%s).",
-                    assistant_id,
-                )
+            context = self.build_summary_context(db, session_id, assistant_id)
+            if context is None:
                 return
-            fallback_preset = self._resolve_fallback_preset(db, assistant)
-            session_row = db.get(ChatSession, session_id)
-            is_chat_session = session_row is None or session_row.type == "chat"
-
-            user_profile = db.query(UserProfile).first()
-            user_name = user_profile.nickname if user_profile and user_profile.nickname else "User"
-            assistant_name = assistant.name or "Assistant"
 
             # Split: trimmed messages (being compressed) + retained (still in context)
             trimmed_msgs = sorted(messages, key=lambda m: (m.created_at, m.id))
@@ -180,17 +189,53 @@ class SummaryService:
                 len(trimmed_msgs), len(retained_msgs), session_id, max_trimmed_id,
             )
 
-            trimmed_text = self._format_messages(trimmed_msgs or messages, user_name, assistant_name)
-            if not trimmed_text.strip():
+            conversation_text = self.format_for_summary(context, trimmed_msgs or messages)
+            if not conversation_text.strip():
                 logger.warning("Summary skipped: no usable message content (session_id=%s).", session_id)
                 return
 
-            conversation_text = trimmed_text
+            parsed_payload = self.summarize_text(db, context, session_id, conversation_text)
+            if not parsed_payload:
+                return
+            self.store_summary(db, context, session_id, messages, parsed_payload)
+        except Exception:
+            logger.exception("Failed to generate summary (session_id=%s).", session_id)
+        finally:
+            db.close()
+
+    # ── Summary steps (shared with the backlog summarizer) ───────────────
+
+    def build_summary_context(
+        self, db: Session, session_id: int, assistant_id: int
+    ) -> dict[str, Any] | None:
+        """Resolve presets and the system prompt; plain values, safe to share across threads."""
+        assistant = db.get(Assistant, assistant_id)
+        if not assistant:
+            logger.warning(
+                "Summary skipped: assistant not found (assistant_id=%s).",
+                assistant_id,
+            )
+            return None
+
+        primary_preset = self._resolve_primary_preset(db, assistant)
+        if not primary_preset:
+            logger.warning(
+                "Summary skipped: no available preset (assistant_id=%s).",
+                assistant_id,
+            )
+            return None
+        fallback_preset = self._resolve_fallback_preset(db, assistant)
+        session_row = db.get(ChatSession, session_id)
+        is_chat_session = session_row is None or session_row.type == "chat"
+
+        user_profile = db.query(UserProfile).first()
+        user_name = user_profile.nickname if user_profile and user_profile.nickname else "User"
+        assistant_name = assistant.name or "Assistant"
 
-            # Build system prompt: full persona + summary/extraction tasks
-            base_persona = (assistant.system_prompt or "").strip()
+        # Build system prompt: full persona + summary/extraction tasks
+        base_persona = (assistant.system_prompt or "").strip()
 
-            task_instructions = f"""
+        task_instructions = f"""
 系统提示：
 你正在回顾刚才的对话，为自己的记忆系统整理内容。只返回JSON，不要多余文字。
 对以下对话写摘要和提取记忆。
@@ -229,122 +274,164 @@ sad/angry/anxious/tired/emo/happy/flirty/proud/calm
 memories 为空时写 "memories": []
 """.strip()
 
-            if is_chat_session:
-                system_prompt = base_persona + "\n\n" + task_instructions if base_persona else task_instructions
-            else:
-                # Group session: no mood_tag
-                group_task = task_instructions.replace(
-                    f'根据对话末尾{user_name}的状态判断当前情绪，从以下选一个：\nsad/angry/anxious/tired/emo/happy/flirty/proud/calm',
-                    '',
-                ).replace(', "mood_tag": "..."', '')
-                system_prompt = base_persona + "\n\n" + group_task if base_persona else group_task
-
-            parsed_payload: dict[str, Any] | None = None
-            try:
-                parsed_payload = self._call_summary_model(
-                    db,
-                    primary_preset,
-                    system_prompt,
-                    conversation_text,
-                )
-            except Exception:
-                logger.exception(
-                    "Primary summary model failed (session_id=%s, preset_id=%s).",
+        if is_chat_session:
+            system_prompt = base_persona + "\n\n" + task_instructions if base_persona else task_instructions
+        else:
+            # Group session: no mood_tag
+            group_task = task_instructions.replace(
+                f'根据对话末尾{user_name}的状态判断当前情绪，从以下选一个：\nsad/angry/anxious/tired/emo/happy/flirty/proud/calm',
+                '',
+            ).replace(', "mood_tag": "..."', '')
+            system_prompt = base_persona + "\n\n" + group_task if base_persona else group_task
+
+        return {
+            "assistant_id": assistant.id,
+            "primary_preset_id": primary_preset.id,
+            "fallback_preset_id": fallback_preset.id if fallback_preset else None,
+            "is_chat_session": is_chat_session,
+            "user_name": user_name,
+            "assistant_name": assistant_name,
+            "system_prompt": system_prompt,
+        }
+
+    def format_for_summary(self, context: dict[str, Any], messages: list[Message]) -> str:
+        return self._format_messages(messages, context["user_name"], context["assistant_name"])
+
+    def summarize_text(
+        self, db: Session, context: dict[str, Any], session_id: int, conversation_text: str,
+    ) -> dict[str, Any] | None:
+        """Call the summary model (primary, then fallback); no writes."""
+        primary_preset = db.get(ModelPreset, context["primary_preset_id"])
+        fallback_id = context["fallback_preset_id"]
+        fallback_preset = db.get(ModelPreset, fallback_id) if fallback_id else None
+        system_prompt = context["system_prompt"]
+
+        parsed_payload: dict[str, Any] | None = None
+        try:
+            parsed_payload = self._call_summary_model(
+                db,
+                primary_preset,
+                system_prompt,
+                conversation_text,
+            )
+        except Exception:
+            logger.exception(
+                "Primary summary model failed (session_id=%s, preset_id=%s).",
+                session_id,
+                primary_preset.id,
+            )
+            if fallback_preset and fallback_preset.id != primary_preset.id:
+                try:
+                    parsed_payload = self._call_summary_model(
+                        db,
+                        fallback_preset,
+                        system_prompt,
+                        conversation_text,
+                    )
+                except Exception:
+                    logger.exception(
+                        "Fallback summary model failed (session_id=%s, preset_id=%s).",
+                        session_id,
+                        fallback_preset.id,
+                    )
+            elif fallback_preset and fallback_preset.id == primary_preset.id:
+                logger.warning(
+                    "Fallback preset equals primary preset (session_id=%s, preset_id=%s).",
                     session_id,
                     primary_preset.id,
                 )
-                if fallback_preset and fallback_preset.id != primary_preset.id:
-                    try:
-                        parsed_payload = self._call_summary_model(
-                            db,
-                            fallback_preset,
-                            system_prompt,
-                            conversation_text,
-                        )
-                    except Exception:
-                        logger.exception(
-                            "Fallback summary model failed (session_id=%s, preset_id=%s).",
-                            session_id,
-                            fallback_preset.id,
-                        )
-                elif fallback_preset and fallback_preset.id == primary_preset.id:
-                    logger.warning(
-                        "Fallback preset equals primary preset (session_id=%s, preset_id=%s).",
-                        session_id,
-                        primary_preset.id,
-                    )
-            if not parsed_payload:
-                return
+        return parsed_payload or None
 
-            summary_text = str(parsed_payload.get("summary", "")).strip()
-            if not summary_text:
-                logger.warning("Summary skipped: empty summary content (session_id=%s).", session_id)
-                return
+    def store_summary(
+        self,
+        db: Session,
+        context: dict[str, Any],
+        session_id: int,
+        messages: list[Message],
+        parsed_payload: dict[str, Any],
+    ) -> int | None:
+        """Write the SessionSummary for ``messages`` and mark them; returns the summary id."""
+        summary_text = str(parsed_payload.get("summary", "")).strip()
+        if not summary_text:
+            logger.warning("Summary skipped: empty summary content (session_id=%s).", session_id)
+            return None
 
-            valid_moods = {
-                "sad",
-                "angry",
-                "anxious",
-                "tired",
-                "emo",
-                "happy",
-                "flirty",
-                "proud",
-                "calm",
-            }
-            mood_tag = None
-            if is_chat_session:
-                mood_tag_raw = str(parsed_payload.get("mood_tag", "")).strip().lower()
-                mood_tag = mood_tag_raw if mood_tag_raw in valid_moods else None
-
-            msg_ids = [message.id for message in messages if message.id is not None]
-            msg_id_start = msg_ids[0] if msg_ids else None
-            msg_id_end = msg_ids[-1] if msg_ids else None
-            time_start = self._to_utc(messages[0].created_at) if messages else None
-            time_end = self._to_utc(messages[-1].created_at) if messages else None
-            summary = SessionSummary(
-                session_id=session_id,
-                assistant_id=assistant_id,
-                summary_content=summary_text,
-                perspective=assistant_name,
-                msg_id_start=msg_id_start,
-                msg_id_end=msg_id_end,
-                time_start=time_start,
-                time_end=time_end,
-                mood_tag=mood_tag,
+        valid_moods = {
+            "sad",
+            "angry",
+            "anxious",
+            "tired",
+            "emo",
+            "happy",
+            "flirty",
+            "proud",
+            "calm",
+        }
+        mood_tag = None
+        if context["is_chat_session"]:
+            mood_tag_raw = str(parsed_payload.get("mood_tag", "")).strip().lower()
+            mood_tag = mood_tag_raw if mood_tag_raw in valid_moods else None
+
+        summary_embedding = self._embed_summary(summary_text)
+
+        assistant_id = context["assistant_id"]
+        msg_ids = [message.id for message in messages if message.id is not None]
+        msg_id_start = msg_ids[0] if msg_ids else None
+        msg_id_end = msg_ids[-1] if msg_ids else None
+        time_start = self._to_utc(messages[0].created_at) if messages else None
+        time_end = self._to_utc(messages[-1].created_at) if messages else None
+        summary = SessionSummary(
+            session_id=session_id,
+            assistant_id=assistant_id,
+            summary_content=summary_text,
+            perspective=context["assistant_name"],
+            msg_id_start=msg_id_start,
+            msg_id_end=msg_id_end,
+            time_start=time_start,
+            time_end=time_end,
+            mood_tag=mood_tag,
+            embedding=summary_embedding,
+        )
+        db.add(summary)
+        db.flush()
+
+        # Clear manual mood flag when auto-summary detects mood
+        if mood_tag:
+            manual_row = db.query(Settings).filter(Settings.key == "mood_manual").first()
+            if manual_row:
+                manual_row.value = "false"
+            else:
+                db.add(Settings(key="mood_manual", value="false"))
+
+        if msg_ids:
+            updated = db.query(Message).filter(Message.id.in_(msg_ids)).update(
+                {Message.summary_group_id: summary.id},
+                synchronize_session=False,
             )
-            db.add(summary)
-            db.flush()
-
-            # Clear manual mood flag when auto-summary detects mood
-            if mood_tag:
-                manual_row = db.query(Settings).filter(Settings.key == "mood_manual").first()
-                if manual_row:
-                    manual_row.value = "false"
-                else:
-                    db.add(Settings(key="mood_manual", value="false"))
+            logger.info("Marked %d/%d messages with summary_group_id=%s", updated, len(msg_ids), summary.id)
 
-            if msg_ids:
-                updated = db.query(Message).filter(Message.id.in_(msg_ids)).update(
-                    {Message.summary_group_id: summary.id},
-                    synchronize_session=False,
-                )
-                logger.info("Marked %d/%d messages with summary_group_id=%s", updated, len(msg_ids), summary.id)
+        db.commit()
+        logger.info("Summary generated OK (session_id=%s, summary_id=%s, mood=%s).",
+                    session_id, summary.id, mood_tag)
 
-            db.commit()
-            logger.info("Summary generated OK (session_id=%s, summary_id=%s, mood=%s).",
-                        session_id, summary.id, mood_tag)
+        # Process extracted memories → pending_memories table
+        raw_memories = parsed_payload.get("memories", [])
+        if isinstance(raw_memories, list) and raw_memories:
+            self._process_extracted_memories(db, raw_memories, summary.id, time_end)
 
-            # Process extracted memories → pending_memories table
-            raw_memories = parsed_payload.get("memories", [])
-            if isinstance(raw_memories, list) and raw_memories:
-                self._process_extracted_memories(db, raw_memories, summary.id, time_end)
+        self._dispatch_core_block_signal(summary.id, assistant_id)
+        return summary.id
 
-            self._dispatch_core_block_signal(summary.id, assistant.id)
-        except Exception:
-            logger.exception("Failed to generate summary (session_id=%s).", session_id)
-        finally:
-            db.close()
+    @staticmethod
+    def _embed_summary(summary_text: str) -> list[float] | None:
+        """Embed a summary for vector search; None leaves it to the maintenance backfill."""
+        from app.services.embedding_service import EmbeddingService
+
+        try:
+            return EmbeddingService().get_embedding(summary_text)
+        except Exception as exc:
+            logger.warning("Summary embedding unavailable, deferring to backfill: %s", exc)
+            return None
 
     def _process_extracted_memories(
         self, db: Session, raw_memories: list[dict[str, Any]], summary_id: int,
@@ -636,9 +723,8 @@ memories 为空时写 "memories": []
 
             # Build merge input: existing clean content + pending summaries
             # For longterm: try to use daily's compressed version instead of raw summaries
+            existing = (row.content or "").strip()
             parts: list[str] = []
-            if row.content and row.content.strip():
-                parts.append(row.content.strip())
 
             if layer_type == "longterm" and pending:
                 # Look up daily history to find compressed versions
@@ -672,9 +758,7 @@ memories 为空时写 "memories": []
                     if s.summary_content and s.summary_content.strip():
                         parts.append(s.summary_content.strip())
 
-            merge_input = "\n\n".join(parts)
-
-            if not merge_input.strip():
+            if not existing and not parts:
                 row.needs_merge = False
                 db.commit()
                 return
@@ -691,9 +775,27 @@ memories 为空时写 "memories": []
             assistant_name = assistant.name or "Assistant"
 
             budget_key = f"summary_budget_{layer_type}"
-            budget_row = db.query(Settings).filter(Settings.key == budget_key).first()
-            budget_tokens = int(budget_row.value) if budget_row else (800 if layer_type != "recent" else 2000)
+            budget_tokens = settings_store.snapshot(db).get_int(
+                budget_key, 800 if layer_type != "recent" else 2000,
+            )
             max_chars = budget_tokens // 2
+            max_input_chars = max_chars * MERGE_INPUT_FACTOR
+
+            # Oversized layer text: older sections are kept verbatim, only the
+            # newest part (up to half the input budget) is re-merged
+            carried, existing = self._split_carried_sections(existing, max_input_chars // 2)
+            parts = self._reduce_merge_parts(
+                db, assistant, preset, parts,
+                input_chars=max_input_chars - len(existing),
+                digest_chars=max_chars,
+                assistant_name=assistant_name,
+                user_name=user_name,
+                label=f"{layer_type} assistant_id={assistant_id}",
+            )
+            if parts is None:
+                logger.warning("[merge_layer] Chunk merge failed for %s assistant_id=%s", layer_type, assistant_id)
+                return
+            merge_input = "\n\n".join(p for p in (existing, *parts) if p)
 
             if layer_type == "daily":
                 prompt = (
@@ -722,31 +824,12 @@ memories 为空时写 "memories": []
                     f"只输出合并后的文本，不要JSON，不要多余解释。"
                 )
 
-            merged = None
-            try:
-                merged = _call_model_raw(db, preset, prompt, merge_input, timeout=60.0)
-                merged = (merged or "").strip()
-            except Exception:
-                logger.warning(
-                    "[merge_layer] Primary preset failed for %s assistant_id=%s, trying fallback",
-                    layer_type, assistant_id,
-                )
-            if not merged:
-                fallback = self._resolve_fallback_preset(db, assistant)
-                if fallback and fallback.id != preset.id:
-                    try:
-                        merged = _call_model_raw(db, fallback, prompt, merge_input, timeout=60.0)
-                        merged = (merged or "").strip()
-                        if merged:
-                            logger.info(
-                                "[merge_layer] %s merged via fallback for assistant_id=%s",
-                                layer_type, assistant_id,
-                            )
-                    except Exception:
-                        logger.exception(
-                            "[merge_layer] Fallback also failed for %s assistant_id=%s",
-                            layer_type, assistant_id,
-                        )
+            merged = self._call_merge_model(
+                db, assistant, preset, prompt, merge_input,
+                label=f"{layer_type} assistant_id={assistant_id}",
+            )
+            if merged and carried:
+                merged = f"{carried}\n\n{merged}"
             if merged:
                 new_ids = [s.id for s in pending]
                 # Save current clean content to history before overwriting
@@ -790,8 +873,143 @@ memories 为空时写 "memories": []
         finally:
             db.close()
 
+    def _call_merge_model(
+        self,
+        db: Session,
+        assistant: Assistant,
+        preset: ModelPreset,
+        prompt: str,
+        merge_input: str,
+        *,
+        label: str,
+    ) -> str | None:
+        """One merge call: primary preset, then the fallback preset."""
+        merged = None
+        try:
+            merged = _call_model_raw(db, preset, prompt, merge_input, timeout=60.0)
+            merged = (merged or "").strip()
+        except Exception:
+            logger.warning("[merge_layer] Primary preset failed for %s, trying fallback", label)
+        if not merged:
+            fallback = self._resolve_fallback_preset(db, assistant)
+            if fallback and fallback.id != preset.id:
+                try:
+                    merged = _call_model_raw(db, fallback, prompt, merge_input, timeout=60.0)
+                    merged = (merged or "").strip()
+                    if merged:
+                        logger.info("[merge_layer] %s merged via fallback", label)
+                except Exception:
+                    logger.exception("[merge_layer] Fallback also failed for %s", label)
+        return merged or None
+
+    @staticmethod
+    def _split_carried_sections(content: str, max_chars: int) -> tuple[str, str]:
+        """Split layer text into (carried-over prefix, tail to re-merge).
+
+        Paragraphs are taken from the end while they fit in ``max_chars``;
+        the newest paragraph is always re-merged, cut to ``max_chars``.
+        """
+        if len(content) <= max_chars:
+            return "", content
+        sections = [p.strip() for p in content.split("\n\n") if p.strip()]
+        tail: list[str] = []
+        size = 0
+        while sections:
+            section = sections[-1]
+            if tail and size + len(section) + 2 > max_chars:
+                break
+            tail.insert(0, section)
+            size += len(section) + 2
+            sections.pop()
+        carried = "\n\n".join(sections)
+        tail_text = "\n\n".join(tail)
+        if len(tail_text) > max_chars:
+            cut = tail_text[:-max_chars]
+            carried = f"{carried}\n\n{cut}".strip() if carried else cut
+            tail_text = tail_text[-max_chars:]
+        return carried, tail_text
+
+    @staticmethod
+    def _chunk_texts(parts: list[str], max_chars: int) -> list[list[str]]:
+        """Group parts, in order, into chunks of at most ``max_chars`` chars."""
+        chunks: list[list[str]] = []
+        current: list[str] = []
+        size = 0
+        for part in parts:
+            # A single oversized part is sliced so no chunk exceeds the cap
+            pieces = [part[i:i + max_chars] for i in range(0, len(part), max_chars)] or [part]
+            for piece in pieces:
+                if current and size + len(piece) + 2 > max_chars:
+                    chunks.append(current)
+                    current, size = [], 0
+                current.append(piece)
+                size += len(piece) + 2
+        if current:
+            chunks.append(current)
+        return chunks
+
+    def _reduce_merge_parts(
+        self,
+        db: Session,
+        assistant: Assistant,
+        preset: ModelPreset,
+        parts: list[str],
+        *,
+        input_chars: int,
+        digest_chars: int,
+        assistant_name: str,
+        user_name: str,
+        label: str,
+    ) -> list[str] | None:
+        """Merge pending parts chunk by chunk until they fit in ``input_chars``.
+
+        Every part ends up in the result (the caller marks all pending
+        summaries as merged), so nothing is dropped to make it fit. Returns
+        the (possibly digested) parts, or None if a chunk merge failed.
+        """
+        input_chars = max(input_chars, digest_chars * 2)
+        # Two clipped digests always share a chunk
+        clip_chars = min(digest_chars, input_chars // 2 - 2)
+        prompt = (
+            f"你是{assistant_name}，{user_name}的AI伴侣。你在整理自己的记忆片段。\n\n"
+            f"请将以下几段记忆合并为一段：\n"
+            f"- 按时间先后顺序整理\n"
+            f"- 保留关键事件、情绪变化、偏好和约定，去除重复信息\n"
+            f"- 保留原文中的具体时间\n"
+            f"- 控制在{digest_chars}字以内\n"
+            f"- \"我\"= {assistant_name}\n\n"
+            f"只输出合并后的文本，不要JSON，不要多余解释。"
+        )
+        level = 0
+        while sum(len(p) + 2 for p in parts) > input_chars:
+            level += 1
+            clip = level > MERGE_MAX_LEVELS
+            if level == MERGE_MAX_LEVELS + 1:
+                logger.warning(
+                    "[merge_layer] %s: still over %d chars after %d levels, clipping digests to %d chars",
+                    label, input_chars, MERGE_MAX_LEVELS, clip_chars,
+                )
+            chunks = self._chunk_texts(parts, input_chars)
+            logger.info(
+                "[merge_layer] %s: level %d, %d parts → %d chunks",
+                label, level, len(parts), len(chunks),
+            )
+            digests: list[str] = []
+            for chunk in chunks:
+                if len(chunk) == 1 and len(chunk[0]) <= (clip_chars if clip else digest_chars):
+                    digests.append(chunk[0])
+                    continue
+                digest = self._call_merge_model(
+                    db, assistant, preset, prompt, "\n\n".join(chunk), label=label,
+                )
+                if not digest:
+                    return None
+                digests.append(digest[:clip_chars] if clip else digest)
+            parts = digests
+        return parts
+
     def merge_layers_async(self, assistant_id: int, layer_types: tuple[str, ...] | None = None) -> None:
-        """Merge specified layers in background thread."""
+        """Merge specified layers on the bounded layer-merge pool."""
         if layer_types is None:
             layer_types = ("daily", "longterm")
 
@@ -799,14 +1017,15 @@ memories 为空时写 "memories": []
             for lt in layer_types:
                 self.merge_layer(assistant_id, lt)
 
-        threading.Thread(target=_worker, daemon=True).start()
+        _layer_merge_executor.submit(_worker)
 
-    def daily_merge_to_longterm(self, assistant_id: int) -> None:
+    def daily_merge_to_longterm(self, assistant_id: int) -> bool:
         """Move daily compressed content into longterm (called by midnight cron).
 
         Strategy: daily's clean merged content feeds into longterm.
         Summaries transfer from daily → longterm with merged_at_version set
         (already consumed by daily, will be consumed again by longterm merge).
+        Returns False if the roll-over failed.
         """
         db: Session = self.session_factory()
         try:
@@ -819,7 +1038,7 @@ memories 为空时写 "memories": []
                 .first()
             )
             if not daily:
-                return
+                return True
 
             # If daily still needs merge, merge it first
             if daily.needs_merge:
@@ -839,7 +1058,7 @@ memories 为空时写 "memories": []
             )
 
             if not has_daily_content and not daily_summaries:
-                return
+                return True
 
             # Ensure longterm row exists
             longterm = (
@@ -904,8 +1123,10 @@ memories 为空时写 "memories": []
             # Now merge longterm (existing longterm content + daily content appended above)
             self.merge_layer(assistant_id, "longterm")
             logger.info("[daily_merge_to_longterm] Completed for assistant_id=%s", assistant_id)
+            return True
         except Exception:
             logger.exception("[daily_merge_to_longterm] Failed for assistant_id=%s", assistant_id)
+            return False
         finally:
             db.close()
 
@@ -913,38 +1134,146 @@ memories 为空时写 "memories": []
 # ── Module-level midnight cron ───────────────────────────────────────────────
 
 
-async def daily_merge_cron() -> None:
-    """Run at midnight (Beijing time) each day: merge daily → longterm for all assistants."""
+def _beijing_date() -> str:
+    return datetime.now(TZ_EAST8).date().isoformat()
+
+
+def _read_daily_merge_states(db: Session) -> dict[int, dict[str, Any]]:
+    rows = (
+        db.query(Settings)
+        .filter(Settings.key.like(f"{DAILY_MERGE_STATE_KEY_PREFIX}%"))
+        .all()
+    )
+    states: dict[int, dict[str, Any]] = {}
+    for row in rows:
+        try:
+            aid = int(row.key[len(DAILY_MERGE_STATE_KEY_PREFIX):])
+            value = json.loads(row.value or "{}")
+        except (ValueError, TypeError):
+            logger.warning("[daily_merge_cron] Invalid run state %s, ignoring", row.key)
+            continue
+        if isinstance(value, dict):
+            states[aid] = value
+    return states
+
+
+def _write_daily_merge_state(db: Session, assistant_id: int, value: dict[str, Any]) -> None:
+    key = f"{DAILY_MERGE_STATE_KEY_PREFIX}{assistant_id}"
+    payload = json.dumps(value, ensure_ascii=False)
+    row = db.query(Settings).filter(Settings.key == key).first()
+    if row:
+        row.value = payload
+        row.updated_at = datetime.now(timezone.utc)
+    else:
+        db.add(Settings(key=key, value=payload))
+
+
+def _pending_daily_merges_sync() -> list[int]:
+    """Assistants whose daily layer has not been rolled over for today (UTC+8)."""
     from app.database import SessionLocal
 
-    while True:
+    today = _beijing_date()
+    db = SessionLocal()
+    try:
+        assistant_ids = [
+            row.id
+            for row in db.query(Assistant.id).filter(Assistant.deleted_at.is_(None)).all()
+        ]
+        states = _read_daily_merge_states(db)
+        pending: list[int] = []
+        for aid in assistant_ids:
+            state = states.get(aid)
+            if state is None:
+                # Not tracked yet (first deploy / new assistant): due next midnight
+                _write_daily_merge_state(db, aid, {"last_date": today})
+            elif str(state.get("last_date") or "") < today:
+                pending.append(aid)
+        db.commit()
+        return pending
+    finally:
+        db.close()
+
+
+def _run_daily_merge_sync(assistant_id: int) -> bool:
+    """Roll one assistant's daily layer into longterm and record the outcome."""
+    from app.database import SessionLocal
+
+    today = _beijing_date()
+    started = time.monotonic()
+    ok = SummaryService(SessionLocal).daily_merge_to_longterm(assistant_id)
+    db = SessionLocal()
+    try:
+        state = _read_daily_merge_states(db).get(assistant_id, {})
+        state.update({
+            "last_run_at": datetime.now(timezone.utc).isoformat(),
+            "last_duration_ms": int((time.monotonic() - started) * 1000),
+            "last_ok": ok,
+        })
+        if ok:
+            state["last_date"] = today
+        _write_daily_merge_state(db, assistant_id, state)
+        db.commit()
+    finally:
+        db.close()
+    return ok
+
+
+async def run_daily_merges(
+    assistant_ids: list[int],
+    merge: Callable[[int], bool] = _run_daily_merge_sync,
+) -> list[bool]:
+    """Run ``merge`` for each assistant on the daily-merge executor.
+
+    At most DAILY_MERGE_CONCURRENCY merges run at once; the event loop only
+    awaits their futures, so webhooks and streams keep being served.
+    """
+    loop = asyncio.get_running_loop()
+
+    async def _one(aid: int) -> bool:
         try:
-            now_bj = datetime.now(TZ_EAST8)
-            tomorrow = (now_bj + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
-            wait_seconds = (tomorrow - now_bj).total_seconds()
-            logger.info("[daily_merge_cron] Next run in %.0f seconds", wait_seconds)
-            await asyncio.sleep(wait_seconds)
+            return await loop.run_in_executor(_daily_merge_executor, merge, aid)
+        except Exception:
+            logger.exception("[daily_merge_cron] Failed for assistant_id=%s", aid)
+            return False
 
-            logger.info("[daily_merge_cron] Starting midnight merge")
-            db = SessionLocal()
-            try:
-                assistants = (
-                    db.query(Assistant)
-                    .filter(Assistant.deleted_at.is_(None))
-                    .all()
-                )
-                assistant_ids = [a.id for a in assistants]
-            finally:
-                db.close()
+    return list(await asyncio.gather(*(_one(aid) for aid in assistant_ids)))
+
+
+def _seconds_until_midnight() -> float:
+    now_bj = datetime.now(TZ_EAST8)
+    tomorrow = (now_bj + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return (tomorrow - now_bj).total_seconds()
 
-            service = SummaryService(SessionLocal)
-            for aid in assistant_ids:
-                try:
-                    service.daily_merge_to_longterm(aid)
-                except Exception:
-                    logger.exception("[daily_merge_cron] Failed for assistant_id=%s", aid)
 
-            logger.info("[daily_merge_cron] Completed for %d assistants", len(assistant_ids))
+async def daily_merge_cron() -> None:
+    """Each day after midnight (Beijing time): merge daily → longterm for all assistants.
+
+    Runs immediately on startup for any assistant whose roll-over for today
+    is still missing (missed while the server was down), then after every
+    midnight; each run starts after a random stagger of up to
+    DAILY_MERGE_JITTER_SECONDS.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            await asyncio.sleep(random.uniform(0, DAILY_MERGE_JITTER_SECONDS))
+            pending = await loop.run_in_executor(_daily_merge_executor, _pending_daily_merges_sync)
+            failed = 0
+            if pending:
+                logger.info("[daily_merge_cron] Starting merge for %d assistants", len(pending))
+                started = time.monotonic()
+                results = await run_daily_merges(pending)
+                failed = results.count(False)
+                logger.info(
+                    "[daily_merge_cron] Completed for %d assistants (%d failed) in %.1fs",
+                    len(pending), failed, time.monotonic() - started,
+                )
+
+            wait_seconds = _seconds_until_midnight()
+            if failed:
+                wait_seconds = min(wait_seconds, DAILY_MERGE_RETRY_SECONDS)
+            logger.info("[daily_merge_cron] Next run in %.0f seconds", wait_seconds)
+            await asyncio.sleep(wait_seconds)
         except asyncio.CancelledError:
             break
         except Exception:
@@ -3,12 +3,15 @@ import time
 import logging
 from itertools import cycle
 
+from concurrent.futures import ThreadPoolExecutor
+
 import httpx
-from tavily import TavilyClient
+
+from app.services.fetch_cache import FetchCache, FetchedDocument
+from app.services.search_providers import SearchCache, create_provider, normalize_query
 
 logger = logging.getLogger(__name__)
 
-TAVILY_API_KEY = os.environ.get("TAVILY_API_KEY", "")
 _jina_keys = [k.strip() for k in os.environ.get("JINA_API_KEYS", "").split(",") if k.strip()]
 _jina_cycle = cycle(_jina_keys) if _jina_keys else None
 
@@ -22,27 +25,83 @@ def _next_jina_key() -> str:
 # ---------------------------------------------------------------------------
 # web_fetch cache
 # ---------------------------------------------------------------------------
-_fetch_cache: dict[str, dict] = {}  # url → {"content", "title", "timestamp"}
-_CACHE_TTL = 300  # 5 minutes
+JINA_READER_URL = os.environ.get("JINA_READER_URL", "https://r.jina.ai/")
+WEB_FETCH_PAGE_CHARS = 4000
+_fetch_cache = FetchCache(
+    max_bytes=int(os.environ.get("WEB_FETCH_CACHE_BYTES", str(32 * 1024 * 1024))),
+    ttl_seconds=float(os.environ.get("WEB_FETCH_CACHE_TTL", "300")),
+    # Optional disk tier, e.g. data/web_fetch; empty disables it
+    disk_dir=os.environ.get("WEB_FETCH_CACHE_DIR") or None,
+    disk_max_bytes=int(os.environ.get("WEB_FETCH_CACHE_DISK_BYTES", str(256 * 1024 * 1024))),
+)
+
+# One pooled client for all fetches (keep-alive to the reader service)
+_http_client = httpx.Client(
+    timeout=httpx.Timeout(15.0, connect=5.0),
+    limits=httpx.Limits(max_connections=16, max_keepalive_connections=8),
+)
+
+
+def _fetch_document(url: str) -> FetchedDocument:
+    resp = _http_client.get(
+        f"{JINA_READER_URL}{url}",
+        headers={
+            "Accept": "application/json",
+            "X-Return-Format": "markdown",
+            "Authorization": f"Bearer {_next_jina_key()}",
+        },
+    )
+    resp.raise_for_status()
+    data = resp.json().get("data", {})
+    return FetchedDocument(
+        url=url,
+        title=data.get("title", "") or "",
+        content=data.get("content", "") or "",
+        fetched_at=time.time(),
+    )
 
 
 # ---------------------------------------------------------------------------
 # web_search
 # ---------------------------------------------------------------------------
-def web_search(payload: dict) -> dict:
-    query = payload.get("query", "")
-    if not query:
-        return {"error": "query is required"}
+WEB_SEARCH_MAX_RESULTS = 5
+# Upper bound on queries in one web_search call
+WEB_SEARCH_MAX_QUERIES = int(os.getenv("WEB_SEARCH_MAX_QUERIES", "4"))
+_search_provider = create_provider()
+_search_cache = SearchCache(
+    max_entries=int(os.getenv("WEB_SEARCH_CACHE_ENTRIES", "256")),
+    ttl_seconds=float(os.getenv("WEB_SEARCH_CACHE_TTL", "600")),
+)
+_search_executor = ThreadPoolExecutor(max_workers=WEB_SEARCH_MAX_QUERIES, thread_name_prefix="web-search")
+
+
+def _search_one(query: str) -> dict:
+    key = (_search_provider.name, normalize_query(query), WEB_SEARCH_MAX_RESULTS)
     try:
-        client = TavilyClient(api_key=TAVILY_API_KEY)
-        resp = client.search(query, max_results=5, search_depth="basic", include_answer=False)
-        results = [
-            {"title": r.get("title", ""), "url": r.get("url", ""), "content": r.get("content", "")}
-            for r in resp.get("results", [])
-        ]
-        return {"query": query, "results": results}
+        results = _search_cache.get_or_search(
+            key, lambda: _search_provider.search(query, WEB_SEARCH_MAX_RESULTS),
+        )
     except Exception as e:
-        return {"error": str(e)}
+        return {"query": query, "error": str(e)}
+    return {"query": query, "results": results}
+
+
+def web_search(payload: dict) -> dict:
+    query = payload.get("query", "")
+    queries = [q for q in payload.get("queries") or [] if isinstance(q, str) and q.strip()]
+    if not queries:
+        if not query:
+            return {"error": "query is required"}
+        return _search_one(query)
+
+    # Related searches: dedupe by normalized form, run concurrently, keep order
+    unique: dict[str, str] = {}
+    for q in ([query] if query else []) + queries:
+        unique.setdefault(normalize_query(q), q)
+    batch = list(unique.values())[:WEB_SEARCH_MAX_QUERIES]
+    if len(batch) == 1:
+        return _search_one(batch[0])
+    return {"searches": list(_search_executor.map(_search_one, batch))}
 
 
 # ---------------------------------------------------------------------------
@@ -54,36 +113,19 @@ def web_fetch(payload: dict) -> dict:
     if not url:
         return {"error": "url is required"}
 
-    # Check cache
-    cached = _fetch_cache.get(url)
-    if cached and time.time() - cached["timestamp"] < _CACHE_TTL:
-        full_content = cached["content"]
-        title = cached["title"]
-    else:
-        try:
-            key = _next_jina_key()
-            resp = httpx.get(
-                f"https://r.jina.ai/{url}",
-                headers={
-                    "Accept": "application/json",
-                    "X-Return-Format": "markdown",
-                    "Authorization": f"Bearer {key}",
-                },
-                timeout=15,
-            )
-            resp.raise_for_status()
-            data = resp.json()
-            full_content = data.get("data", {}).get("content", "") or ""
-            title = data.get("data", {}).get("title", "") or ""
-            _fetch_cache[url] = {"content": full_content, "title": title, "timestamp": time.time()}
-        except Exception as e:
-            return {"error": str(e)}
+    # Cached per URL; concurrent fetches and offset pages share one request
+    try:
+        doc = _fetch_cache.get_or_fetch(url, _fetch_document)
+    except Exception as e:
+        return {"error": str(e)}
+    full_content = doc.content
+    title = doc.title
 
     # Slice content
-    chunk = full_content[offset:offset + 4000]
-    has_more = offset + 4000 < len(full_content)
+    chunk = full_content[offset:offset + WEB_FETCH_PAGE_CHARS]
+    has_more = offset + WEB_FETCH_PAGE_CHARS < len(full_content)
     if has_more:
-        next_offset = offset + 4000
+        next_offset = offset + WEB_FETCH_PAGE_CHARS
         chunk += f"\n\n---\n还有更多内容未显示，如需继续阅读请调用 web_fetch(url, offset={next_offset})"
     return {
         "title": title,
@@ -1,14 +1,23 @@
 from __future__ import annotations
 
 import logging
+import threading
+import time
 from dataclasses import dataclass
+from typing import Any
 
+from sqlalchemy import event
 from sqlalchemy.orm import Session
 
-from app.models.models import Assistant, Settings, WorldBook
+from app.models.models import Assistant, WorldBook
+from app.services.keyword_matcher import KeywordAutomaton, normalize_text
+from app.services.settings_store import settings_store
 
 logger = logging.getLogger(__name__)
 
+# Upper bound on staleness for world book edits made by other processes.
+COMPILED_BOOKS_TTL_SECONDS = 300.0
+
 
 @dataclass
 class MountedBook:
@@ -17,6 +26,115 @@ class MountedBook:
     sort_order: int
 
 
+@dataclass(frozen=True)
+class _BookEntry:
+    book_id: int
+    activation: str
+    # Normalized keywords (mood values for activation == "mood")
+    keywords: tuple[str, ...]
+    message_mode: str | None
+    content: str
+    position: str
+    sort_order: int
+
+
+@dataclass(frozen=True)
+class CompiledBooks:
+    """An assistant's mounted books plus one automaton over all keyword books."""
+
+    entries: tuple[_BookEntry, ...]
+    automaton: KeywordAutomaton
+    # Automaton keyword index → indices into ``entries``
+    keyword_owners: tuple[tuple[int, ...], ...]
+
+
+class CompiledBooksCache:
+    """Per-assistant ``CompiledBooks``, dropped whenever a world book or an
+    assistant's mounts change (see the ORM listeners below)."""
+
+    def __init__(self, ttl_seconds: float = COMPILED_BOOKS_TTL_SECONDS) -> None:
+        self._ttl = ttl_seconds
+        self._lock = threading.Lock()
+        self._items: dict[int, tuple[CompiledBooks, int, float]] = {}
+        self._version = 0
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._version += 1
+            self._items.clear()
+
+    def get(self, db: Session, assistant_id: int) -> CompiledBooks | None:
+        item = self._items.get(assistant_id)
+        if item is not None:
+            compiled, version, loaded_at = item
+            if version == self._version and time.monotonic() - loaded_at < self._ttl:
+                return compiled
+        version = self._version
+        compiled = _compile_books(db, assistant_id)
+        if compiled is not None:
+            with self._lock:
+                # An edit committed during the build bumped the version: don't keep it
+                if version == self._version:
+                    self._items[assistant_id] = (compiled, version, time.monotonic())
+        return compiled
+
+
+def _compile_books(db: Session, assistant_id: int) -> CompiledBooks | None:
+    assistant = db.get(Assistant, assistant_id)
+    if not assistant or not assistant.rule_set_ids:
+        return None
+    mounted = WorldBooksService._parse_rule_set_ids(assistant.rule_set_ids)
+    if not mounted:
+        return None
+
+    book_ids = [m.book_id for m in mounted]
+    books_by_id = {
+        b.id: b
+        for b in db.query(WorldBook).filter(WorldBook.id.in_(book_ids)).all()
+    }
+
+    entries: list[_BookEntry] = []
+    keyword_index: dict[str, int] = {}
+    owners: list[list[int]] = []
+    for m in mounted:
+        book = books_by_id.get(m.book_id)
+        if not book:
+            continue
+        content = (book.content or "").strip()
+        if not content:
+            continue
+        raw_keywords = book.keywords if isinstance(book.keywords, list) else []
+        keywords = tuple(
+            dict.fromkeys(normalize_text(str(k).strip()) for k in raw_keywords if str(k).strip())
+        )
+        entry_index = len(entries)
+        entries.append(_BookEntry(
+            book_id=book.id,
+            activation=book.activation,
+            keywords=keywords,
+            message_mode=book.message_mode,
+            content=content,
+            position=m.position if m.position in ("before", "after") else "after",
+            sort_order=m.sort_order,
+        ))
+        if book.activation == "keyword":
+            for keyword in keywords:
+                idx = keyword_index.get(keyword)
+                if idx is None:
+                    idx = keyword_index[keyword] = len(owners)
+                    owners.append([])
+                owners[idx].append(entry_index)
+
+    return CompiledBooks(
+        entries=tuple(entries),
+        automaton=KeywordAutomaton(keyword_index),
+        keyword_owners=tuple(tuple(o) for o in owners),
+    )
+
+
+compiled_books_cache = CompiledBooksCache()
+
+
 class WorldBooksService:
     def __init__(self, db: Session) -> None:
         self.db = db
@@ -54,8 +172,8 @@ class WorldBooksService:
         return result
 
     def _get_current_chat_mode(self) -> str:
-        row = self.db.query(Settings).filter(Settings.key == "message_mode").first()
-        return row.value if row and row.value in ("short", "long", "theater") else "long"
+        mode = settings_store.snapshot(self.db).get("message_mode", "long")
+        return mode if mode in ("short", "long", "theater") else "long"
 
     def get_active_books(
         self,
@@ -64,72 +182,42 @@ class WorldBooksService:
         current_mood_tag: str | None = None,
     ) -> dict[str, list[str]]:
         result: dict[str, list[str]] = {"before": [], "after": []}
-        assistant = self.db.get(Assistant, assistant_id)
-        if not assistant or not assistant.rule_set_ids:
-            return result
-
-        mounted = self._parse_rule_set_ids(assistant.rule_set_ids)
-        if not mounted:
+        compiled = compiled_books_cache.get(self.db, assistant_id)
+        if compiled is None:
             return result
 
-        book_ids = [m.book_id for m in mounted]
-        books_by_id: dict[int, WorldBook] = {}
-        if book_ids:
-            books = (
-                self.db.query(WorldBook)
-                .filter(WorldBook.id.in_(book_ids))
-                .all()
-            )
-            books_by_id = {b.id: b for b in books}
+        # One pass over the text finds every keyword of every keyword book
+        keyword_hits: set[int] = set()
+        if user_message is not None and compiled.automaton.size:
+            for keyword_idx in compiled.automaton.find(user_message):
+                keyword_hits.update(compiled.keyword_owners[keyword_idx])
 
-        user_message_lower = user_message.lower() if user_message is not None else None
+        mood_value = normalize_text(current_mood_tag.strip()) if current_mood_tag else ""
+        current_mode: str | None = None
 
         before_entries: list[tuple[int, str]] = []
         after_entries: list[tuple[int, str]] = []
 
-        for m in mounted:
-            book = books_by_id.get(m.book_id)
-            if not book:
-                continue
-
+        for index, entry in enumerate(compiled.entries):
             is_active = False
-            if book.activation == "always":
+            if entry.activation == "always":
                 is_active = True
-            elif book.activation == "keyword":
-                if user_message_lower is not None:
-                    keywords = book.keywords if isinstance(book.keywords, list) else []
-                    for keyword in keywords:
-                        keyword_text = str(keyword).strip()
-                        if keyword_text and keyword_text.lower() in user_message_lower:
-                            is_active = True
-                            break
-            elif book.activation == "mood":
-                if current_mood_tag and book.keywords:
-                    try:
-                        mood_value = current_mood_tag.strip().lower()
-                        keywords = book.keywords if isinstance(book.keywords, list) else []
-                        keyword_values = [str(k).strip().lower() for k in keywords if str(k).strip()]
-                        if mood_value and mood_value in keyword_values:
-                            is_active = True
-                    except Exception as exc:
-                        logger.warning("Mood activation check failed: %s", exc)
-            elif book.activation == "message_mode":
-                if book.message_mode:
-                    current_mode = self._get_current_chat_mode()
-                    if current_mode == book.message_mode:
-                        is_active = True
+            elif entry.activation == "keyword":
+                is_active = index in keyword_hits
+            elif entry.activation == "mood":
+                is_active = bool(mood_value) and mood_value in entry.keywords
+            elif entry.activation == "message_mode":
+                if entry.message_mode:
+                    if current_mode is None:
+                        current_mode = self._get_current_chat_mode()
+                    is_active = current_mode == entry.message_mode
             if not is_active:
                 continue
 
-            content = (book.content or "").strip()
-            if not content:
-                continue
-
-            position = m.position if m.position in ("before", "after") else "after"
-            if position == "before":
-                before_entries.append((m.sort_order, content))
+            if entry.position == "before":
+                before_entries.append((entry.sort_order, entry.content))
             else:
-                after_entries.append((m.sort_order, content))
+                after_entries.append((entry.sort_order, entry.content))
 
         before_entries.sort(key=lambda x: x[0])
         after_entries.sort(key=lambda x: x[0])
@@ -138,3 +226,27 @@ class WorldBooksService:
         result["after"] = [content for _, content in after_entries]
 
         return result
+
+
+# ── Invalidation on committed writes ─────────────────────────────────────────
+
+def _mark_books_dirty(mapper: Any, connection: Any, target: Any) -> None:
+    session = Session.object_session(target)
+    if session is not None:
+        session.info["world_books_dirty"] = True
+
+
+for _model in (WorldBook, Assistant):
+    for _evt in ("after_insert", "after_update", "after_delete"):
+        event.listen(_model, _evt, _mark_books_dirty)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session: Session) -> None:
+    if session.info.pop("world_books_dirty", False):
+        compiled_books_cache.invalidate()
+
+
+@event.listens_for(Session, "after_rollback")
+def _clear_after_rollback(session: Session) -> None:
+    session.info.pop("world_books_dirty", None)
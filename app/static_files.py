@@ -0,0 +1,40 @@
+"""Static file serving with immutable caching for content-addressed files.
+
+Uploads are published as ``<sha256>.<ext>``, so a file's name already
+identifies its bytes: the digest serves as a strong ETag and the response
+can be cached forever. Other static files keep Starlette's default
+(mtime/size based) validators.
+"""
+
+from __future__ import annotations
+
+import os
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import StaticFiles
+from starlette.types import Scope
+
+from app.services.blob_store import is_digest
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+class ContentAddressedStaticFiles(StaticFiles):
+    def file_response(
+        self,
+        full_path: str | os.PathLike[str],
+        stat_result: os.stat_result,
+        scope: Scope,
+        status_code: int = 200,
+    ) -> Response:
+        digest = os.path.basename(full_path).split(".", 1)[0]
+        if not is_digest(digest):
+            return super().file_response(full_path, stat_result, scope, status_code)
+
+        headers = {"etag": f'"{digest}"', "cache-control": IMMUTABLE_CACHE_CONTROL}
+        if_none_match = Headers(scope=scope).get("if-none-match", "")
+        candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        if headers["etag"] in candidates or "*" in candidates:
+            return Response(status_code=304, headers=headers)
+        return FileResponse(full_path, status_code=status_code, stat_result=stat_result, headers=headers)
@@ -20,6 +20,13 @@ WEBHOOK_BASE_URL: str = os.getenv("WEBHOOK_BASE_URL", "https://chat.chuli.win")
 # Defaults
 DEFAULT_BUFFER_SECONDS: float = 15.0
 
+# Worker threads for Telegram chat completions (each holds one DB connection)
+CHAT_WORKERS: int = int(os.getenv("TELEGRAM_CHAT_WORKERS", "4"))
+
+# Webhook intake: max updates waiting to be handled, and concurrent chat lanes
+INTAKE_QUEUE_SIZE: int = int(os.getenv("TELEGRAM_INTAKE_QUEUE_SIZE", "200"))
+INTAKE_WORKERS: int = int(os.getenv("TELEGRAM_INTAKE_WORKERS", "8"))
+
 # Per-bot configuration: bot_key → { token, assistant_id, webhook_path }
 BOTS_CONFIG: dict[str, dict] = {
     "ahuai": {
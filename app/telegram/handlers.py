@@ -2,8 +2,9 @@ from __future__ import annotations
 
 import asyncio
 import logging
+from collections.abc import AsyncIterator
 from dataclasses import dataclass, field
-from typing import Optional
+from typing import Any, Optional
 
 from aiogram import Bot, Router
 from aiogram.filters import Command
@@ -12,19 +13,23 @@ from aiogram.types import Message
 from .config import ALLOWED_CHAT_ID
 from aiogram.types import ReplyKeyboardRemove
 from .service import (
-    call_chat_completion,
-    call_chat_completion_with_image,
-    call_chat_completion_with_meta,
-    encode_photo_base64,
     get_buffer_seconds,
+    get_file_token_budget,
     get_chat_mode,
     get_session_info,
+    get_stream_replies,
     lookup_by_telegram_message_id,
     store_message_only,
+    store_photo,
+    stream_chat,
     undo_last_round,
     update_telegram_message_id,
 )
-from app.services.image_description_service import extract_file_content, truncate_to_tokens, get_trigger_threshold
+from .streaming import EDIT_INTERVAL_SECONDS, TelegramStreamWriter
+from app.activity_tracker import activity_tracker
+from app.services.document_ingest import ingest_document
+from app.services.image_description_service import truncate_to_tokens
+from app.services.image_pipeline import ProcessedImage
 
 logger = logging.getLogger(__name__)
 router = Router()
@@ -41,10 +46,6 @@ class _ChatBuffer:
 @dataclass
 class _BotState:
     buffers: dict[int, _ChatBuffer] = field(default_factory=dict)
-    processed_msg_ids: set[int] = field(default_factory=set)
-
-
-_DEDUP_MAX = 500  # max tracked message_ids per bot to prevent unbounded growth
 
 
 _bot_states: dict[str, _BotState] = {}
@@ -65,17 +66,19 @@ def _is_allowed(chat_id: int) -> bool:
 
 
 async def _typing_loop(bot: Bot, chat_id: int, stop_event: asyncio.Event) -> None:
-    while not stop_event.is_set():
-        try:
-            await bot.send_chat_action(chat_id=chat_id, action="typing")
-        except Exception as exc:
-            logger.debug("typing_loop error: %s", exc)
-        try:
-            await asyncio.wait_for(
-                asyncio.shield(stop_event.wait()), timeout=4.0
-            )
-        except asyncio.TimeoutError:
-            pass
+    # Runs for the whole request, so it also marks Telegram traffic as in flight
+    with activity_tracker.track("telegram"):
+        while not stop_event.is_set():
+            try:
+                await bot.send_chat_action(chat_id=chat_id, action="typing")
+            except Exception as exc:
+                logger.debug("typing_loop error: %s", exc)
+            try:
+                await asyncio.wait_for(
+                    asyncio.shield(stop_event.wait()), timeout=4.0
+                )
+            except asyncio.TimeoutError:
+                pass
 
 
 async def _send_reply(bot: Bot, chat_id: int, text: str, is_short: bool) -> list[int]:
@@ -96,6 +99,60 @@ async def _send_reply(bot: Bot, chat_id: int, text: str, is_short: bool) -> list
     return tg_ids
 
 
+async def _deliver_reply(
+    bot: Bot,
+    chat_id: int,
+    is_short: bool,
+    stop_event: asyncio.Event,
+    typing_task: asyncio.Task,
+    events: AsyncIterator[dict[str, Any]],
+) -> None:
+    """Consume chat events and deliver the reply, streaming it when enabled."""
+    streaming = await get_stream_replies()
+    writer = TelegramStreamWriter(bot, chat_id, is_short) if streaming else None
+    result_messages: list[dict[str, Any]] = []
+    try:
+        async for event in events:
+            kind = event["type"]
+            if kind == "message":
+                result_messages.append({"content": event["content"], "db_id": event["id"]})
+            elif kind == "error":
+                logger.warning("Chat error for chat %s: %s", chat_id, event.get("error"))
+            elif writer is None:
+                continue
+            elif kind == "delta":
+                await writer.feed(event["content"])
+            elif kind == "round_end":
+                writer.break_segment()
+            elif kind == "idle":
+                await writer.flush()
+    except Exception:
+        if writer is not None:
+            # Remove half-streamed previews before the caller reports the error
+            await writer.finalize([])
+        raise
+    stop_event.set()
+    typing_task.cancel()
+
+    if writer is not None:
+        for db_id, tg_ids in await writer.finalize(result_messages):
+            await update_telegram_message_id(db_id, tg_ids)
+        return
+
+    sent_count = 0
+    for msg in result_messages:
+        content = (msg.get("content") or "").strip()
+        if not content:
+            continue
+        if sent_count > 0:
+            await asyncio.sleep(1.0)
+        tg_ids = await _send_reply(bot, chat_id, content, is_short=is_short)
+        # Write back telegram message ID to the assistant message in DB
+        if tg_ids and msg.get("db_id"):
+            await update_telegram_message_id(msg["db_id"], tg_ids[-1])
+        sent_count += 1
+
+
 async def _process_request(
     chat_id: int,
     combined_text: str,
@@ -110,28 +167,15 @@ async def _process_request(
 
     try:
         session_id, assistant_name = await get_session_info(assistant_id)
-        result_messages = await call_chat_completion(
-            session_id, assistant_name, combined_text,
-            short_mode=is_short,
-            telegram_message_id=telegram_message_id,
+        await _deliver_reply(
+            bot, chat_id, is_short, stop_event, typing_task,
+            stream_chat(
+                session_id, assistant_name, combined_text, is_short,
+                telegram_message_id=telegram_message_id,
+                idle_timeout=EDIT_INTERVAL_SECONDS,
+            ),
         )
 
-        stop_event.set()
-        typing_task.cancel()
-
-        sent_count = 0
-        for msg in result_messages:
-            content = (msg.get("content") or "").strip()
-            if not content:
-                continue
-            if sent_count > 0:
-                await asyncio.sleep(1.0)
-            tg_ids = await _send_reply(bot, chat_id, content, is_short=is_short)
-            # Write back telegram message ID to the assistant message in DB
-            if tg_ids and msg.get("db_id"):
-                await update_telegram_message_id(msg["db_id"], tg_ids[-1])
-            sent_count += 1
-
     except Exception as exc:
         stop_event.set()
         typing_task.cancel()
@@ -145,37 +189,28 @@ async def _process_request(
 async def _process_photo_request(
     chat_id: int,
     content: str,
-    image_data: str,
+    image: ProcessedImage,
     bot: Bot,
     bot_key: str,
     assistant_id: int,
     is_short: bool = False,
     telegram_message_id: list[int] | None = None,
 ) -> None:
-    """Process a photo message: store with image_data and trigger chat completion."""
+    """Process a photo message: store with its image hash and trigger chat completion."""
     stop_event = asyncio.Event()
     typing_task = asyncio.create_task(_typing_loop(bot, chat_id, stop_event))
     try:
         session_id, assistant_name = await get_session_info(assistant_id)
-        result_messages = await call_chat_completion_with_image(
-            session_id, assistant_name, content,
-            image_data=image_data,
-            short_mode=is_short,
-            telegram_message_id=telegram_message_id,
+        await _deliver_reply(
+            bot, chat_id, is_short, stop_event, typing_task,
+            stream_chat(
+                session_id, assistant_name, content, is_short,
+                image_hash=image.digest,
+                image_media_type=image.media_type,
+                telegram_message_id=telegram_message_id,
+                idle_timeout=EDIT_INTERVAL_SECONDS,
+            ),
         )
-        stop_event.set()
-        typing_task.cancel()
-        sent_count = 0
-        for msg in result_messages:
-            reply_content = (msg.get("content") or "").strip()
-            if not reply_content:
-                continue
-            if sent_count > 0:
-                await asyncio.sleep(1.0)
-            tg_ids = await _send_reply(bot, chat_id, reply_content, is_short=is_short)
-            if tg_ids and msg.get("db_id"):
-                await update_telegram_message_id(msg["db_id"], tg_ids[-1])
-            sent_count += 1
     except Exception as exc:
         stop_event.set()
         typing_task.cancel()
@@ -201,25 +236,15 @@ async def _process_file_request(
     typing_task = asyncio.create_task(_typing_loop(bot, chat_id, stop_event))
     try:
         session_id, assistant_name = await get_session_info(assistant_id)
-        result_messages = await call_chat_completion_with_meta(
-            session_id, assistant_name, content,
-            meta_info=meta_info,
-            short_mode=is_short,
-            telegram_message_id=telegram_message_id,
+        await _deliver_reply(
+            bot, chat_id, is_short, stop_event, typing_task,
+            stream_chat(
+                session_id, assistant_name, content, is_short,
+                meta_info=meta_info,
+                telegram_message_id=telegram_message_id,
+                idle_timeout=EDIT_INTERVAL_SECONDS,
+            ),
         )
-        stop_event.set()
-        typing_task.cancel()
-        sent_count = 0
-        for msg in result_messages:
-            reply_content = (msg.get("content") or "").strip()
-            if not reply_content:
-                continue
-            if sent_count > 0:
-                await asyncio.sleep(1.0)
-            tg_ids = await _send_reply(bot, chat_id, reply_content, is_short=is_short)
-            if tg_ids and msg.get("db_id"):
-                await update_telegram_message_id(msg["db_id"], tg_ids[-1])
-            sent_count += 1
     except Exception as exc:
         stop_event.set()
         typing_task.cancel()
@@ -280,16 +305,8 @@ async def handle_message(message: Message, bot: Bot, bot_key: str, assistant_id:
 
     chat_id = message.chat.id
 
-    # ── Dedup: skip if this message_id was already processed ──
+    # Redelivered updates are dropped by update_id in the webhook intake
     state = _get_state(bot_key)
-    msg_id = message.message_id
-    if msg_id in state.processed_msg_ids:
-        logger.debug("Skipping duplicate message_id=%d (bot=%s)", msg_id, bot_key)
-        return
-    state.processed_msg_ids.add(msg_id)
-    if len(state.processed_msg_ids) > _DEDUP_MAX:
-        sorted_ids = sorted(state.processed_msg_ids)
-        state.processed_msg_ids = set(sorted_ids[len(sorted_ids) - _DEDUP_MAX // 2 :])
 
     # ── Photo handling ──
     if message.photo:
@@ -298,7 +315,7 @@ async def handle_message(message: Message, bot: Bot, bot_key: str, assistant_id:
             photo = message.photo[-1]  # largest size
             file_info = await bot.get_file(photo.file_id)
             file_bytes = await bot.download_file(file_info.file_path)
-            image_data = encode_photo_base64(file_bytes, "image/jpeg")
+            image = await store_photo(file_bytes)
         except Exception as exc:
             logger.error("Failed to download photo: %s", exc)
             return
@@ -314,7 +331,8 @@ async def handle_message(message: Message, bot: Bot, bot_key: str, assistant_id:
         if mode == "short":
             # Short mode: store image in DB; if caption, add to buffer
             await store_message_only(
-                session_id, content, image_data=image_data,
+                session_id, content,
+                image_hash=image.digest, image_media_type=image.media_type,
                 telegram_message_id=[message.message_id],
             )
             if caption:
@@ -330,14 +348,15 @@ async def handle_message(message: Message, bot: Bot, bot_key: str, assistant_id:
         elif caption:
             # Long mode with caption → trigger reply
             await _process_photo_request(
-                chat_id, content, image_data,
+                chat_id, content, image,
                 bot, bot_key, assistant_id, is_short=False,
                 telegram_message_id=[message.message_id],
             )
         else:
             # Long mode without caption → store only, wait for next text
             await store_message_only(
-                session_id, content, image_data=image_data,
+                session_id, content,
+                image_hash=image.digest, image_media_type=image.media_type,
                 telegram_message_id=[message.message_id],
             )
         return
@@ -359,21 +378,14 @@ async def handle_message(message: Message, bot: Bot, bot_key: str, assistant_id:
             logger.error("Failed to download document: %s", exc)
             return
 
-        # Extract text content
-        file_text = extract_file_content(file_name, file_data)
+        # Extract text content (PDFs are parsed in a worker process, capped and cached by hash)
+        doc = await ingest_document(file_name, file_data)
+        file_text = doc.text
         if not file_text:
-            file_text = ""
             content_marker = f"[文件：{file_name}，内容提取失败]"
         else:
-            # Truncate if too long
-            from app.database import SessionLocal
-            _db = SessionLocal()
-            try:
-                threshold = get_trigger_threshold(_db)
-            finally:
-                _db.close()
-            max_file_tokens = threshold // 2
-            file_text = truncate_to_tokens(file_text, max_file_tokens)
+            # Truncate if too long; the full text stays in the document cache for summarization
+            file_text = await asyncio.to_thread(truncate_to_tokens, file_text, await get_file_token_budget())
             content_marker = f"[文件：{file_name}]\n{file_text}"
 
         if caption:
@@ -381,7 +393,7 @@ async def handle_message(message: Message, bot: Bot, bot_key: str, assistant_id:
         else:
             content = content_marker
 
-        meta_info = {"needs_file_summary": True, "file_name": file_name}
+        meta_info = {"needs_file_summary": True, "file_name": file_name, "file_hash": doc.digest}
         mode = await get_chat_mode()
         session_id, _ = await get_session_info(assistant_id)
 
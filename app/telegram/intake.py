@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any
+
+from aiogram.types import Update
+
+from .bot_instance import bots, dp
+from .config import BOTS_CONFIG, INTAKE_QUEUE_SIZE, INTAKE_WORKERS
+from .service import claim_update
+
+logger = logging.getLogger(__name__)
+
+_LaneKey = tuple[str, int]
+
+
+@dataclass
+class _Item:
+    bot_key: str
+    update: Update
+    enqueued_at: float
+
+
+@dataclass
+class IntakeStats:
+    received: int = 0
+    rejected: int = 0
+    duplicates: int = 0
+    processed: int = 0
+    failed: int = 0
+    max_depth: int = 0
+    total_wait_ms: float = 0.0
+    max_wait_ms: float = 0.0
+    total_handle_ms: float = 0.0
+    max_handle_ms: float = 0.0
+
+
+@dataclass
+class UpdateIntake:
+    """Bounded webhook intake with per-chat ordered processing.
+
+    The webhook only calls ``submit``; updates are appended to a lane per
+    (bot, chat). A lane is handed to at most one worker at a time, so each
+    chat's updates run strictly in order while different chats run
+    concurrently on ``workers`` tasks. When ``max_pending`` updates are
+    waiting, new ones are rejected so Telegram retries them later.
+    """
+
+    max_pending: int = INTAKE_QUEUE_SIZE
+    workers: int = INTAKE_WORKERS
+    stats: IntakeStats = field(default_factory=IntakeStats)
+    _lanes: dict[_LaneKey, deque[_Item]] = field(default_factory=dict)
+    _ready: asyncio.Queue[_LaneKey] | None = None
+    _pending: int = 0
+    _active: int = 0
+    _tasks: list[asyncio.Task] = field(default_factory=list)
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        self._ready = asyncio.Queue()
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"telegram-intake-{i}")
+            for i in range(self.workers)
+        ]
+        logger.info("Telegram intake started (%d workers, queue %d)", self.workers, self.max_pending)
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    @staticmethod
+    def _chat_id(update: Update) -> int:
+        for candidate in (
+            update.message,
+            update.edited_message,
+            getattr(update.callback_query, "message", None),
+        ):
+            chat = getattr(candidate, "chat", None)
+            if chat is not None:
+                return chat.id
+        return 0
+
+    def submit(self, bot_key: str, update: Update) -> bool:
+        """Queue an update; False when the intake is full (caller should 503)."""
+        self.stats.received += 1
+        if self._ready is None or self._pending >= self.max_pending:
+            self.stats.rejected += 1
+            return False
+        key = (bot_key, self._chat_id(update))
+        lane = self._lanes.get(key)
+        if lane is None:
+            lane = self._lanes[key] = deque()
+            # New lane: schedule it. Existing lanes are already scheduled or running.
+            self._ready.put_nowait(key)
+        lane.append(_Item(bot_key, update, time.monotonic()))
+        self._pending += 1
+        self.stats.max_depth = max(self.stats.max_depth, self._pending)
+        return True
+
+    async def _worker(self) -> None:
+        assert self._ready is not None
+        while True:
+            key = await self._ready.get()
+            lane = self._lanes[key]
+            item = lane.popleft()
+            self._pending -= 1
+            self._active += 1
+            try:
+                await self._handle(item)
+            finally:
+                self._active -= 1
+                if lane:
+                    self._ready.put_nowait(key)
+                else:
+                    del self._lanes[key]
+
+    async def _handle(self, item: _Item) -> None:
+        started = time.monotonic()
+        wait_ms = (started - item.enqueued_at) * 1000
+        self.stats.total_wait_ms += wait_ms
+        self.stats.max_wait_ms = max(self.stats.max_wait_ms, wait_ms)
+        try:
+            if not await claim_update(item.bot_key, item.update.update_id):
+                self.stats.duplicates += 1
+                logger.debug("Skipping duplicate update_id=%d (bot=%s)", item.update.update_id, item.bot_key)
+                return
+            await dp.feed_update(
+                bot=bots[item.bot_key],
+                update=item.update,
+                bot_key=item.bot_key,
+                assistant_id=BOTS_CONFIG[item.bot_key]["assistant_id"],
+            )
+            self.stats.processed += 1
+        except Exception as exc:
+            self.stats.failed += 1
+            logger.error("telegram intake error (%s): %s", item.bot_key, exc, exc_info=True)
+        finally:
+            handle_ms = (time.monotonic() - started) * 1000
+            self.stats.total_handle_ms += handle_ms
+            self.stats.max_handle_ms = max(self.stats.max_handle_ms, handle_ms)
+
+    def snapshot(self) -> dict[str, Any]:
+        stats = self.stats
+        finished = stats.processed + stats.failed + stats.duplicates
+        return {
+            "pending": self._pending,
+            "capacity": self.max_pending,
+            "active": self._active,
+            "workers": self.workers,
+            "lanes": len(self._lanes),
+            "received": stats.received,
+            "rejected": stats.rejected,
+            "duplicates": stats.duplicates,
+            "processed": stats.processed,
+            "failed": stats.failed,
+            "max_depth": stats.max_depth,
+            "avg_wait_ms": round(stats.total_wait_ms / finished, 1) if finished else 0.0,
+            "max_wait_ms": round(stats.max_wait_ms, 1),
+            "avg_handle_ms": round(stats.total_handle_ms / finished, 1) if finished else 0.0,
+            "max_handle_ms": round(stats.max_handle_ms, 1),
+        }
+
+
+intake = UpdateIntake()
@@ -1,13 +1,18 @@
 from __future__ import annotations
 
 import logging
+from typing import Any
 
 from aiogram.types import Update
-from fastapi import APIRouter, Request, Response
+from fastapi import APIRouter, Depends, Request, Response
+
+from app.activity_tracker import activity_tracker
+from app.routers.auth import require_auth_token
 
 from .bot_instance import bots, dp
 from .config import BOTS_CONFIG
 from .handlers import router as handlers_router
+from .intake import intake
 
 logger = logging.getLogger(__name__)
 
@@ -19,19 +24,27 @@ dp.include_router(handlers_router)
 
 @router.post("/telegram/webhook/{bot_key}")
 async def telegram_webhook(bot_key: str, request: Request) -> Response:
-    """Receive Telegram update and feed it to the correct bot."""
+    """Validate a Telegram update and hand it to the intake queue.
+
+    Responds as soon as the update is queued; 503 when the intake is full
+    so Telegram redelivers it later.
+    """
     if bot_key not in bots or bot_key not in BOTS_CONFIG:
         return Response(status_code=404)
 
+    activity_tracker.touch("telegram")
     try:
         data = await request.json()
         update = Update.model_validate(data)
-        await dp.feed_update(
-            bot=bots[bot_key],
-            update=update,
-            bot_key=bot_key,
-            assistant_id=BOTS_CONFIG[bot_key]["assistant_id"],
-        )
     except Exception as exc:
-        logger.error("telegram_webhook error (%s): %s", bot_key, exc, exc_info=True)
+        logger.error("telegram_webhook invalid update (%s): %s", bot_key, exc)
+        return Response()
+    if not intake.submit(bot_key, update):
+        logger.warning("Telegram intake full, deferring update_id=%s (bot=%s)", update.update_id, bot_key)
+        return Response(status_code=503)
     return Response()
+
+
+@router.get("/api/telegram/intake/stats", dependencies=[Depends(require_auth_token)])
+async def telegram_intake_stats() -> dict[str, Any]:
+    return intake.snapshot()
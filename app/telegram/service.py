@@ -1,13 +1,20 @@
 from __future__ import annotations
 
 import asyncio
-import base64
+import functools
 import logging
+from collections.abc import AsyncIterator, Callable
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 from io import BytesIO
 from typing import Any
 
 from app.database import SessionLocal
-from app.models.models import Assistant, ChatSession, Message, Settings
+from app.models.models import Assistant, ChatSession, Message, TelegramProcessedUpdate
+from app.services.image_pipeline import ProcessedImage, process_image
+from app.services.settings_store import settings_store
+
+from .config import CHAT_WORKERS
 
 logger = logging.getLogger(__name__)
 
@@ -15,16 +22,15 @@ logger = logging.getLogger(__name__)
 # ── Settings helpers ──────────────────────────────────────────────────────────
 
 def _get_setting_sync(key: str, default: str = "") -> str:
-    db = SessionLocal()
-    try:
-        row = db.query(Settings).filter(Settings.key == key).first()
-        return row.value if row else default
-    finally:
-        db.close()
+    return settings_store.snapshot().get(key, default)
 
 
 async def get_setting(key: str, default: str = "") -> str:
-    return await asyncio.to_thread(_get_setting_sync, key, default)
+    return (await settings_store.asnapshot()).get(key, default)
+
+
+async def get_stream_replies() -> bool:
+    return await get_setting("telegram_stream_replies", "true") != "false"
 
 
 # ── Session / Assistant lookup ────────────────────────────────────────────────
@@ -83,16 +89,26 @@ async def get_session_info(assistant_id: int) -> tuple[int, str]:
 
 # ── Chat completion ───────────────────────────────────────────────────────────
 
-def _chat_completion_sync(
+# Dedicated pool so Telegram chats never queue behind (or starve) the default
+# asyncio.to_thread executor; bounded to stay well inside the DB pool.
+_chat_executor = ThreadPoolExecutor(max_workers=CHAT_WORKERS, thread_name_prefix="tg-chat")
+
+
+def _run_chat_sync(
     session_id: int,
     assistant_name: str,
     message: str,
     short_mode: bool,
+    emit: Callable[[dict[str, Any]], None],
+    image_hash: str | None = None,
+    image_media_type: str | None = None,
+    meta_info: dict | None = None,
     telegram_message_id: list[int] | None = None,
-) -> list[dict[str, Any]]:
+) -> None:
     """
-    Synchronous wrapper: pre-stores user message (with telegram_message_id),
-    loads history, calls ChatService, returns assistant messages with db_id.
+    Pre-store the user message(s), load history and run the chat engine,
+    passing its structured events (deltas, tool activity, persisted message
+    ids) to ``emit``.
     """
     from app.routers.chat import _load_session_messages
     from app.services.chat_service import ChatService
@@ -101,91 +117,139 @@ def _chat_completion_sync(
     try:
         # 1. Pre-store user messages — one row per telegram message
         #    When buffer merges multiple messages, split them back out
-        parts = message.split("\n") if telegram_message_id and len(telegram_message_id) > 1 else [message]
         tg_ids = telegram_message_id or []
-
-        max_id_before = 0
+        parts = message.split("\n") if len(tg_ids) > 1 else [message]
+        first = True
         for i, part in enumerate(parts):
             part_text = part.strip()
             if not part_text:
                 continue
-            tg_id_for_part = [tg_ids[i]] if i < len(tg_ids) else None
-            user_msg = Message(
+            db.add(Message(
                 session_id=session_id,
                 role="user",
                 content=part_text,
-                meta_info={},
-                telegram_message_id=tg_id_for_part,
-            )
-            db.add(user_msg)
+                meta_info=(meta_info or {}) if first else {},
+                image_hash=image_hash if first else None,
+                image_media_type=image_media_type if first else None,
+                telegram_message_id=[tg_ids[i]] if i < len(tg_ids) else None,
+            ))
             db.commit()
-            db.refresh(user_msg)
-            max_id_before = user_msg.id
+            first = False
 
         # 2. Load history (includes the message we just stored, all have 'id')
         chat_service = ChatService(db, assistant_name)
         messages = _load_session_messages(db, session_id)
 
-        # 3. Call stream_chat_completion — consume all SSE events to drive it
-        #    This gives us COT broadcasts, tool execution, and message persistence
-        for _ in chat_service.stream_chat_completion(
+        # 3. Drive the chat engine (COT broadcasts, tools, message persistence)
+        for event in chat_service.iter_chat_events(
             session_id, messages, short_mode=short_mode, source="telegram",
         ):
-            pass
-
-        # 4. Find NEW assistant messages created during this call
-        new_assistant_msgs = (
-            db.query(Message)
-            .filter(
-                Message.session_id == session_id,
-                Message.id > max_id_before,
-                Message.role == "assistant",
-                Message.content != "",
-            )
-            .order_by(Message.id)
-            .all()
-        )
-
-        # 5. Build result with db_ids
-        return [
-            {"role": "assistant", "content": m.content, "db_id": m.id}
-            for m in new_assistant_msgs
-        ]
+            emit(event)
     finally:
         db.close()
 
 
-async def call_chat_completion(
+async def stream_chat(
     session_id: int,
     assistant_name: str,
     message: str,
     short_mode: bool,
+    image_hash: str | None = None,
+    image_media_type: str | None = None,
+    meta_info: dict | None = None,
     telegram_message_id: list[int] | None = None,
-) -> list[dict[str, Any]]:
-    return await asyncio.to_thread(
-        _chat_completion_sync,
-        session_id,
-        assistant_name,
-        message,
-        short_mode,
-        telegram_message_id,
+    idle_timeout: float = 1.0,
+) -> AsyncIterator[dict[str, Any]]:
+    """Telegram chat entry point: text, image and file meta in, events out.
+
+    Yields the chat engine's events as they happen plus ``{"type": "idle"}``
+    after ``idle_timeout`` seconds without one. Errors raised while storing
+    or generating propagate once the stream ends.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue[dict[str, Any] | None] = asyncio.Queue()
+
+    def emit(event: dict[str, Any]) -> None:
+        loop.call_soon_threadsafe(queue.put_nowait, event)
+
+    future = loop.run_in_executor(
+        _chat_executor,
+        functools.partial(
+            _run_chat_sync,
+            session_id, assistant_name, message, short_mode, emit,
+            image_hash=image_hash,
+            image_media_type=image_media_type,
+            meta_info=meta_info,
+            telegram_message_id=telegram_message_id,
+        ),
     )
+    # Scheduled after every pending event, so None is always the last item
+    future.add_done_callback(lambda _f: queue.put_nowait(None))
+    while True:
+        try:
+            event = await asyncio.wait_for(queue.get(), timeout=idle_timeout)
+        except asyncio.TimeoutError:
+            yield {"type": "idle"}
+            continue
+        if event is None:
+            break
+        yield event
+    future.result()
+
+
+# ── Update dedup ─────────────────────────────────────────────────────────────
+
+_DEDUP_RETENTION = timedelta(days=7)
+_DEDUP_PRUNE_EVERY = 500
+_dedup_claims = 0
+
+
+def _claim_update_sync(bot_key: str, update_id: int) -> bool:
+    """Record an update as processed; False if it was already claimed."""
+    global _dedup_claims
+    from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+    db = SessionLocal()
+    try:
+        stmt = (
+            pg_insert(TelegramProcessedUpdate)
+            .values(bot_key=bot_key, update_id=update_id, created_at=datetime.now(timezone.utc))
+            .on_conflict_do_nothing(constraint="uq_telegram_processed_updates_bot_update")
+            .returning(TelegramProcessedUpdate.id)
+        )
+        claimed = db.execute(stmt).first() is not None
+        _dedup_claims += 1
+        if _dedup_claims % _DEDUP_PRUNE_EVERY == 0:
+            cutoff = datetime.now(timezone.utc) - _DEDUP_RETENTION
+            db.query(TelegramProcessedUpdate).filter(
+                TelegramProcessedUpdate.created_at < cutoff
+            ).delete(synchronize_session=False)
+        db.commit()
+        return claimed
+    finally:
+        db.close()
+
+
+async def claim_update(bot_key: str, update_id: int) -> bool:
+    return await asyncio.to_thread(_claim_update_sync, bot_key, update_id)
 
 
 # ── Telegram message ID helpers ──────────────────────────────────────────────
 
-def _update_telegram_msg_id_sync(message_db_id: int, telegram_msg_id: int) -> None:
+def _update_telegram_msg_id_sync(message_db_id: int, telegram_msg_id: int | list[int]) -> None:
     db = SessionLocal()
     try:
         msg = db.get(Message, message_db_id)
         if msg:
-            msg.telegram_message_id = [telegram_msg_id]
+            msg.telegram_message_id = (
+                list(telegram_msg_id) if isinstance(telegram_msg_id, list) else [telegram_msg_id]
+            )
             db.commit()
     finally:
         db.close()
 
 
-async def update_telegram_message_id(message_db_id: int, telegram_msg_id: int) -> None:
+async def update_telegram_message_id(message_db_id: int, telegram_msg_id: int | list[int]) -> None:
     return await asyncio.to_thread(_update_telegram_msg_id_sync, message_db_id, telegram_msg_id)
 
 
@@ -221,6 +285,12 @@ async def get_buffer_seconds() -> float:
         return 15.0
 
 
+async def get_file_token_budget() -> int:
+    """Tokens of extracted file text kept in the message: half the dialogue trigger threshold."""
+    snap = await settings_store.asnapshot()
+    return snap.get_int("dialogue_trigger_threshold", 16000) // 2
+
+
 async def get_chat_mode() -> str:
     raw = await get_setting("chat_mode", "long")
     return raw if raw in ("short", "long") else "long"
@@ -267,7 +337,8 @@ def _store_message_only_sync(
     session_id: int,
     content: str,
     meta_info: dict | None = None,
-    image_data: str | None = None,
+    image_hash: str | None = None,
+    image_media_type: str | None = None,
     telegram_message_id: list[int] | None = None,
 ) -> int:
     """Store a user message in the DB without triggering chat completion.
@@ -279,7 +350,8 @@ def _store_message_only_sync(
             role="user",
             content=content,
             meta_info=meta_info or {},
-            image_data=image_data,
+            image_hash=image_hash,
+            image_media_type=image_media_type,
             telegram_message_id=telegram_message_id,
         )
         db.add(msg)
@@ -294,162 +366,28 @@ async def store_message_only(
     session_id: int,
     content: str,
     meta_info: dict | None = None,
-    image_data: str | None = None,
+    image_hash: str | None = None,
+    image_media_type: str | None = None,
     telegram_message_id: list[int] | None = None,
 ) -> int:
     return await asyncio.to_thread(
-        _store_message_only_sync, session_id, content, meta_info, image_data, telegram_message_id,
-    )
-
-
-# ── Photo message with image_data ───────────────────────────────────────────
-
-def _chat_completion_with_image_sync(
-    session_id: int,
-    assistant_name: str,
-    message: str,
-    image_data: str | None = None,
-    short_mode: bool = False,
-    telegram_message_id: list[int] | None = None,
-) -> list[dict[str, Any]]:
-    """Like _chat_completion_sync but stores image_data alongside the user message."""
-    from app.routers.chat import _load_session_messages
-    from app.services.chat_service import ChatService
-
-    db = SessionLocal()
-    try:
-        user_msg = Message(
-            session_id=session_id,
-            role="user",
-            content=message,
-            meta_info={},
-            image_data=image_data,
-            telegram_message_id=telegram_message_id,
-        )
-        db.add(user_msg)
-        db.commit()
-        db.refresh(user_msg)
-        max_id_before = user_msg.id
-
-        chat_service = ChatService(db, assistant_name)
-        messages = _load_session_messages(db, session_id)
-
-        for _ in chat_service.stream_chat_completion(
-            session_id, messages, short_mode=short_mode, source="telegram",
-        ):
-            pass
-
-        new_assistant_msgs = (
-            db.query(Message)
-            .filter(
-                Message.session_id == session_id,
-                Message.id > max_id_before,
-                Message.role == "assistant",
-                Message.content != "",
-            )
-            .order_by(Message.id)
-            .all()
-        )
-
-        return [
-            {"role": "assistant", "content": m.content, "db_id": m.id}
-            for m in new_assistant_msgs
-        ]
-    finally:
-        db.close()
-
-
-async def call_chat_completion_with_image(
-    session_id: int,
-    assistant_name: str,
-    message: str,
-    image_data: str | None = None,
-    short_mode: bool = False,
-    telegram_message_id: list[int] | None = None,
-) -> list[dict[str, Any]]:
-    return await asyncio.to_thread(
-        _chat_completion_with_image_sync,
-        session_id, assistant_name, message, image_data, short_mode, telegram_message_id,
-    )
-
-
-# ── File message with meta_info ─────────────────────────────────────────────
-
-def _chat_completion_with_meta_sync(
-    session_id: int,
-    assistant_name: str,
-    message: str,
-    meta_info: dict | None = None,
-    short_mode: bool = False,
-    telegram_message_id: list[int] | None = None,
-) -> list[dict[str, Any]]:
-    """Like _chat_completion_sync but stores custom meta_info."""
-    from app.routers.chat import _load_session_messages
-    from app.services.chat_service import ChatService
-
-    db = SessionLocal()
-    try:
-        user_msg = Message(
-            session_id=session_id,
-            role="user",
-            content=message,
-            meta_info=meta_info or {},
-            telegram_message_id=telegram_message_id,
-        )
-        db.add(user_msg)
-        db.commit()
-        db.refresh(user_msg)
-        max_id_before = user_msg.id
-
-        chat_service = ChatService(db, assistant_name)
-        messages = _load_session_messages(db, session_id)
-
-        for _ in chat_service.stream_chat_completion(
-            session_id, messages, short_mode=short_mode, source="telegram",
-        ):
-            pass
-
-        new_assistant_msgs = (
-            db.query(Message)
-            .filter(
-                Message.session_id == session_id,
-                Message.id > max_id_before,
-                Message.role == "assistant",
-                Message.content != "",
-            )
-            .order_by(Message.id)
-            .all()
-        )
-
-        return [
-            {"role": "assistant", "content": m.content, "db_id": m.id}
-            for m in new_assistant_msgs
-        ]
-    finally:
-        db.close()
-
-
-async def call_chat_completion_with_meta(
-    session_id: int,
-    assistant_name: str,
-    message: str,
-    meta_info: dict | None = None,
-    short_mode: bool = False,
-    telegram_message_id: list[int] | None = None,
-) -> list[dict[str, Any]]:
-    return await asyncio.to_thread(
-        _chat_completion_with_meta_sync,
-        session_id, assistant_name, message, meta_info, short_mode, telegram_message_id,
+        _store_message_only_sync, session_id, content, meta_info,
+        image_hash, image_media_type, telegram_message_id,
     )
 
 
 # ── Photo/Document helpers ──────────────────────────────────────────────────
 
-def encode_photo_base64(file_bytes: BytesIO | bytes, mime: str = "image/jpeg") -> str:
-    """Convert raw photo bytes to a data URL string."""
+async def store_photo(file_bytes: BytesIO | bytes) -> ProcessedImage:
+    """Normalize a downloaded photo and write it to the blob store.
+
+    Messages keep the returned ``digest``/``media_type``; the base64 data
+    URL is built from the blob only when a model request needs it (see
+    ``load_data_url``).
+    """
     if isinstance(file_bytes, BytesIO):
         data = file_bytes.read()
     else:
         data = file_bytes
-    b64 = base64.b64encode(data).decode("ascii")
-    return f"data:{mime};base64,{b64}"
+    # Telegram re-encodes every photo as JPEG
+    return await process_image(data, "image/jpeg")
@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Any
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+
+logger = logging.getLogger(__name__)
+
+# Telegram allows roughly one message or edit per second per chat; stay below it.
+EDIT_INTERVAL_SECONDS = 1.5
+SEND_INTERVAL_SECONDS = 1.0
+# An in-progress segment is shown once it holds a full sentence or this many chars.
+MIN_PREVIEW_CHARS = 40
+
+_USED_MARKER_RE = re.compile(r"\[\[used:\d+\]\]")
+_SENTENCE_END_RE = re.compile(r"[。！？!?…~～\n]|\.(\s|$)")
+_NEXT = "[NEXT]"
+_MAX_MARKER_LEN = 16
+
+
+@dataclass
+class _Segment:
+    text: str = ""
+    tg_id: int | None = None
+    shown: str = ""
+
+
+@dataclass
+class TelegramStreamWriter:
+    """Deliver a reply to Telegram while it is still being generated.
+
+    Text deltas are fed in as they arrive. In short mode every ``[NEXT]``
+    boundary closes a segment, which becomes its own Telegram message; the
+    open segment is sent once it holds a full sentence and then updated
+    with rate-limited ``editMessageText`` calls. ``finalize`` reconciles
+    the sent messages with the persisted assistant rows and returns which
+    Telegram ids belong to which DB message.
+    """
+
+    bot: Bot
+    chat_id: int
+    is_short: bool
+    segments: list[_Segment] = field(default_factory=list)
+    _rounds: list[str] = field(default_factory=lambda: [""])
+    _last_send: float = 0.0
+    _last_edit: float = 0.0
+
+    # ── Feeding ──────────────────────────────────────────────────────────
+
+    async def feed(self, delta: str) -> None:
+        self._rounds[-1] += delta
+        self._resegment()
+        # Closed segments are delivered right away, the open one when due
+        for seg in self.segments[:-1]:
+            await self._sync_segment(seg, force=True)
+        await self.flush()
+
+    async def flush(self, force: bool = False) -> None:
+        if self.segments:
+            await self._sync_segment(self.segments[-1], force=force, open_segment=True)
+
+    def break_segment(self) -> None:
+        """Close the open segment (e.g. at the end of a tool-call round)."""
+        if self._rounds[-1]:
+            self._rounds.append("")
+
+    @staticmethod
+    def _visible_text(raw: str) -> str:
+        text = _USED_MARKER_RE.sub("", raw)
+        # Hold back a trailing partial "[[used:N" / "[NEXT" marker
+        cut = text.rfind("[")
+        if cut != -1 and len(text) - cut <= _MAX_MARKER_LEN and "]" not in text[cut:]:
+            text = text[:cut]
+        return text
+
+    def _resegment(self) -> None:
+        parts: list[str] = []
+        for raw in self._rounds:
+            text = self._visible_text(raw)
+            round_parts = text.split(_NEXT) if self.is_short else [text]
+            parts.extend(p.strip() for p in round_parts if p.strip())
+        # Segments only ever grow: keep existing objects, extend with new ones
+        for i, part in enumerate(parts):
+            if i < len(self.segments):
+                self.segments[i].text = part
+            else:
+                self.segments.append(_Segment(text=part))
+
+    # ── Delivery ─────────────────────────────────────────────────────────
+
+    def _ready(self, seg: _Segment, open_segment: bool) -> bool:
+        if not seg.text:
+            return False
+        if not open_segment or seg.tg_id is not None:
+            return True
+        return bool(_SENTENCE_END_RE.search(seg.text)) or len(seg.text) >= MIN_PREVIEW_CHARS
+
+    async def _sync_segment(self, seg: _Segment, force: bool = False, open_segment: bool = False) -> None:
+        if seg.text == seg.shown or not self._ready(seg, open_segment and not force):
+            return
+        now = time.monotonic()
+        if seg.tg_id is None:
+            wait = SEND_INTERVAL_SECONDS - (now - self._last_send)
+            if wait > 0:
+                if not force:
+                    return
+                await asyncio.sleep(wait)
+            text = seg.text
+            sent = await self._call(self.bot.send_message, chat_id=self.chat_id, text=text)
+            if sent is not None:
+                seg.tg_id = sent.message_id
+                seg.shown = text
+            self._last_send = time.monotonic()
+            return
+        if not force and now - self._last_edit < EDIT_INTERVAL_SECONDS:
+            return
+        text = seg.text
+        await self._call(
+            self.bot.edit_message_text,
+            chat_id=self.chat_id, message_id=seg.tg_id, text=text,
+        )
+        seg.shown = text
+        self._last_edit = time.monotonic()
+
+    async def _call(self, method: Any, **kwargs: Any) -> Any:
+        for _ in range(3):
+            try:
+                return await method(**kwargs)
+            except TelegramRetryAfter as exc:
+                logger.info("Telegram flood control, retrying in %ss", exc.retry_after)
+                await asyncio.sleep(exc.retry_after)
+            except TelegramBadRequest as exc:
+                # Edits with identical text are rejected; nothing to do
+                if "message is not modified" in str(exc):
+                    return None
+                raise
+        return None
+
+    # ── Completion ───────────────────────────────────────────────────────
+
+    async def finalize(self, result_messages: list[dict[str, Any]]) -> list[tuple[int, list[int]]]:
+        """Make the chat match the persisted replies; return (db_id, telegram ids) pairs."""
+        expected: list[tuple[int | None, str]] = []
+        for msg in result_messages:
+            content = (msg.get("content") or "").strip()
+            if not content:
+                continue
+            parts = content.split(_NEXT) if self.is_short else [content]
+            for part in parts:
+                part = part.strip()
+                if part:
+                    expected.append((msg.get("db_id"), part))
+
+        id_map: dict[int, list[int]] = {}
+        for i, (db_id, text) in enumerate(expected):
+            if i < len(self.segments):
+                seg = self.segments[i]
+                seg.text = text
+            else:
+                seg = _Segment(text=text)
+                self.segments.append(seg)
+            await self._sync_segment(seg, force=True)
+            if db_id is not None and seg.tg_id is not None:
+                id_map.setdefault(db_id, []).append(seg.tg_id)
+
+        # Drop previews the persisted reply does not contain (e.g. error text)
+        for seg in self.segments[len(expected):]:
+            if seg.tg_id is not None:
+                try:
+                    await self.bot.delete_message(chat_id=self.chat_id, message_id=seg.tg_id)
+                except Exception as exc:
+                    logger.debug("Failed to delete stale preview: %s", exc)
+        del self.segments[len(expected):]
+        return list(id_map.items())
+
+    @property
+    def sent_any(self) -> bool:
+        return any(seg.tg_id is not None for seg in self.segments)
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Parity check: ``compute_decayed_score`` (Python) vs ``memory_decayed_score()`` (SQL).
+
+用法:
+    SUPABASE_URL=postgresql://... python tools/decay_score_parity.py
+    SUPABASE_URL=postgresql://... python tools/decay_score_parity.py --rel-tol 1e-9 --show 20
+
+Evaluates both implementations over a grid of importance, manual boost,
+hits, klass half-life (plus NULL / 0 edge values) and ages from
+``last_access_ts`` or ``created_at`` (including future timestamps and ages
+deep enough to hit the exponent floor). The SQL function is created from
+``DECAYED_SCORE_FUNCTION_SQL`` inside a transaction that is rolled back,
+so the check tests the definition in the code, not whatever version the
+database has, and leaves the database untouched. Exits non-zero on any
+mismatch.
+"""
+
+import argparse
+import itertools
+import json
+import math
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text  # noqa: E402
+
+from app.constants import KLASS_DEFAULTS  # noqa: E402
+from app.database import engine  # noqa: E402
+from app.services.memory_scoring import DECAYED_SCORE_FUNCTION_SQL, compute_decayed_score  # noqa: E402
+
+NOW = datetime(2026, 1, 15, 12, 0, tzinfo=timezone.utc)
+IMPORTANCES = [None, 0.0, 0.05, 0.5, 0.9, 1.0]
+BOOSTS = [None, -0.8, 0.0, 0.2, 0.7]
+HITS = [None, 0, 1, 7, 250]
+# Klass half-lives, plus NULL / 0 (both fall back to 60 days)
+HALFLIFES = sorted({v["halflife_days"] for v in KLASS_DEFAULTS.values()}) + [None, 0.0]
+AGES_DAYS = [-3.0, 0.0, 0.25, 30.0, 365.0, 4000.0, 200000.0]
+
+_EVAL_SQL = text(
+    """
+SELECT c.i, memory_decayed_score(
+    c.importance, c.manual_boost, c.hits, c.halflife_days,
+    c.last_access_ts, c.created_at, c.now_ts
+) AS score
+FROM jsonb_to_recordset(CAST(:cases AS jsonb)) AS c(
+    i INTEGER, importance DOUBLE PRECISION, manual_boost DOUBLE PRECISION, hits INTEGER,
+    halflife_days DOUBLE PRECISION, last_access_ts TIMESTAMPTZ, created_at TIMESTAMPTZ,
+    now_ts TIMESTAMPTZ
+)
+ORDER BY c.i
+"""
+)
+
+
+def _cases() -> list[dict]:
+    cases = []
+    grid = itertools.product(IMPORTANCES, BOOSTS, HITS, HALFLIFES, AGES_DAYS, (True, False))
+    for importance, boost, hits, halflife, age, via_access in grid:
+        stamp = NOW - timedelta(days=age)
+        last_access, created = (stamp, NOW - timedelta(days=age + 10)) if via_access else (None, stamp)
+        cases.append({
+            "importance": importance, "manual_boost": boost, "hits": hits,
+            "halflife_days": halflife, "last_access_ts": last_access, "created_at": created,
+        })
+    # No timestamps at all: age 0
+    cases.append({
+        "importance": 0.7, "manual_boost": None, "hits": 3, "halflife_days": 30.0,
+        "last_access_ts": None, "created_at": None,
+    })
+    return cases
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rel-tol", type=float, default=1e-9)
+    parser.add_argument("--abs-tol", type=float, default=1e-12)
+    parser.add_argument("--show", type=int, default=10, help="mismatches to print")
+    args = parser.parse_args()
+
+    cases = _cases()
+    payload = [
+        {
+            "i": i,
+            **{k: v.isoformat() if isinstance(v, datetime) else v for k, v in case.items()},
+            "now_ts": NOW.isoformat(),
+        }
+        for i, case in enumerate(cases)
+    ]
+    with engine.connect() as conn:
+        trans = conn.begin()
+        try:
+            conn.execute(text(DECAYED_SCORE_FUNCTION_SQL))
+            sql_scores = {row.i: row.score for row in conn.execute(_EVAL_SQL, {"cases": json.dumps(payload)})}
+        finally:
+            trans.rollback()
+
+    mismatches = []
+    worst = 0.0
+    for i, case in enumerate(cases):
+        expected = sql_scores[i]
+        actual = compute_decayed_score(now=NOW, **case)
+        if not math.isclose(actual, expected, rel_tol=args.rel_tol, abs_tol=args.abs_tol):
+            mismatches.append((case, expected, actual))
+        if expected:
+            worst = max(worst, abs(actual - expected) / abs(expected))
+
+    print(f"{len(cases)} cases, worst relative difference {worst:.3e}, {len(mismatches)} mismatches")
+    for case, expected, actual in mismatches[: args.show]:
+        print(f"  sql={expected!r} python={actual!r} {case}")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
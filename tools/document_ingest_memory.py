@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+PDF ingestion memory check — peak RSS of the old whole-document extraction
+vs the capped page-by-page ``extract_pdf_pages``, on generated PDFs of
+increasing size.
+
+用法:
+    python tools/document_ingest_memory.py --pages 50 200 800 --lines 60
+
+Every measurement runs in a fresh process. Both variants first import the
+PDF modules either path uses (``PDF_MODULES``), then take the baseline, so
+the reported peak RSS growth is extraction only; the script prints this
+with the results. The old path (every page
+extracted and kept, page caches never released) grows with the document.
+The capped path should level off once ``--max-pages`` / ``--max-chars``
+is reached. Needs pdfplumber.
+"""
+
+import argparse
+import importlib
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.document_ingest import DOC_MAX_CHARS, DOC_MAX_PAGES, extract_pdf_pages  # noqa: E402
+
+# Imported in every measuring process before its baseline, for both variants
+PDF_MODULES = ("pdfplumber", "pdfminer.pdftypes")
+
+
+def _make_pdf(path: str, pages: int, lines: int) -> None:
+    objects: list[bytes] = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"",  # pages tree, filled in below
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    kids = []
+    for p in range(pages):
+        text = b"BT /F1 9 Tf 40 800 Td 11 TL " + b" ".join(
+            b"(Page %d line %d: the quick brown fox jumps over the lazy dog 0123456789) '" % (p + 1, i)
+            for i in range(lines)
+        ) + b" ET"
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(text), text))
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % len(objects)
+        )
+        kids.append(b"%d 0 R" % len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(kids), pages)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def _extract_all(path: str) -> int:
+    import pdfplumber
+
+    with pdfplumber.open(path) as pdf:
+        pages = [page.extract_text() or "" for page in pdf.pages]
+        return len("\n".join(pages))
+
+
+def _measure(variant: str, path: str, max_pages: int, max_chars: int) -> tuple[float, int, float]:
+    for module in PDF_MODULES:
+        importlib.import_module(module)
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    if variant == "whole":
+        chars = _extract_all(path)
+    else:
+        chars = len(extract_pdf_pages(path, max_pages, max_chars)["text"])
+    elapsed = time.perf_counter() - started
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return (peak - baseline) / 1024, chars, elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[50, 200, 800])
+    parser.add_argument("--lines", type=int, default=60, help="text lines per page")
+    parser.add_argument("--max-pages", type=int, default=DOC_MAX_PAGES)
+    parser.add_argument("--max-chars", type=int, default=DOC_MAX_CHARS)
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as tmp, \
+            ProcessPoolExecutor(max_workers=1, mp_context=ctx, max_tasks_per_child=1) as pool:
+        print(f"caps: {args.max_pages} pages / {args.max_chars} chars")
+        print(f"each run: fresh process, baseline taken after importing {', '.join(PDF_MODULES)}")
+        print(f"{'pages':>6} {'size':>8}  {'variant':>7} {'peak RSS +MB':>12} {'chars':>9} {'time':>7}")
+        for pages in args.pages:
+            path = os.path.join(tmp, f"doc-{pages}.pdf")
+            _make_pdf(path, pages, args.lines)
+            size_mb = os.path.getsize(path) / 1e6
+            for variant in ("whole", "capped"):
+                rss, chars, elapsed = pool.submit(
+                    _measure, variant, path, args.max_pages, args.max_chars,
+                ).result()
+                print(f"{pages:>6} {size_mb:>7.1f}M  {variant:>7} {rss:>12.1f} {chars:>9} {elapsed:>6.1f}s")
+
+
+if __name__ == "__main__":
+    main()
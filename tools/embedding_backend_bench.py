@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Embedding / rerank backend benchmark (offline).
+
+用法:
+    python tools/embedding_backend_bench.py --backend hashing --texts 200
+    LOCAL_EMBEDDING_MODEL_DIR=models/bge-m3-onnx \\
+        python tools/embedding_backend_bench.py --backend local --texts 200
+
+Runs ``EmbeddingService`` on the chosen backend with synthetic mixed
+Chinese / English memories and reports:
+
+- one-by-one vs batched ``get_embeddings`` throughput;
+- rerank latency over a 40-candidate pool (the fast_recall pool size);
+- whether two runs produce identical vectors and rankings.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SUBJECTS = ["她", "我们", "猫", "妈妈", "老板", "the cat", "my sister"]
+ACTIONS = ["喜欢", "讨厌", "去了", "想要", "提到过", "likes", "visited"]
+OBJECTS = ["火锅", "海边", "下雨天", "新的工作", "生日礼物", "jazz music", "Kyoto in autumn"]
+
+
+def _texts(n: int, seed: int) -> list[str]:
+    rng = random.Random(seed)
+    return [
+        f"{rng.choice(SUBJECTS)}{rng.choice(ACTIONS)}{rng.choice(OBJECTS)}，" * rng.randint(1, 6)
+        for _ in range(n)
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", default="hashing", choices=["hashing", "local", "siliconflow"])
+    parser.add_argument("--texts", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    os.environ["EMBEDDING_BACKEND"] = args.backend
+    from app.services.embedding_service import EmbeddingService
+
+    service = EmbeddingService()
+    print(f"backend: {service.backend.name}")
+    texts = _texts(args.texts, args.seed)
+
+    started = time.perf_counter()
+    single = [service.get_embedding(t) for t in texts]
+    single_s = time.perf_counter() - started
+    started = time.perf_counter()
+    batched = service.get_embeddings(texts)
+    batched_s = time.perf_counter() - started
+    failed = sum(v is None for v in batched)
+    print(f"one-by-one {len(texts)} texts: {single_s:.3f}s ({len(texts) / single_s:.0f}/s)")
+    print(f"batched    {len(texts)} texts: {batched_s:.3f}s ({len(texts) / batched_s:.0f}/s), {failed} failed")
+
+    query = "她喜欢吃火锅吗"
+    pool = texts[:40]
+    timings = []
+    for _ in range(5):
+        started = time.perf_counter()
+        ranked = service.rerank(query, pool, top_n=5)
+        timings.append(time.perf_counter() - started)
+    print(f"rerank 40 candidates: median {sorted(timings)[2] * 1000:.1f}ms, top: {[r['index'] for r in ranked]}")
+    for item in ranked[:3]:
+        print(f"  {item['relevance_score']:.3f}  {pool[item['index']][:40]}")
+
+    same_vectors = single == batched == service.get_embeddings(texts)
+    same_ranking = ranked == service.rerank(query, pool, top_n=5)
+    print(f"deterministic: vectors={same_vectors} ranking={same_ranking}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Failure-injection check for the embedding / rerank HTTP layer.
+
+用法:
+    python tools/embedding_failure_check.py --slow 10 --deadline 1.5
+
+Points ``EmbeddingService`` at a local stub of the SiliconFlow API whose
+behaviour is switched per scenario, then checks:
+
+1. healthy calls reuse one keep-alive connection;
+2. transient 503s are retried and succeed;
+3. a hung upstream is abandoned at the caller's deadline;
+4. repeated failures open the circuit and later calls skip the network;
+5. after the reset period one probe closes the circuit again;
+6. rerank with no time left returns [] without sending a request.
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BREAKER_FAILURES = 3
+BREAKER_RESET = 1.0
+
+
+class Stub:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.mode = "ok"
+        self.fail_next = 0
+        self.slow_seconds = 10.0
+        self.hits = 0
+        self.client_ports: set[int] = set()
+
+    def reset(self, mode: str = "ok", fail_next: int = 0) -> None:
+        with self.lock:
+            self.mode, self.fail_next, self.hits = mode, fail_next, 0
+            self.client_ports.clear()
+
+
+stub = Stub()
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self) -> None:  # noqa: N802
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with stub.lock:
+            stub.hits += 1
+            stub.client_ports.add(self.client_address[1])
+            failing = stub.mode == "fail" or stub.fail_next > 0
+            stub.fail_next = max(0, stub.fail_next - 1)
+            mode = stub.mode
+        if mode == "slow":
+            time.sleep(stub.slow_seconds)
+        if failing:
+            self._send(503, {"error": "unavailable"})
+        elif self.path.endswith("/embeddings"):
+            self._send(200, {"data": [{"embedding": [0.0] * 1024}]})
+        else:
+            self._send(200, {"results": [{"index": 0, "relevance_score": 0.9}]})
+
+    def _send(self, status: int, body: dict) -> None:
+        data = json.dumps(body).encode()
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+def _check(name: str, ok: bool, detail: str) -> bool:
+    print(f"[{'ok' if ok else 'FAIL'}] {name}: {detail}")
+    return ok
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--slow", type=float, default=10.0, help="stub delay in the hung scenario")
+    parser.add_argument("--deadline", type=float, default=1.5, help="caller deadline in seconds")
+    args = parser.parse_args()
+    stub.slow_seconds = args.slow
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ["SILICONFLOW_BASE_URL"] = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    os.environ.setdefault("SILICONFLOW_API_KEY", "stub-key")
+    os.environ["EMBEDDING_BREAKER_FAILURES"] = str(BREAKER_FAILURES)
+    os.environ["EMBEDDING_BREAKER_RESET"] = str(BREAKER_RESET)
+
+    from app.services import embedding_service
+    from app.services.embedding_service import EmbeddingService
+
+    service = EmbeddingService()
+    results = []
+
+    stub.reset("ok")
+    vectors = [service.get_embedding(f"text {i}") for i in range(10)]
+    results.append(_check(
+        "keep-alive",
+        all(v and len(v) == 1024 for v in vectors) and len(stub.client_ports) == 1,
+        f"10 calls over {len(stub.client_ports)} connection(s)",
+    ))
+
+    stub.reset("ok", fail_next=2)
+    vector = service.get_embedding("retry me")
+    results.append(_check("retry", vector is not None and stub.hits == 3, f"succeeded after {stub.hits} attempts"))
+
+    stub.reset("slow")
+    started = time.monotonic()
+    vector = service.get_embedding("hung", deadline=time.monotonic() + args.deadline)
+    elapsed = time.monotonic() - started
+    results.append(_check(
+        "deadline",
+        vector is None and elapsed < args.deadline + 0.5,
+        f"gave up after {elapsed:.2f}s (deadline {args.deadline}s, upstream {args.slow}s)",
+    ))
+
+    stub.reset("fail")
+    for _ in range(BREAKER_FAILURES + 2):
+        service.get_embedding("down")
+    attempts = stub.hits
+    started = time.monotonic()
+    skipped = [service.get_embedding("down") for _ in range(20)]
+    elapsed = time.monotonic() - started
+    results.append(_check(
+        "circuit open",
+        embedding_service._embedding_breaker.state == "open" and stub.hits == attempts and not any(skipped),
+        f"{attempts} requests until open, then 20 calls in {elapsed * 1000:.1f}ms with no requests",
+    ))
+
+    stub.reset("ok")
+    time.sleep(BREAKER_RESET + 0.1)
+    vector = service.get_embedding("recovered")
+    results.append(_check(
+        "circuit probe",
+        vector is not None and embedding_service._embedding_breaker.state == "closed" and stub.hits == 1,
+        f"state={embedding_service._embedding_breaker.state} after one probe",
+    ))
+
+    stub.reset("ok")
+    ranked = service.rerank("q", ["a", "b"], deadline=time.monotonic() + 0.01)
+    results.append(_check("rerank deadline", ranked == [] and stub.hits == 0, f"{stub.hits} request(s) sent"))
+
+    server.shutdown()
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == "__main__":
+    main()
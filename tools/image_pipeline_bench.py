@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Image normalization benchmark — payload size and describe latency with
+original vs normalized images, against a stubbed multimodal endpoint.
+
+用法:
+    python tools/image_pipeline_bench.py --images 5 --width 4032 --height 3024
+    python tools/image_pipeline_bench.py --uplink-mbps 20 --ms-per-ktoken 40
+
+Generates ``--images`` synthetic photos (noisy gradients, so JPEG cannot
+compress them to nothing) and runs them through ``process_image_sync``.
+A local HTTP server stands in for the provider: it reads the request body
+at ``--uplink-mbps``, decodes every image to estimate vision tokens
+(width × height / 750, as Anthropic documents) and sleeps
+``--ms-per-ktoken`` per thousand of them. Each describe batch is posted
+in the OpenAI data-URL shape ``describe_images`` sends. Needs Pillow.
+"""
+
+import argparse
+import base64
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("BLOB_STORE_DIR", tempfile.mkdtemp(prefix="image-bench-"))
+
+try:
+    from PIL import Image
+except ImportError:
+    sys.exit("Pillow is required: pip install Pillow")
+
+from app.services.blob_store import blob_store  # noqa: E402
+from app.services.image_pipeline import IMAGE_MAX_EDGE, IMAGE_OUTPUT_FORMAT, process_image_sync  # noqa: E402
+
+
+def _make_photo(rng: random.Random, width: int, height: int) -> bytes:
+    small = Image.new("RGB", (64, 48))
+    small.putdata([
+        (rng.randrange(256), rng.randrange(256), rng.randrange(256)) for _ in range(64 * 48)
+    ])
+    img = small.resize((width, height), Image.BICUBIC)
+    noise = Image.effect_noise((width, height), 24).convert("RGB")
+    img = Image.blend(img, noise, 0.15)
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=92)
+    return buf.getvalue()
+
+
+def _serve(uplink_mbps: float, ms_per_ktoken: float) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self) -> None:  # noqa: N802
+            length = int(self.headers.get("Content-Length", 0))
+            body = self.rfile.read(length)
+            time.sleep(length * 8 / (uplink_mbps * 1_000_000))
+            tokens = 0
+            for part in json.loads(body)["messages"][-1]["content"]:
+                if part["type"] == "image_url":
+                    data = base64.b64decode(part["image_url"]["url"].split(",", 1)[1])
+                    w, h = Image.open(io.BytesIO(data)).size
+                    tokens += w * h / 750
+            time.sleep(tokens / 1000 * ms_per_ktoken / 1000)
+            reply = json.dumps({"tokens": int(tokens)}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(reply)))
+            self.end_headers()
+            self.wfile.write(reply)
+
+        def log_message(self, *args) -> None:
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _describe(url: str, images: list[tuple[str, str]]) -> tuple[int, int, float]:
+    parts = [
+        {"type": "image_url", "image_url": {"url": f"data:{media_type};base64,{b64}"}}
+        for media_type, b64 in images
+    ]
+    parts.append({"type": "text", "text": "请简短描述以下图片"})
+    body = json.dumps({"model": "stub", "messages": [{"role": "user", "content": parts}]}).encode()
+    started = time.perf_counter()
+    with urllib.request.urlopen(urllib.request.Request(url, data=body, method="POST")) as resp:
+        tokens = json.loads(resp.read())["tokens"]
+    return len(body), tokens, (time.perf_counter() - started) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=5, help="images per describe batch")
+    parser.add_argument("--width", type=int, default=4032)
+    parser.add_argument("--height", type=int, default=3024)
+    parser.add_argument("--uplink-mbps", type=float, default=20.0)
+    parser.add_argument("--ms-per-ktoken", type=float, default=40.0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    photos = [_make_photo(rng, args.width, args.height) for _ in range(args.images)]
+
+    started = time.perf_counter()
+    processed = [process_image_sync(data, "image/jpeg") for data in photos]
+    process_ms = (time.perf_counter() - started) * 1000 / len(photos)
+    started = time.perf_counter()
+    for data in photos:
+        process_image_sync(data, "image/jpeg")
+    cached_ms = (time.perf_counter() - started) * 1000 / len(photos)
+
+    original = [("image/jpeg", base64.b64encode(data).decode()) for data in photos]
+    normalized = [
+        (item.media_type, base64.b64encode(blob_store.get(item.digest)).decode()) for item in processed
+    ]
+
+    server = _serve(args.uplink_mbps, args.ms_per_ktoken)
+    url = f"http://127.0.0.1:{server.server_address[1]}/v1/chat/completions"
+    try:
+        print(f"{args.images} × {args.width}x{args.height} JPEG → max edge {IMAGE_MAX_EDGE}, "
+              f"{IMAGE_OUTPUT_FORMAT}; uplink {args.uplink_mbps:g} Mbps, {args.ms_per_ktoken:g} ms/ktoken")
+        print(f"process: {process_ms:.0f}ms/image, cached {cached_ms:.1f}ms/image; "
+              f"{sum(p.source_bytes for p in processed) / 1e6:.2f}MB → "
+              f"{sum(p.output_bytes for p in processed) / 1e6:.2f}MB")
+        for name, images in (("original", original), ("normalized", normalized)):
+            runs = [_describe(url, images) for _ in range(args.repeat)]
+            payload, tokens, _ = runs[0]
+            latency = statistics.median(r[2] for r in runs)
+            print(f"{name:>10}: payload {payload / 1e6:6.2f}MB  ~{tokens:>6} vision tokens  "
+                  f"describe median {latency:.0f}ms")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
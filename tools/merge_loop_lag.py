@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Event-loop lag probe for the daily merge cron.
+
+用法:
+    python tools/merge_loop_lag.py --assistants 4 --merge-seconds 2
+
+Runs a fake merge (time.sleep, standing in for the blocking LLM calls)
+for ``--assistants`` assistants twice: once inline on the event loop, the
+way the cron used to call ``daily_merge_to_longterm``, and once through
+``run_daily_merges`` on the daily-merge executor. A ticker task measures
+how late the loop wakes up while each variant runs. With the executor the
+max lag should stay around the tick interval regardless of merge time.
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.summary_service import DAILY_MERGE_CONCURRENCY, run_daily_merges  # noqa: E402
+
+
+async def _measure(variant, tick: float) -> tuple[float, float, float]:
+    lags: list[float] = []
+    done = asyncio.Event()
+
+    async def ticker() -> None:
+        while not done.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(tick)
+            lags.append(max(0.0, time.perf_counter() - started - tick) * 1000)
+
+    task = asyncio.create_task(ticker())
+    await asyncio.sleep(tick)
+    started = time.perf_counter()
+    await variant()
+    elapsed = time.perf_counter() - started
+    done.set()
+    await task
+    return elapsed, max(lags, default=0.0), sum(lags) / len(lags) if lags else 0.0
+
+
+async def _run(args: argparse.Namespace) -> None:
+    assistant_ids = list(range(1, args.assistants + 1))
+
+    def fake_merge(assistant_id: int) -> bool:
+        time.sleep(args.merge_seconds)
+        return True
+
+    async def inline() -> None:
+        for aid in assistant_ids:
+            fake_merge(aid)
+
+    async def executor() -> None:
+        await run_daily_merges(assistant_ids, merge=fake_merge)
+
+    print(f"{args.assistants} assistants × {args.merge_seconds:.1f}s merge, "
+          f"executor concurrency {DAILY_MERGE_CONCURRENCY}")
+    for name, variant in (("inline", inline), ("executor", executor)):
+        elapsed, max_lag, avg_lag = await _measure(variant, args.tick)
+        print(f"{name:>9}: total {elapsed:.2f}s  loop lag max={max_lag:.1f}ms avg={avg_lag:.1f}ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--assistants", type=int, default=4)
+    parser.add_argument("--merge-seconds", type=float, default=2.0)
+    parser.add_argument("--tick", type=float, default=0.05, help="ticker interval in seconds")
+    asyncio.run(_run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Recall cache replay benchmark.
+
+用法:
+    python tools/recall_cache_replay.py
+    python tools/recall_cache_replay.py --conversation chat.jsonl --threshold 0.9 --recall-ms 900
+
+Replays a recorded conversation through ``RecallCache`` the way the chat
+service drives ``fast_recall`` and reports the hit rate and the recall time
+saved. Each JSONL line is one of:
+
+    {"session_id": 1, "role": "user", "content": "..."}
+    {"session_id": 1, "role": "assistant", "content": "..."}
+    {"event": "memory_write"}          # a commit that changed memories
+
+Queries are chosen like the chat service does: the user message, or the
+last assistant reply when the message is shorter than 10 characters.
+Embeddings come from ``EMBEDDING_BACKEND`` (``hashing`` by default, so the
+replay is offline and deterministic); every miss is charged
+``--recall-ms``, the measured cost of a full recall (embedding, two
+candidate queries, rerank, tag expansion). Without ``--conversation`` a
+built-in sample with bursts of short Telegram messages is used.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SAMPLE = [
+    (1, "user", "今天好累啊，加班到九点才回家"),
+    (1, "assistant", "辛苦了。九点才到家，晚饭吃了吗？要不要先泡个热水澡放松一下，我陪你聊会儿。"),
+    (1, "user", "嗯"),
+    (1, "user", "还没吃"),
+    (1, "user", "不想动"),
+    (1, "assistant", "那就点个外卖吧，你上次说楼下那家粥铺的皮蛋瘦肉粥很好喝，暖胃又不油腻。"),
+    (1, "user", "好"),
+    (1, "user", "那家粥铺今天关门了"),
+    (1, "user", "那家粥铺今天好像关门了"),
+    (1, "user", "那家粥铺今天好像关门了诶"),
+    (None, "event", "memory_write"),
+    (1, "user", "那家粥铺今天好像关门了诶！"),
+    (1, "assistant", "关门了呀，那换成你喜欢的那家拉面？记得少放辣，你最近胃不太舒服。"),
+    (1, "user", "哈哈"),
+    (1, "user", "你记得好清楚"),
+    (2, "user", "周末想去海边，你觉得去哪里好"),
+    (2, "assistant", "可以去你之前提过的那个小渔村，人少，傍晚的日落特别好看，还能吃到新鲜海鲜。"),
+    (2, "user", "好呀"),
+    (2, "user", "周末想去海边玩，去哪里好呢"),
+    (2, "user", "要带什么"),
+    (2, "user", "要带什么东西"),
+]
+
+
+def _load(path: str | None) -> list[dict]:
+    if path is None:
+        return [
+            {"event": content} if role == "event" else {"session_id": sid, "role": role, "content": content}
+            for sid, role, content in SAMPLE
+        ]
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversation", help="recorded conversation (JSONL)")
+    parser.add_argument("--threshold", type=float, default=None, help="cosine threshold (default: RECALL_CACHE_THRESHOLD)")
+    parser.add_argument("--recall-ms", type=float, default=900.0, help="cost charged per full recall")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    os.environ.setdefault("EMBEDDING_BACKEND", "hashing")
+    from app.services.embedding_service import EmbeddingService
+    from app.services.recall_cache import RecallCache, bump_memories_version, memories_version
+
+    embedding = EmbeddingService()
+    cache = RecallCache() if args.threshold is None else RecallCache(threshold=args.threshold)
+    last_reply: dict[int, str] = {}
+    turns = embed_calls = 0
+    recall_s = 0.0
+
+    for line in _load(args.conversation):
+        if line.get("event") == "memory_write":
+            bump_memories_version()
+            continue
+        session_id, content = line["session_id"], line["content"]
+        if line["role"] == "assistant":
+            last_reply[session_id] = content
+            continue
+
+        turns += 1
+        query = content
+        if len(content.strip()) < 10 and len(last_reply.get(session_id, "").strip()) > 10:
+            query = last_reply[session_id].strip()[:200]
+        version = memories_version()
+        started = time.perf_counter()
+        outcome = "text hit"
+        results = cache.lookup_text(session_id, query, "")
+        if results is None:
+            embed_calls += 1
+            vector = embedding.get_embedding(query)
+            results = cache.lookup_vector(session_id, vector, "")
+            outcome = "vector hit"
+            if results is None:
+                outcome = "miss"
+                recall_s += args.recall_ms / 1000
+                results = [{"id": turns, "content": f"recall for {query[:20]}"}]
+                cache.store(session_id, query, vector, "", version, results)
+        recall_s += time.perf_counter() - started
+        if args.verbose:
+            print(f"  [{outcome:10}] s{session_id} {content}")
+
+    stats = cache.snapshot()
+    baseline_s = turns * args.recall_ms / 1000
+    print(f"backend: {embedding.backend.name}, threshold: {cache.threshold}")
+    print(f"turns: {turns}, embedding calls: {embed_calls}")
+    print(
+        f"hits: {stats['text_hits']} text + {stats['vector_hits']} vector, "
+        f"misses: {stats['misses']}, stale dropped: {stats['stale']}, hit rate: {stats['hit_rate']:.0%}"
+    )
+    print(f"recall time: {recall_s:.2f}s vs {baseline_s:.2f}s uncached ({args.recall_ms:.0f}ms per recall)")
+
+
+if __name__ == "__main__":
+    main()
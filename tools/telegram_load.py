@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Telegram webhook load generator — replays synthetic updates against the
+webhook and reports acknowledgement latency plus the server's intake stats.
+
+用法:
+    python tools/telegram_load.py --bot acheng --updates 500 --chats 20 \
+        --concurrency 50 --duplicates 0.1
+
+Each synthetic update is a plain text message from one of ``--chats`` chat
+ids; ``--duplicates`` re-sends that fraction of updates with the same
+update_id, like Telegram does after a slow acknowledgement. Use a chat id
+outside TELEGRAM_CHAT_ID (the default) so the handlers ignore the messages
+and only the intake path is measured, or pass --chat-base with the allowed
+id to drive real replies.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import time
+
+import httpx
+
+API_URL = os.environ.get("CHULI_API_URL", "http://127.0.0.1:8000")
+
+
+def _make_update(update_id: int, chat_id: int, text: str) -> dict:
+    now = int(time.time())
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": now,
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "load"},
+            "text": text,
+        },
+    }
+
+
+async def _run(args: argparse.Namespace) -> None:
+    rng = random.Random(args.seed)
+    base_id = args.update_base or int(time.time() * 1000) % 1_000_000_000
+    updates = [
+        _make_update(base_id + i, args.chat_base + rng.randrange(args.chats), f"load test #{i}")
+        for i in range(args.updates)
+    ]
+    replays = [u for u in updates if rng.random() < args.duplicates]
+    payloads = updates + replays
+    rng.shuffle(payloads)
+
+    url = f"{API_URL}/telegram/webhook/{args.bot}"
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies: list[float] = []
+    statuses: dict[int, int] = {}
+
+    async with httpx.AsyncClient(timeout=30) as client:
+        async def send(payload: dict) -> None:
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    resp = await client.post(url, json=payload)
+                    status = resp.status_code
+                except httpx.HTTPError:
+                    status = -1
+                latencies.append((time.perf_counter() - started) * 1000)
+                statuses[status] = statuses.get(status, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(send(p) for p in payloads))
+        elapsed = time.perf_counter() - started
+
+        print(f"sent {len(payloads)} updates ({len(replays)} duplicates) in {elapsed:.2f}s "
+              f"→ {len(payloads) / elapsed:.1f} req/s")
+        print(f"status codes: {dict(sorted(statuses.items()))}")
+        ordered = sorted(latencies)
+        print(
+            "ack latency ms: "
+            f"p50={statistics.median(ordered):.1f} "
+            f"p95={ordered[int(len(ordered) * 0.95) - 1]:.1f} "
+            f"max={ordered[-1]:.1f}"
+        )
+
+        if args.token:
+            await asyncio.sleep(args.settle)
+            resp = await client.get(
+                f"{API_URL}/api/telegram/intake/stats",
+                headers={"Authorization": f"Bearer {args.token}"},
+            )
+            print(f"intake stats: {resp.json()}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bot", default="acheng", help="bot key in the webhook path")
+    parser.add_argument("--updates", type=int, default=200)
+    parser.add_argument("--chats", type=int, default=10, help="distinct synthetic chat ids")
+    parser.add_argument("--chat-base", type=int, default=900_000_000)
+    parser.add_argument("--update-base", type=int, default=0, help="first update_id (default: time based)")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duplicates", type=float, default=0.1, help="fraction of updates re-sent")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--token", default=os.environ.get("CHULI_TOKEN", ""),
+                        help="API token to fetch /api/telegram/intake/stats afterwards")
+    parser.add_argument("--settle", type=float, default=2.0, help="seconds to wait before reading stats")
+    asyncio.run(_run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
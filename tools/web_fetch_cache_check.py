@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+web_fetch cache check against a local stub of the reader service.
+
+用法:
+    python tools/web_fetch_cache_check.py --concurrency 16 --delay 0.3
+
+Points ``web_fetch`` at a local HTTP server that mimics r.jina.ai's JSON
+response (with ``--delay`` seconds of latency and a request counter), then
+checks:
+
+1. concurrent fetches of one URL hit the upstream once (singleflight);
+2. reading every offset page of a long document costs no further requests;
+3. the memory tier stays within its byte budget (LRU eviction);
+4. a fresh cache backed by the same disk directory serves the URL
+   without refetching (restart);
+5. upstream errors are returned to every waiter and not cached.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_hits: dict[str, int] = {}
+_hits_lock = threading.Lock()
+
+
+def _serve(delay: float, doc_chars: int) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:  # noqa: N802
+            target = self.path.lstrip("/")
+            with _hits_lock:
+                _hits[target] = _hits.get(target, 0) + 1
+            time.sleep(delay)
+            if "fail" in target:
+                self.send_response(502)
+                self.end_headers()
+                return
+            body = json.dumps({"data": {
+                "title": f"Title of {target}",
+                "content": (f"{target} " * doc_chars)[:doc_chars],
+            }}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args) -> None:
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _check(name: str, ok: bool, detail: str) -> bool:
+    print(f"[{'ok' if ok else 'FAIL'}] {name}: {detail}")
+    return ok
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--delay", type=float, default=0.3, help="stub latency in seconds")
+    parser.add_argument("--doc-chars", type=int, default=30000)
+    args = parser.parse_args()
+
+    server = _serve(args.delay, args.doc_chars)
+    disk_dir = tempfile.mkdtemp(prefix="web-fetch-cache-")
+    os.environ["JINA_READER_URL"] = f"http://127.0.0.1:{server.server_address[1]}/"
+    os.environ.setdefault("JINA_API_KEYS", "stub-key")
+    os.environ["WEB_FETCH_CACHE_DIR"] = disk_dir
+    # Room for about three documents
+    os.environ["WEB_FETCH_CACHE_BYTES"] = str(args.doc_chars * 3 + 1000)
+
+    from app.services import web_service
+    from app.services.fetch_cache import FetchCache
+
+    results = []
+    url = "https://example.com/article"
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        started = time.perf_counter()
+        replies = list(pool.map(lambda _: web_service.web_fetch({"url": url}), range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+    results.append(_check(
+        "singleflight",
+        _hits.get(url) == 1 and all("error" not in r for r in replies),
+        f"{args.concurrency} concurrent fetches → {_hits.get(url)} upstream request(s) in {elapsed:.2f}s",
+    ))
+
+    offset, pages = 0, 0
+    while True:
+        reply = web_service.web_fetch({"url": url, "offset": offset})
+        pages += 1
+        if not reply["has_more"]:
+            break
+        offset += web_service.WEB_FETCH_PAGE_CHARS
+    results.append(_check("paging", _hits.get(url) == 1, f"{pages} pages read, still {_hits.get(url)} request"))
+
+    for i in range(6):
+        web_service.web_fetch({"url": f"https://example.com/other/{i}"})
+    stats = web_service._fetch_cache.snapshot()
+    results.append(_check(
+        "byte budget",
+        stats["bytes"] <= web_service._fetch_cache.max_bytes and stats["evictions"] > 0,
+        f"{stats['entries']} entries, {stats['bytes']} / {web_service._fetch_cache.max_bytes} bytes, "
+        f"{stats['evictions']} evictions",
+    ))
+
+    restarted = FetchCache(max_bytes=10_000_000, ttl_seconds=300, disk_dir=disk_dir, disk_max_bytes=10_000_000)
+    before = _hits.get(url)
+    doc = restarted.get_or_fetch(url, web_service._fetch_document)
+    results.append(_check(
+        "disk tier",
+        _hits.get(url) == before and restarted.snapshot()["disk_hits"] == 1 and len(doc.content) == args.doc_chars,
+        f"fresh cache served {len(doc.content)} chars from disk",
+    ))
+
+    bad = "https://example.com/fail"
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        errors = list(pool.map(lambda _: web_service.web_fetch({"url": bad}), range(4)))
+    first = _hits.get(bad, 0)
+    web_service.web_fetch({"url": bad})
+    results.append(_check(
+        "errors",
+        all("error" in r for r in errors) and _hits.get(bad) == first + 1,
+        f"4 concurrent failures → {first} request(s); retry refetched",
+    ))
+
+    server.shutdown()
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+web_search benchmark against the local stub provider.
+
+用法:
+    python tools/web_search_bench.py --latency 0.5 --threads 8
+
+Runs ``web_search`` with ``WEB_SEARCH_PROVIDER=stub`` (no network) and
+reports backend calls and wall time for:
+
+1. a batch of related queries in one call (concurrent) vs one by one;
+2. near-identical repeats (case / whitespace / full-width variants),
+   which should be served from the cache;
+3. many threads searching the same new query at once (coalesced).
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+QUERIES = ["python asyncio timeout", "asyncio wait_for cancel", "asyncio TaskGroup", "anyio vs asyncio"]
+
+
+def _timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.5, help="stub latency per search in seconds")
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    os.environ["WEB_SEARCH_PROVIDER"] = "stub"
+    os.environ["WEB_SEARCH_STUB_LATENCY"] = str(args.latency)
+    from app.services import web_service
+
+    provider = web_service._search_provider
+
+    def calls_during(fn):
+        before = provider.calls
+        result, elapsed = _timed(fn)
+        return result, provider.calls - before, elapsed
+
+    _, calls, elapsed = calls_during(
+        lambda: [web_service.web_search({"query": f"{q} sequential"}) for q in QUERIES]
+    )
+    print(f"sequential  {len(QUERIES)} queries: {calls} backend calls, {elapsed:.2f}s")
+
+    result, calls, elapsed = calls_during(
+        lambda: web_service.web_search({"query": QUERIES[0], "queries": QUERIES[1:]})
+    )
+    print(f"batched     {len(result['searches'])} queries: {calls} backend calls, {elapsed:.2f}s")
+
+    variants = ["Python  asyncio timeout", "PYTHON ASYNCIO TIMEOUT", "ｐｙｔｈｏｎ asyncio timeout ", "python\tasyncio timeout"]
+    _, calls, elapsed = calls_during(lambda: [web_service.web_search({"query": v}) for v in variants])
+    print(f"near-dupes  {len(variants)} queries: {calls} backend calls, {elapsed:.2f}s")
+
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        _, calls, elapsed = calls_during(
+            lambda: list(pool.map(lambda _: web_service.web_search({"query": "brand new query"}), range(args.threads)))
+        )
+    print(f"concurrent  {args.threads} threads, same query: {calls} backend calls, {elapsed:.2f}s")
+
+    print(f"cache: {web_service._search_cache.snapshot()}")
+
+
+if __name__ == "__main__":
+    main()